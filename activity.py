@@ -0,0 +1,81 @@
+from datetime import date, datetime, timedelta
+
+from user_record import to_micros
+
+MICROS_PER_DAY = 86_400 * 1_000_000
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def today_number(today=None):
+    """Days since 1970-01-01 (local time), the unit ActivityBuckets counts in."""
+    return (today or date.today()).toordinal() - _EPOCH_ORDINAL
+
+
+def cutoff_micros(days, now=None):
+    """Start of the window "the last `days` days, today included", as a UserRecord timestamp."""
+    start = datetime.combine((now or datetime.now()).date() - timedelta(days=days - 1), datetime.min.time())
+    return to_micros(str(start))
+
+
+def same_window(old, new, granularity):
+    """Whether two UserRecord timestamps fall in the same `granularity`-second window (and day)."""
+    if not isinstance(old, int) or granularity <= 0:
+        return False
+    step = granularity * 1_000_000
+    return old // step == new // step and old // MICROS_PER_DAY == new // MICROS_PER_DAY
+
+
+class ActivityBuckets:
+    """Users counted by the day they were last active.
+
+    Every user sits in exactly one bucket, the day of their last_active,
+    and moves to today's when touched. The users active within the last
+    N days are then the sum of N buckets, so DAU/WAU/MAU cost a few dozen
+    lookups instead of a scan over every user. Kept in memory and rebuilt
+    from last_active on load; counts are exact because last_active is.
+    """
+
+    def __init__(self):
+        self.days = {}
+
+    @classmethod
+    def build(cls, timestamps):
+        buckets = cls()
+        for active in timestamps:
+            buckets.move(None, active)
+        return buckets
+
+    def move(self, old, new):
+        """A user's last_active changed from `old` to `new` (None: new user)."""
+        if isinstance(old, int):
+            day = old // MICROS_PER_DAY
+            left = self.days.get(day, 0) - 1
+            if left > 0:
+                self.days[day] = left
+            else:
+                self.days.pop(day, None)
+        if isinstance(new, int):
+            day = new // MICROS_PER_DAY
+            self.days[day] = self.days.get(day, 0) + 1
+
+    def active_within(self, days, today=None):
+        """Users last active in the `days` days up to and including today."""
+        end = today_number(today)
+        return sum(self.days.get(day, 0) for day in range(end - days + 1, end + 1))
+
+    def summary(self, today=None):
+        return {
+            'dau': self.active_within(1, today),
+            'wau': self.active_within(7, today),
+            'mau': self.active_within(30, today),
+        }
+
+
+def merge_summaries(summaries):
+    """Add up summary() dicts, e.g. one per shard."""
+    total = {'dau': 0, 'wau': 0, 'mau': 0}
+    for summary in summaries:
+        for key in total:
+            total[key] += summary[key]
+    return total
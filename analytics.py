@@ -0,0 +1,185 @@
+import json
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+# Scalar counters kept per day; 'messages' and 'failed' are {type: count}
+COUNTERS = ('signups', 'referred_signups', 'active_users')
+
+
+@lru_cache(maxsize=4096)
+def epoch_day(at):
+    """'YYYY-MM-DD' (local time) for an epoch timestamp."""
+    return datetime.fromtimestamp(at).date().isoformat()
+
+
+def timestamp_day(timestamp):
+    """'YYYY-MM-DD' for a stored `str(datetime)` timestamp, or None."""
+    return timestamp[:10] if timestamp else None
+
+
+class DailyRollups:
+    """Per-day funnel counters, maintained as events are applied.
+
+    `days` maps 'YYYY-MM-DD' to {'signups': n, 'referred_signups': n,
+    'active_users': n, 'messages': {type: n}, 'failed': {type: n}} and is
+    the dict stored in the database, so it is persisted (and replayed)
+    along with everything else. Reading N days costs N lookups, whatever
+    the number of users.
+    """
+
+    def __init__(self, days=None):
+        self.days = days if days is not None else {}
+
+    def add(self, day, metric, n=1, key=None):
+        stats = self.days.get(day)
+        if stats is None:
+            stats = self.days[day] = {}
+        if key is None:
+            stats[metric] = stats.get(metric, 0) + n
+        else:
+            counts = stats.get(metric)
+            if counts is None:
+                counts = stats[metric] = {}
+            counts[key] = counts.get(key, 0) + n
+
+    def clear(self):
+        self.days.clear()
+
+    def last(self, days, today=None):
+        """[(day, stats)] for the `days` days up to `today`, oldest first."""
+        today = today or date.today()
+        result = []
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).isoformat()
+            result.append((day, copy_stats(self.days.get(day, {}))))
+        return result
+
+
+def copy_stats(stats):
+    result = {metric: stats.get(metric, 0) for metric in COUNTERS}
+    result['messages'] = dict(stats.get('messages', {}))
+    result['failed'] = dict(stats.get('failed', {}))
+    return result
+
+
+def merge_stats(row_sets):
+    """Sum several [(day, stats)] results (e.g. one per shard) day by day."""
+    merged = {}
+    for rows in row_sets:
+        for day, stats in rows:
+            total = merged.get(day)
+            if total is None:
+                total = merged[day] = copy_stats({})
+            for metric in COUNTERS:
+                total[metric] += stats.get(metric, 0)
+            for kind in ('messages', 'failed'):
+                counts = total[kind]
+                for key, n in stats.get(kind, {}).items():
+                    counts[key] = counts.get(key, 0) + n
+    return sorted(merged.items())
+
+
+def backfill(rollups, users, messages=None, jobs_dir=None, joined_at=None):
+    """Rebuild `rollups` in one pass over (chat_id, user) pairs.
+
+    Stored users only remember the day they joined and the day they were
+    last seen, so historical active-user counts are a lower bound. Message
+    counts come from legacy `messages_sent` lists plus either `messages`
+    ((day, type) pairs, e.g. the full message log) or, without it, each
+    user's recent history. Broadcast failures are taken from the job files
+    in `jobs_dir`.
+
+    A signup counts as referred only if it credited the referrer, i.e. the
+    referrer is a user who had already joined (ReferralGraph.build's rule),
+    so referrals are settled after the pass, once every join time is known.
+    When `users` is one shard of a store, pass `joined_at` (chat_id ->
+    joined_at for every user) so referrers on other shards are found.
+    """
+    rollups.clear()
+    join_times = {} if joined_at is None else joined_at
+    referrals = []
+    for chat_id, user in users:
+        if joined_at is None:
+            join_times[chat_id] = user.get('joined_at') or ''
+        joined = timestamp_day(user.get('joined_at'))
+        if joined:
+            rollups.add(joined, 'signups')
+            referred_by = user.get('referred_by')
+            if referred_by and referred_by != chat_id:
+                referrals.append((joined, referred_by, user.get('joined_at')))
+            rollups.add(joined, 'active_users')
+        last_active = timestamp_day(user.get('last_active'))
+        if last_active and last_active != joined:
+            rollups.add(last_active, 'active_users')
+        if messages is None:
+            for message_type, at in user.get('recent_messages', ()):
+                rollups.add(epoch_day(at), 'messages', key=message_type)
+        # Legacy full history, not folded into the message log yet
+        for message in user.get('messages_sent', ()):
+            day = timestamp_day(message.get('timestamp'))
+            if day:
+                rollups.add(day, 'messages', key=message.get('type'))
+
+    for day, message_type in messages or ():
+        rollups.add(day, 'messages', key=message_type)
+
+    for day, referred_by, user_joined in referrals:
+        referrer_joined = join_times.get(referred_by)
+        if referrer_joined is not None and referrer_joined <= user_joined:
+            rollups.add(day, 'referred_signups')
+
+    if jobs_dir and Path(jobs_dir).is_dir():
+        for path in Path(jobs_dir).glob('*.json'):
+            try:
+                with open(path, 'r') as f:
+                    job = json.load(f)
+            except json.JSONDecodeError:
+                continue
+            day = timestamp_day(job.get('created_at'))
+            if day and job.get('failed'):
+                rollups.add(day, 'failed', job['failed'], key=job.get('message_type') or 'campaign')
+    return rollups
+
+
+def iter_message_log(path):
+    """(day, type) for every record in a MESSAGE_LOG_PATH file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # torn last record
+            record = json.loads(line)
+            yield epoch_day(record['at']), record['type']
+
+
+def format_dashboard(rows, user_count, activity=None):
+    """Admin summary for [(day, stats)] rows from get_daily_stats().
+
+    `activity` is an activity_summary() dict ({'dau', 'wau', 'mau'}).
+    """
+    totals = {metric: sum(stats[metric] for _, stats in rows) for metric in COUNTERS}
+    campaign_sent = sum(stats['messages'].get('campaign', 0) for _, stats in rows)
+    campaign_failed = sum(stats['failed'].get('campaign', 0) for _, stats in rows)
+    attempted = campaign_sent + campaign_failed
+    delivery_rate = f"{100 * campaign_sent / attempted:.1f}%" if attempted else 'n/a'
+
+    lines = [
+        f"📈 **DASHBOARD — last {len(rows)} days**\n",
+        f"👥 Total users: {user_count}",
+    ]
+    if activity:
+        lines.append(f"🔥 Active: {activity['dau']} today, {activity['wau']} this week, "
+                     f"{activity['mau']} this month")
+    lines += [
+        f"🆕 Signups: {totals['signups']} ({totals['referred_signups']} referred)",
+        f"📣 Campaign: {campaign_sent} delivered, {campaign_failed} failed ({delivery_rate})",
+        "",
+        "`day        new  ref  active  msgs  fail`",
+    ]
+    for day, stats in reversed(rows):
+        lines.append(
+            f"`{day} {stats['signups']:>4} {stats['referred_signups']:>4} "
+            f"{stats['active_users']:>7} {sum(stats['messages'].values()):>5} "
+            f"{sum(stats['failed'].values()):>5}`"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,77 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDatabase:
+    """asyncio-facing wrapper around a storage backend.
+
+    Mutations are queued to a single dedicated writer thread, so a slow
+    save, journal append or SQLite commit never runs on the event loop and
+    writes still happen in the order they were issued. Reads (get_user,
+    user_count, ...) are served straight from the backend's in-memory
+    state and stay synchronous; handlers go through read(), which moves
+    them to a thread while a background load may still make them wait.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._loaded = False
+
+    def __getattr__(self, name):
+        # Anything not wrapped below is a read; pass it through
+        return getattr(self.db, name)
+
+    @property
+    def loaded(self):
+        """Whether the backend has finished loading (backends without a background load always have)."""
+        if not self._loaded:
+            wait_until_loaded = getattr(self.db, 'wait_until_loaded', None)
+            self._loaded = wait_until_loaded is None or wait_until_loaded(0)
+        return self._loaded
+
+    async def read(self, method, *args, **kwargs):
+        """Call a backend read, e.g. `await store.read(db.get_user, chat_id)`.
+
+        Until the load finishes, reads like user_count or a get_user miss
+        wait for it, so they run in a thread instead of on the event loop.
+        """
+        if self.loaded:
+            return method(*args, **kwargs)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def _write(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(method, *args, **kwargs)
+        )
+
+    async def add_user(self, chat_id, first_name, username, referred_by=None):
+        return await self._write(self.db.add_user, chat_id, first_name, username, referred_by)
+
+    async def register_user(self, chat_id, first_name, username, referred_by=None):
+        return await self._write(self.db.register_user, chat_id, first_name, username, referred_by)
+
+    async def update_last_active(self, chat_id):
+        await self._write(self.db.update_last_active, chat_id)
+
+    async def update_profile(self, chat_id, first_name, username):
+        return await self._write(self.db.update_profile, chat_id, first_name, username)
+
+    async def log_message_sent(self, chat_id, message_type):
+        await self._write(self.db.log_message_sent, chat_id, message_type)
+
+    async def log_messages_sent(self, chat_ids, message_type):
+        await self._write(self.db.log_messages_sent, chat_ids, message_type)
+
+    async def log_delivery_failures(self, chat_ids, message_type):
+        await self._write(self.db.log_delivery_failures, chat_ids, message_type)
+
+    async def flush(self):
+        await self._write(self.db.flush)
+
+    def close(self):
+        """Drain queued writes, then close the backend."""
+        self._writer.shutdown(wait=True)
+        self.db.close()
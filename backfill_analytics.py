@@ -0,0 +1,58 @@
+"""Rebuild the daily analytics rollups from an existing users_database.json.
+
+Usage:
+    python backfill_analytics.py [source.json] [--message-log PATH]
+                                 [--jobs-dir DIR] [--into target.db]
+
+The source is read in a single streaming pass, one user record at a time.
+Without --into the per-day rollups are printed; with it they replace the
+rollups stored in that SQLite database. (The JSON store backfills itself
+on startup when its file has no rollups yet.)
+"""
+import argparse
+from pathlib import Path
+
+from analytics import COUNTERS, DailyRollups, backfill, iter_message_log
+from config import BROADCAST_JOBS_DIR, MESSAGE_LOG_PATH
+from json_stream import iter_snapshot_users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('source', nargs='?', default='users_database.json')
+    parser.add_argument('--message-log', default=MESSAGE_LOG_PATH,
+                        help='full message history (MESSAGE_LOG_PATH) to count messages from')
+    parser.add_argument('--jobs-dir', default=str(BROADCAST_JOBS_DIR),
+                        help='broadcast jobs directory to count failures from')
+    parser.add_argument('--into', help='SQLite database to store the rollups in')
+    args = parser.parse_args()
+
+    source = Path(args.source)
+    if not source.exists():
+        print(f"❌ {source} not found")
+        return
+
+    messages = None
+    if args.message_log and Path(args.message_log).exists():
+        messages = iter_message_log(args.message_log)
+    rollups = backfill(DailyRollups(), iter_snapshot_users(source), messages, args.jobs_dir)
+
+    if args.into:
+        from sqlite_database import SQLiteDatabase
+        db = SQLiteDatabase(args.into)
+        db.store_analytics(rollups)
+        db.close()
+        print(f"✅ Stored {len(rollups.days)} days of rollups in {args.into}")
+        return
+
+    print(f"{'day':<10} " + ' '.join(f"{metric:>16}" for metric in COUNTERS) + f" {'messages':>9} {'failed':>7}")
+    for day in sorted(rollups.days):
+        stats = rollups.days[day]
+        print(
+            f"{day:<10} " + ' '.join(f"{stats.get(metric, 0):>16}" for metric in COUNTERS)
+            + f" {sum(stats.get('messages', {}).values()):>9} {sum(stats.get('failed', {}).values()):>7}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""get_active_users(N) via the recency index vs sorting every user.
+
+    python benchmarks/bench_active_users.py --sizes 1m --limit 50
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes, timed
+
+from database import Database
+from user_record import UserRecord
+
+
+def full_sort(db, limit):
+    users = [u for u in db.data['users'].values() if u.get('status', 'active') == 'active']
+    users.sort(key=lambda u: u['last_active'], reverse=True)
+    return users[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100k,1m')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--touches', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'index build':>12} {'indexed':>10} {'full sort':>10} {'touch':>10}")
+    for size in parse_sizes(args.sizes):
+        tmp = tempfile.TemporaryDirectory()
+        # Persistence is not what is measured here; keep the flusher idle
+        db = Database(Path(tmp.name) / 'users_database.json',
+                      flush_interval=3600, flush_every=float('inf'))
+        db.data = synthetic_data(size)
+        db.data['users'] = {c: UserRecord.from_dict(u) for c, u in db.data['users'].items()}
+        _, build = timed(db._rebuild_recency_index)
+
+        # Touch random users so the index carries stale entries like it would live
+        chat_ids = list(db.data['users'])
+        rng = random.Random(1)
+        started = time.perf_counter()
+        for _ in range(args.touches):
+            db.update_last_active(rng.choice(chat_ids))
+        touch = (time.perf_counter() - started) / args.touches
+
+        expected = full_sort(db, args.limit)
+        indexed = db.get_active_users(args.limit)
+        assert [u['chat_id'] for u in indexed] == [u['chat_id'] for u in expected]
+
+        _, indexed_elapsed = timed(lambda: [db.get_active_users(args.limit) for _ in range(args.repeat)])
+        _, sort_elapsed = timed(lambda: [full_sort(db, args.limit) for _ in range(args.repeat)])
+        db._dirty = 0
+        db.close()
+        tmp.cleanup()
+        print(f"{size:>10} {build:>11.3f}s {indexed_elapsed / args.repeat * 1e3:>8.3f}ms "
+              f"{sort_elapsed / args.repeat * 1e3:>8.1f}ms {touch * 1e6:>8.2f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""last_active tracking under a tap storm, with and without debouncing.
+
+Replays `--taps` update_last_active calls over a hot set of `--hot`
+users (a few users tapping buttons over and over, as in a storm) against
+Database and JournalDatabase, once writing every touch through
+(granularity 0) and once with ACTIVITY_GRANULARITY_SECONDS. Reports the
+cost per touch, the writes it caused (dirty marks for the snapshot
+store, journal bytes for the journal), and then DAU/WAU/MAU and a
+"/broadcast N days" selection from the day buckets versus a scan over
+every user.
+
+    python benchmarks/bench_activity.py --users 100k --taps 200000 --hot 2000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes, timed
+
+from activity import cutoff_micros
+from config import ACTIVITY_GRANULARITY_SECONDS
+from database import Database, JournalDatabase
+
+
+def tap_storm(db, chat_ids, taps, hot, seed):
+    rng = random.Random(seed)
+    hot_ids = rng.sample(chat_ids, min(hot, len(chat_ids)))
+    storm = [rng.choice(hot_ids) for _ in range(taps)]
+    started = time.perf_counter()
+    for chat_id in storm:
+        db.update_last_active(chat_id)
+    return (time.perf_counter() - started) / taps
+
+
+def run(cls, path, args, granularity):
+    options = {'message_log': None, 'background_load': False, 'activity_granularity': granularity}
+    if cls is JournalDatabase:
+        options['compact_bytes'] = 1 << 40
+    else:
+        options.update(flush_interval=3600, flush_every=float('inf'))
+    db = cls(path, **options)
+    chat_ids = list(db.data['users'])
+    per_touch = tap_storm(db, chat_ids, args.taps, args.hot, args.seed)
+    if cls is JournalDatabase:
+        writes = os.path.getsize(db.journal_file)
+    else:
+        writes = db._dirty
+    return db, per_touch, writes
+
+
+def scan_summary(db):
+    users = db.data['users'].values()
+    cutoffs = {key: cutoff_micros(days) for key, days in (('dau', 1), ('wau', 7), ('mau', 30))}
+    return {key: sum(1 for user in users if user.active >= cutoff) for key, cutoff in cutoffs.items()}
+
+
+def scan_active_within(db, limit, days):
+    cutoff = cutoff_micros(days)
+    users = [user for user in db.data['users'].values() if user.status == 'active' and user.active >= cutoff]
+    users.sort(key=lambda user: user.active, reverse=True)
+    return users[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='100k')
+    parser.add_argument('--taps', type=int, default=200_000)
+    parser.add_argument('--hot', type=int, default=2000, help='distinct users tapping')
+    parser.add_argument('--granularity', type=int, default=ACTIVITY_GRANULARITY_SECONDS or 300)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    size = parse_sizes(args.users)[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = json.dumps(synthetic_data(size))
+        print(f"{'store':>10} {'granularity':>12} {'us/touch':>10} {'writes':>14}")
+        db = None
+        for cls, unit in ((Database, 'dirty marks'), (JournalDatabase, 'journal bytes')):
+            for granularity in (0, args.granularity):
+                path = Path(tmp) / f'{cls.__name__}-{granularity}.json'
+                path.write_text(source)
+                db, per_touch, writes = run(cls, path, args, granularity)
+                print(f"{cls.__name__:>10} {granularity:>11}s {per_touch * 1e6:>10.2f} {writes:>8} {unit}")
+                db.close()
+
+        # Queries on the last store, after the storm
+        summary, bucket_time = timed(db.activity_summary)
+        scanned, scan_time = timed(scan_summary, db)
+        assert summary == scanned, (summary, scanned)
+        # The first walk after a storm drops the stale heap entries it left behind
+        _, first_select_time = timed(db.get_active_users, limit=args.hot, within_days=7)
+        selected, select_time = timed(db.get_active_users, limit=args.hot, within_days=7)
+        expected, select_scan_time = timed(scan_active_within, db, args.hot, 7)
+        assert len(selected) == len(expected)
+
+    print(f"\nDAU/WAU/MAU {summary['dau']}/{summary['wau']}/{summary['mau']}: "
+          f"buckets {bucket_time * 1e6:.0f}us, full scan {scan_time * 1e3:.1f}ms")
+    print(f"{len(selected)} users active within 7 days: "
+          f"recency heap {select_time * 1e3:.2f}ms ({first_select_time * 1e3:.1f}ms right after the storm), "
+          f"full scan {select_scan_time * 1e3:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
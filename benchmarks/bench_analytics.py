@@ -0,0 +1,56 @@
+"""Analytics rollups: /dashboard read vs a full scan, and backfill cost.
+
+    python benchmarks/bench_analytics.py --sizes 100k,1m
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes, timed
+
+from analytics import DailyRollups, backfill
+from database import Database
+from json_stream import iter_snapshot_users
+
+
+def scan_signups(users, days):
+    """What /dashboard would cost without rollups: one pass over every user."""
+    counts = {}
+    for user in users.values():
+        day = user['joined_at'][:10]
+        if day in days:
+            counts[day] = counts.get(day, 0) + 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100k,1m')
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'dashboard':>10} {'full scan':>10} {'backfill mem':>13} {'backfill stream':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in parse_sizes(args.sizes):
+            path = Path(tmp) / f'{size}.json'
+            data = synthetic_data(size)
+            with open(path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            del data
+
+            db = Database(path, write_behind=False)
+            _, dashboard = timed(db.get_daily_stats, args.days)
+            days = {day for day, _ in db.get_daily_stats(args.days)}
+            _, scan = timed(scan_signups, db.data['users'], days)
+            _, in_memory = timed(db.rebuild_analytics, None)
+            streamed, stream = timed(backfill, DailyRollups(), iter_snapshot_users(path))
+            assert streamed.days == db.data['daily_stats']
+            db.close()
+
+            print(f"{size:>10} {dashboard * 1e3:>8.2f}ms {scan * 1e3:>8.1f}ms "
+                  f"{in_memory:>12.2f}s {stream:>15.2f}s")
+
+
+if __name__ == '__main__':
+    main()
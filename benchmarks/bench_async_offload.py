@@ -0,0 +1,87 @@
+"""Handler latency under concurrent updates, with and without AsyncDatabase.
+
+Simulates a stream of updates: most handlers only read (get_user), some
+write (update_last_active / log_message_sent). Each handler also awaits a
+fake network reply. Without the offload, writes run on the event loop
+and every save stalls all in-flight handlers.
+
+    python benchmarks/bench_async_offload.py --users 100k --updates 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes
+
+from async_database import AsyncDatabase
+from database import Database
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def simulate(db, store, chat_ids, args):
+    rng = random.Random(3)
+    latencies = {'read': [], 'write': []}
+
+    async def handler(chat_id, writes):
+        started = time.perf_counter()
+        db.get_user(chat_id)
+        await asyncio.sleep(args.reply_latency)  # reply_text round trip
+        if writes:
+            if store:
+                await store.update_last_active(chat_id)
+            else:
+                db.update_last_active(chat_id)
+        latencies['write' if writes else 'read'].append(time.perf_counter() - started)
+
+    tasks = []
+    for _ in range(args.updates):
+        tasks.append(asyncio.create_task(
+            handler(rng.choice(chat_ids), rng.random() < args.write_ratio)
+        ))
+        await asyncio.sleep(1 / args.update_rate)
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', default='100k')
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--update-rate', type=float, default=500, help='updates per second')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--reply-latency', type=float, default=0.02)
+    parser.add_argument('--write-behind', action='store_true',
+                        help='use write-behind saves instead of save-per-mutation')
+    args = parser.parse_args()
+    size = parse_sizes(args.users)[0]
+
+    print(f"{'mode':>10} {'kind':>6} {'p50':>9} {'p99':>9} {'max':>9}")
+    for offload in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'users_database.json'
+            path.write_text(json.dumps(synthetic_data(size)))
+            db = Database(path, write_behind=args.write_behind, flush_every=200)
+            store = AsyncDatabase(db) if offload else None
+            latencies = asyncio.run(simulate(db, store, list(db.data['users']), args))
+            if store:
+                store.close()
+            else:
+                db.close()
+
+        mode = 'offload' if offload else 'inline'
+        for kind, values in latencies.items():
+            if values:
+                print(f"{mode:>10} {kind:>6} {percentile(values, 50) * 1e3:>7.1f}ms "
+                      f"{percentile(values, 99) * 1e3:>7.1f}ms {max(values) * 1e3:>7.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
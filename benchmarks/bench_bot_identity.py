@@ -0,0 +1,86 @@
+"""Per-handler latency with the cached bot identity vs a getMe per update.
+
+The fake bot's get_me sleeps for --delay seconds to stand in for the
+network round trip. "uncached" clears the cache before every update,
+which is what the handlers used to cost.
+
+    python benchmarks/bench_bot_identity.py --delay 0.05 --calls 50
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+import common  # noqa: F401  (sets up sys.path and env)
+
+import bot
+
+
+class FakeBot:
+    def __init__(self, delay):
+        self.delay = delay
+        self.get_me_calls = 0
+
+    async def get_me(self):
+        self.get_me_calls += 1
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(username='bench_bot')
+
+    async def send_message(self, *args, **kwargs):
+        pass
+
+
+class FakeMessage:
+    async def reply_text(self, *args, **kwargs):
+        pass
+
+
+class FakeQuery:
+    data = 'get_link'
+    inline_message_id = None
+    message = None  # no message to remember, so every edit is sent
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+def make_update(chat_id):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(first_name='Bench', username='bench'),
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=FakeMessage(),
+        callback_query=FakeQuery()
+    )
+
+
+async def measure(handler, fake_bot, calls, cached):
+    context = SimpleNamespace(bot=fake_bot, args=[])
+    total = 0.0
+    for i in range(calls):
+        if not cached:
+            bot.bot_identity.username = None
+        started = time.perf_counter()
+        await handler(make_update(2_000_000_000 + i), context)
+        total += time.perf_counter() - started
+    return total / calls
+
+
+async def main(args):
+    fake_bot = FakeBot(args.delay)
+    await bot.bot_identity.refresh(fake_bot)
+    print(f"{'handler':>16} {'uncached':>10} {'cached':>10}")
+    for name in ('start', 'referral', 'button_callback'):
+        handler = getattr(bot, name)
+        uncached = await measure(handler, fake_bot, args.calls, cached=False)
+        cached = await measure(handler, fake_bot, args.calls, cached=True)
+        print(f"{name:>16} {uncached * 1e3:>8.2f}ms {cached * 1e3:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--delay', type=float, default=0.05, help='simulated getMe round trip (s)')
+    parser.add_argument('--calls', type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+"""Broadcast throughput against a fake Bot that records send times.
+
+    python benchmarks/bench_broadcast.py --users 2000 --rate 25 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data
+
+from telegram.error import RetryAfter
+
+from async_database import AsyncDatabase
+from broadcaster import Broadcaster
+from database import Database
+
+
+class FakeBot:
+    """Stands in for telegram.Bot: fixed latency, occasional 429s."""
+
+    def __init__(self, latency, flood_rate, retry_after, seed=7):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.sent_at = []
+        self.floods = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        if self.rng.random() < self.flood_rate:
+            self.floods += 1
+            raise RetryAfter(self.retry_after)
+        self.sent_at.append(time.perf_counter())
+
+
+async def run(args, db, chat_ids):
+    bot = FakeBot(args.latency, args.flood_rate, args.retry_after)
+    broadcaster = Broadcaster(bot, AsyncDatabase(db), rate=args.rate, workers=args.workers,
+                              batch_size=args.batch_size)
+    started = time.perf_counter()
+    result = await broadcaster.run(chat_ids, 'benchmark campaign')
+    elapsed = time.perf_counter() - started
+
+    # Steady-state rate, leaving out the bucket's initial burst
+    burst = int(args.rate)
+    times = bot.sent_at
+    steady = (len(times) - burst - 1) / (times[-1] - times[burst]) if len(times) > burst + 1 else 0.0
+    return result, elapsed, bot.floods, steady
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=25)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per API call')
+    parser.add_argument('--flood-rate', type=float, default=0.002, help='fraction of sends that get a 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'users_database.json', write_behind=False)
+        db.data = synthetic_data(args.users)
+        chat_ids = list(db.data['users'])
+
+        saves = 0
+        original_save = db.save
+
+        def counting_save():
+            nonlocal saves
+            saves += 1
+            original_save()
+        db.save = counting_save
+
+        result, elapsed, floods, steady = asyncio.run(run(args, db, chat_ids))
+
+    print(f"recipients:      {len(chat_ids)}")
+    print(f"sent/failed:     {result.sent}/{result.failed} ({result.retried} retried, {floods} 429s)")
+    print(f"elapsed:         {elapsed:.2f}s")
+    print(f"throughput:      {result.sent / elapsed:.1f} msg/s (configured {args.rate:g})")
+    print(f"steady state:    {steady:.1f} msg/s")
+    print(f"database saves:  {saves}")
+
+
+if __name__ == '__main__':
+    main()
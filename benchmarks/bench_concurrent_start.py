@@ -0,0 +1,124 @@
+"""Stress /start with thousands of concurrent updates through the dispatcher.
+
+Many new users join via a handful of referrers, and every user also
+double-taps /start; a share of the updates is also delivered twice with
+the same update_id, as a retrying webhook would. Checks that each
+referrer is credited exactly once per distinct referred user, that each
+user's welcome is logged once, that redelivered updates are dropped, and
+that each chat's updates were handled in arrival order.
+
+    python benchmarks/bench_concurrent_start.py --users 5000 --referrers 20
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+import common  # noqa: F401  (sets up sys.path and env)
+
+import bot
+from dispatcher import ChatOrderedUpdateProcessor
+from idempotency import TTLCache
+from telegram import Update
+
+
+class FakeBot:
+    async def get_me(self):
+        return SimpleNamespace(username='bench_bot')
+
+    async def send_message(self, *args, **kwargs):
+        await asyncio.sleep(random.random() * 0.002)
+
+
+class FakeMessage:
+    async def reply_text(self, *args, **kwargs):
+        await asyncio.sleep(random.random() * 0.002)
+
+
+def make_update(update_id, chat_id):
+    # The dispatcher keys on Update.effective_chat, so build a real Update
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': '/start',
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}'},
+        }
+    }, None)
+
+
+async def main(args):
+    rng = random.Random(11)
+    fake_bot = FakeBot()
+    await bot.bot_identity.refresh(fake_bot)
+    processor = ChatOrderedUpdateProcessor(args.workers, seen=TTLCache(1_000_000, 3600))
+    bot.notifications.start(fake_bot)
+
+    referrers = [str(900_000_000 + i) for i in range(args.referrers)]
+    for chat_id in referrers:
+        bot.db.add_user(chat_id, 'Referrer', None)
+
+    expected = {chat_id: 0 for chat_id in referrers}
+    arrival, handled = {}, {}
+    updates = []
+    for i in range(args.users):
+        chat_id = 1_000_000_000 + i
+        referrer = rng.choice(referrers)
+        expected[referrer] += 1
+        for _ in range(args.taps):
+            updates.append((make_update(len(updates) + 1, chat_id), referrer))
+    redelivered = rng.sample(updates, int(len(updates) * args.redeliver))
+    updates.extend(redelivered)
+    rng.shuffle(updates)
+    # gather() starts one task per update in list order, i.e. arrival order;
+    # a redelivered update is expected to run at its first arrival only
+    seen = set()
+    for update, _ in updates:
+        if update.update_id not in seen:
+            seen.add(update.update_id)
+            arrival.setdefault(update.effective_chat.id, []).append(update.update_id)
+
+    async def handle(update, referrer):
+        context = SimpleNamespace(bot=fake_bot, args=[referrer])
+        handled.setdefault(update.effective_chat.id, []).append(update.update_id)
+        await bot.start(SimpleNamespace(
+            effective_user=update.effective_user,
+            effective_chat=update.effective_chat,
+            message=FakeMessage()
+        ), context)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        processor.process_update(update, handle(update, referrer)) for update, referrer in updates
+    ))
+    elapsed = time.perf_counter() - started
+    await bot.notifications.stop()
+
+    wrong = {r: (bot.db.get_user(r)['referrals'], n) for r, n in expected.items()
+             if bot.db.get_user(r)['referrals'] != n}
+    out_of_order = sum(1 for chat_id, ids in arrival.items() if handled.get(chat_id) != ids)
+    welcomes = sum(bot.db.get_user(1_000_000_000 + i)['message_counts'].get('welcome', 0)
+                   for i in range(args.users))
+    print(f"updates:        {len(updates)} ({args.users} users x {args.taps} taps "
+          f"+ {len(redelivered)} redelivered, {args.workers} workers)")
+    print(f"elapsed:        {elapsed:.2f}s ({len(updates) / elapsed:.0f} updates/s)")
+    print(f"user count:     {bot.db.user_count()} (expected {args.users + args.referrers})")
+    print(f"referral count: {'OK' if not wrong else f'MISMATCH {wrong}'}")
+    print(f"per-chat order: {'OK' if not out_of_order else f'{out_of_order} chats out of order'}")
+    print(f"notifications:  {bot.notifications.sent} sent (expected {args.users})")
+    print(f"welcome logs:   {welcomes} (expected {args.users})")
+    print(f"duplicates:     {processor.seen.duplicates} updates, "
+          f"{bot.recent_starts.duplicates} /start taps dropped")
+    bot.store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--referrers', type=int, default=20)
+    parser.add_argument('--taps', type=int, default=2, help='/start updates per user')
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--redeliver', type=float, default=0.1,
+                        help='share of updates delivered a second time')
+    asyncio.run(main(parser.parse_args()))
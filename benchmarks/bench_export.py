@@ -0,0 +1,74 @@
+"""Peak memory and time of the /export CSV build: in-memory vs streamed.
+
+    python benchmarks/bench_export.py --sizes 100k,1m
+"""
+import argparse
+import csv
+import io
+import time
+import tracemalloc
+
+from common import synthetic_users, parse_sizes
+
+from exporter import export_users
+
+
+def legacy_export(users):
+    """What /export used to do: StringIO, then a second full copy as bytes."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([
+        'chat_id', 'first_name', 'username', 'joined_date',
+        'referred_by', 'referrals', 'last_active', 'status'
+    ])
+    for chat_id, user in users.items():
+        writer.writerow([
+            chat_id,
+            user.get('first_name', ''),
+            user.get('username', ''),
+            user.get('joined_at', ''),
+            user.get('referred_by', ''),
+            user.get('referrals', 0),
+            user.get('last_active', ''),
+            user.get('status', '')
+        ])
+    return output.getvalue().encode('utf-8')
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100k,1m')
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'mode':>12} {'peak MB':>9} {'time':>8} {'output MB':>10}")
+    for size in parse_sizes(args.sizes):
+        users = synthetic_users(size)
+        runs = {
+            'in-memory': lambda: legacy_export(users),
+            'streamed': lambda: export_users(iter(users.items())),
+            'streamed+gz': lambda: export_users(iter(users.items()), compress=True),
+        }
+        for mode, fn in runs.items():
+            result, elapsed, peak = measure(fn)
+            if isinstance(result, bytes):
+                out_size = len(result)
+            else:
+                spool, _ = result
+                spool.seek(0, 2)
+                out_size = spool.tell()
+                spool.close()
+            print(f"{size:>10} {mode:>12} {peak / 2**20:>9.1f} {elapsed:>7.2f}s {out_size / 2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
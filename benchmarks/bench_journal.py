@@ -0,0 +1,55 @@
+"""Per-event write cost of JournalDatabase as the user count grows.
+
+    python benchmarks/bench_journal.py --sizes 10k,100k,1m
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes
+
+from database import JournalDatabase
+
+
+def run(size, events, fsync):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'users_database.json'
+        path.write_text(json.dumps(synthetic_data(size)))
+        db = JournalDatabase(path, compact_bytes=1 << 40, fsync=fsync)
+        chat_ids = list(db.data['users'])
+
+        started = time.perf_counter()
+        for i in range(events):
+            chat_id = chat_ids[i % len(chat_ids)]
+            if i % 3 == 0:
+                db.update_last_active(chat_id)
+            elif i % 3 == 1:
+                db.log_message_sent(chat_id, 'campaign')
+            else:
+                db.add_user(f'new{i}', 'Bench', None, referred_by=chat_id)
+        elapsed = time.perf_counter() - started
+        db.close()
+
+        reload_started = time.perf_counter()
+        JournalDatabase(path).close()
+        reload_elapsed = time.perf_counter() - reload_started
+        return elapsed / events * 1e6, reload_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10k,100k,1m')
+    parser.add_argument('--events', type=int, default=50_000)
+    parser.add_argument('--fsync', action='store_true', help='fsync every event')
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'us/event':>10} {'reload':>10}")
+    for size in parse_sizes(args.sizes):
+        per_event, reload_elapsed = run(size, args.events, args.fsync)
+        print(f"{size:>10} {per_event:>10.2f} {reload_elapsed:>9.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Bytes per user for legacy messages_sent lists vs compact history.
+
+    python benchmarks/bench_message_history.py --users 100k --messages 30
+"""
+import argparse
+import gc
+import json
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes
+
+from database import Database
+
+MESSAGE_TYPES = ('welcome', 'referral_link', 'campaign')
+
+
+def legacy_data(users, messages):
+    data = synthetic_data(users)
+    start = datetime(2026, 1, 1)
+    for i, user in enumerate(data['users'].values()):
+        del user['message_counts'], user['recent_messages']
+        user['messages_sent'] = [
+            {'type': MESSAGE_TYPES[(i + j) % 3], 'timestamp': str(start + timedelta(minutes=i + j))}
+            for j in range(messages)
+        ]
+    return data
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    data = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return data, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', default='100k')
+    parser.add_argument('--messages', type=int, default=30)
+    args = parser.parse_args()
+    users = parse_sizes(args.users)[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'users_database.json', write_behind=False)
+
+        legacy, legacy_bytes = measure(lambda: legacy_data(users, args.messages))
+        legacy_json = len(json.dumps(legacy, separators=(',', ':')))
+        del legacy
+
+        def build_compact():
+            db.data = legacy_data(users, args.messages)
+            db._compact_message_history()
+            return db.data
+
+        compact, compact_bytes = measure(build_compact)
+        compact_json = len(json.dumps(compact, separators=(',', ':')))
+
+    print(f"{users} users x {args.messages} messages (history limit {db.history_limit})")
+    print(f"{'format':>8} {'RAM bytes/user':>15} {'JSON bytes/user':>16}")
+    print(f"{'legacy':>8} {legacy_bytes / users:>15.0f} {legacy_json / users:>16.0f}")
+    print(f"{'compact':>8} {compact_bytes / users:>15.0f} {compact_json / users:>16.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Cost of the metrics instrumentation on hot paths.
+
+Times Database.get_user / update_last_active and a trivial handler bare
+(what METRICS_ENABLED=0 runs: nothing is wrapped) and instrumented, then
+renders the /metrics page once everything has been observed.
+
+    python benchmarks/bench_metrics.py --users 100k --calls 200000
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes, timed
+
+import metrics
+from database import Database
+
+
+def per_call(fn, args_list):
+    started = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - started) / len(args_list)
+
+
+async def handler(update, context):
+    return None
+
+
+def per_handler_call(callback, calls):
+    async def run():
+        started = time.perf_counter()
+        for _ in range(calls):
+            await callback(None, None)
+        return (time.perf_counter() - started) / calls
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', default='100k')
+    parser.add_argument('--calls', type=int, default=200_000)
+    args = parser.parse_args()
+    size = parse_sizes(args.users)[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'users_database.json'
+        path.write_text(json.dumps(synthetic_data(size)))
+        db = Database(path, message_log=None, background_load=False,
+                      flush_interval=3600, flush_every=float('inf'))
+        chat_ids = [(chat_id,) for chat_id, _ in db.iter_users()]
+        lookups = [chat_ids[i % len(chat_ids)] for i in range(args.calls)]
+
+        bare = {
+            'get_user': per_call(db.get_user, lookups),
+            'update_last_active': per_call(db.update_last_active, lookups),
+            'handler': per_handler_call(handler, args.calls),
+        }
+        metrics.METRICS_ENABLED = True
+        metrics.instrument(db)
+        timed_handler = metrics.timed_handler(handler)
+        instrumented = {
+            'get_user': per_call(db.get_user, lookups),
+            'update_last_active': per_call(db.update_last_active, lookups),
+            'handler': per_handler_call(timed_handler, args.calls),
+        }
+        db.close()
+
+    print(f"{'call':>20} {'disabled':>10} {'enabled':>10} {'overhead':>10}")
+    for name, before in bare.items():
+        after = instrumented[name]
+        print(f"{name:>20} {before * 1e6:>8.2f}us {after * 1e6:>8.2f}us {(after - before) * 1e6:>8.2f}us")
+    page, render = timed(metrics.REGISTRY.render)
+    print(f"\n/metrics page: {len(page)} bytes rendered in {render * 1e3:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
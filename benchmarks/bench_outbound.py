@@ -0,0 +1,112 @@
+"""Outbound Bot API calls against the fake Telegram server.
+
+1. Connection reuse: bursts of concurrent sendMessage calls separated by
+   quiet spells, through the HTTPXRequest the application builder used
+   to pick (idle connections closed after httpx's 5s) and through the
+   tuned TrackedRequest. Every new connection pays `--connect-delay`,
+   standing in for the TCP + TLS handshake to api.telegram.org.
+2. /start with a referral: the welcome reply plus the referrer's
+   "Congratulations" sent inline (the old handler) vs queued on a
+   NotificationQueue, timing how long the handler takes to return.
+
+    python benchmarks/bench_outbound.py --bursts 3 --idle 6 --latency 0.05
+"""
+import argparse
+import asyncio
+import time
+
+import common  # noqa: F401  (sets up sys.path and env)
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from fake_telegram import FakeTelegram
+from outbound import LatencyTracker, NotificationQueue, TrackedRequest
+
+TOKEN = '123456:BENCHMARK'
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def timed_send(bot, chat_id, latencies):
+    started = time.perf_counter()
+    await bot.send_message(chat_id=chat_id, text='ping')
+    latencies.append(time.perf_counter() - started)
+
+
+async def bursts(server, request, args):
+    server.reset()
+    latencies = []
+    async with Bot(TOKEN, base_url=server.base_url, request=request) as bot:
+        started = time.perf_counter()
+        for burst in range(args.bursts):
+            if burst:
+                await asyncio.sleep(args.idle)
+            await asyncio.gather(*(
+                timed_send(bot, 1_000_000_000 + i, latencies) for i in range(args.burst_size)
+            ))
+        busy = time.perf_counter() - started - args.idle * (args.bursts - 1)
+    return {
+        'connections': server.connections, 'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99), 'rate': len(latencies) / busy,
+    }
+
+
+async def start_handlers(server, args, queued):
+    """Run `--starts` concurrent /start handlers; returns handler latencies."""
+    server.reset()
+    tracker = LatencyTracker()
+    latencies = []
+    async with Bot(TOKEN, base_url=server.base_url, request=TrackedRequest(tracker)) as bot:
+        notifications = NotificationQueue()
+        notifications.start(bot)
+
+        async def start(chat_id):
+            started = time.perf_counter()
+            await bot.send_message(chat_id=chat_id, text='Welcome!')
+            if queued:
+                notifications.notify(900_000_000, 'Congratulations!')
+            else:
+                await bot.send_message(chat_id=900_000_000, text='Congratulations!')
+            latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(start(1_000_000_000 + i) for i in range(args.starts)))
+        await notifications.stop()
+    return {
+        'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99),
+        'delivered': len(server.sent), 'tracker': tracker,
+    }
+
+
+async def main(args):
+    async with FakeTelegram(latency=args.latency, connect_delay=args.connect_delay) as server:
+        print(f"{args.bursts} bursts of {args.burst_size} sends, {args.idle}s apart "
+              f"(latency {args.latency * 1e3:.0f}ms, connect {args.connect_delay * 1e3:.0f}ms)")
+        print(f"{'request':>14} {'connections':>12} {'p50':>8} {'p99':>8} {'sends/s':>8}")
+        for name, request in (('builder default', HTTPXRequest(connection_pool_size=256)),
+                              ('tuned', TrackedRequest(LatencyTracker()))):
+            r = await bursts(server, request, args)
+            print(f"{name:>14} {r['connections']:>12} {r['p50'] * 1e3:>6.0f}ms "
+                  f"{r['p99'] * 1e3:>6.0f}ms {r['rate']:>8.0f}")
+
+        print(f"\n{args.starts} concurrent /start handlers with a referral")
+        print(f"{'referrer notice':>16} {'p50':>8} {'p99':>8} {'delivered':>10}")
+        for name, queued in (('inline', False), ('queued', True)):
+            r = await start_handlers(server, args, queued)
+            print(f"{name:>16} {r['p50'] * 1e3:>6.0f}ms {r['p99'] * 1e3:>6.0f}ms "
+                  f"{r['delivered']:>10}")
+        print(f"\n{r['tracker'].format_summary().replace('`', '')}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bursts', type=int, default=3)
+    parser.add_argument('--burst-size', type=int, default=30)
+    parser.add_argument('--idle', type=float, default=6.0, help='seconds between bursts')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--connect-delay', type=float, default=0.1)
+    parser.add_argument('--starts', type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
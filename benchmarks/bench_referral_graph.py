@@ -0,0 +1,64 @@
+"""Referral graph: build time, leaderboard and downline queries vs full scans.
+
+    python benchmarks/bench_referral_graph.py --sizes 100k,1m
+"""
+import argparse
+import heapq
+import random
+from collections import Counter
+
+from common import synthetic_users, parse_sizes, timed
+
+from referral_graph import ReferralGraph
+
+
+def scan_leaderboard(users, limit):
+    """Count direct referrals with one pass over every user, as a full scan would.
+
+    Synthetic join dates are random, so apply the graph's rule that only
+    referrers who joined first are credited.
+    """
+    counts = Counter()
+    for u in users.values():
+        referrer = users.get(u['referred_by'])
+        if referrer and referrer['joined_at'] <= u['joined_at']:
+            counts[u['referred_by']] += 1
+    return heapq.nlargest(limit, ((n, chat_id) for chat_id, n in counts.items()))
+
+
+def scan_direct(users, chat_id):
+    return [c for c, u in users.items() if u['referred_by'] == chat_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100k,1m')
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'build':>8} {'top10 graph':>12} {'top10 scan':>11} "
+          f"{'downline graph':>15} {'direct scan':>12}")
+    for size in parse_sizes(args.sizes):
+        users = synthetic_users(size)
+        graph, build = timed(ReferralGraph.build,
+                             ((c, u['referred_by'], u['joined_at']) for c, u in users.items()))
+
+        top_graph = graph.leaderboard(10)
+        top_scan = scan_leaderboard(users, 10)
+        assert [n for _, n in top_graph] == [n for n, _ in top_scan], 'leaderboard mismatch'
+
+        rng = random.Random(5)
+        sample = [rng.choice(list(graph.children)) for _ in range(args.queries)]
+        _, leaderboard_elapsed = timed(lambda: [graph.leaderboard(10) for _ in range(args.queries)])
+        _, scan_elapsed = timed(scan_leaderboard, users, 10)
+        _, downline_elapsed = timed(lambda: [(graph.direct_referrals(c), graph.downline_size(c),
+                                              graph.rank_of(c)) for c in sample])
+        _, direct_scan_elapsed = timed(scan_direct, users, sample[0])
+
+        print(f"{size:>10} {build:>7.2f}s {leaderboard_elapsed / args.queries * 1e6:>10.1f}us "
+              f"{scan_elapsed * 1e3:>9.1f}ms {downline_elapsed / args.queries * 1e6:>13.2f}us "
+              f"{direct_scan_elapsed * 1e3:>10.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Per-render cost of the precompiled replies vs building them each time.
+
+Compares WELCOME_MESSAGE.format (what /start used to do) with the
+compiled replies.Template, rebuilding the share keyboard vs reusing it,
+and counts the edit API calls made when the same buttons are tapped over
+and over. (Texts written in code are f-strings, which Python compiles
+already; a template would only add overhead there.)
+
+    python benchmarks/bench_replies.py --renders 200000
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+import common  # noqa: F401  (sets up sys.path and env)
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import bot
+from config import REFERRAL_REWARD, WELCOME_MESSAGE
+from replies import EditTracker
+
+
+def per_call(fn, calls):
+    started = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - started) / calls
+
+
+def format_welcome(i):
+    return WELCOME_MESSAGE.format(
+        name='Bench', bot_username='bench_bot', chat_id=str(i), reward=REFERRAL_REWARD
+    )
+
+
+def build_keyboard(link):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📤 SHARE LINK", url=f"https://t.me/share/url?url={link}&text={bot.SHARE_TEXT}")],
+        [InlineKeyboardButton("📋 COPY LINK", callback_data='copy_link')],
+        [InlineKeyboardButton("◀️ BACK", callback_data='main_menu')]
+    ])
+
+
+class FakeQuery:
+    def __init__(self, chat_id, message_id):
+        self.inline_message_id = None
+        self.message = SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id)
+        self.edits = 0
+
+    async def edit_message_text(self, *args, **kwargs):
+        self.edits += 1
+
+
+async def count_edits(taps, messages):
+    tracker = EditTracker()
+    queries = [FakeQuery(1_000_000_000 + i, 1) for i in range(messages)]
+    for i in range(taps):
+        query = queries[i % messages]
+        # Every message bounces between the same two screens, then re-taps them
+        text = bot.HOW_IT_WORKS_TEXT if (i // messages) % 4 < 2 else bot.MAIN_MENU_TEXT
+        await tracker.edit(query, text, parse_mode='Markdown')
+    return sum(q.edits for q in queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--renders', type=int, default=200_000)
+    parser.add_argument('--taps', type=int, default=10_000)
+    args = parser.parse_args()
+
+    asyncio.run(bot.bot_identity.refresh(SimpleNamespace(get_me=lambda: _me())))
+    welcome = bot.bot_identity.welcome
+    links = [bot.bot_identity.referral_link(str(i)) for i in range(1000)]
+
+    rows = [
+        ('welcome', format_welcome,
+         lambda i: welcome.render(name='Bench', chat_id=str(i))),
+        ('share keyboard', lambda i: build_keyboard(links[i % 1000]),
+         lambda i: bot.share_keyboard(links[i % 1000])),
+    ]
+    for name, before, after in rows:
+        assert before(7) == after(7), name
+    print(f"{'render':>16} {'per call':>10} {'prebuilt':>10}")
+    for name, before, after in rows:
+        print(f"{name:>16} {per_call(before, args.renders) * 1e6:>8.2f}us "
+              f"{per_call(after, args.renders) * 1e6:>8.2f}us")
+
+    sent = asyncio.run(count_edits(args.taps, 100))
+    print(f"\n{args.taps} taps on 100 messages: {sent} edit calls sent, {args.taps - sent} skipped")
+
+
+async def _me():
+    return SimpleNamespace(username='bench_bot')
+
+
+if __name__ == '__main__':
+    main()
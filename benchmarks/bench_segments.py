@@ -0,0 +1,96 @@
+"""Segment evaluation on the attribute indexes versus a full scan.
+
+Loads a synthetic database (30% of users with a campaign in their
+history), builds the segment indexes, and for each expression times
+count_segment(), producing every matching chat id with iter_segment(),
+and the per-campaign Python scan over every user it replaces. Then
+touches `--changes` users and times the same queries with those users
+checked one by one on top of the index.
+
+    python benchmarks/bench_segments.py --users 1m
+"""
+import argparse
+import random
+import tempfile
+from pathlib import Path
+
+from common import parse_sizes, rss_mb, timed, write_synthetic_db
+
+from database import Database
+from segments import SegmentIndex, parse_segment, resolve
+
+EXPRESSIONS = (
+    'status=active',
+    'joined>=2026-02-15',
+    'referrals>=1',
+    'campaign=never',
+    'status=active and referrals>=1 and campaign=never',
+    'status=active and (joined>=2026-03-01 or referrals>=3) and not campaign<1d',
+)
+
+
+def scan(db, expression):
+    """What a segment costs without indexes: test every user in Python."""
+    index = SegmentIndex([])
+    segment = index._bind(resolve(parse_segment(expression)))
+    return [chat_id for chat_id, user in db.iter_users() if index._test(user, segment)]
+
+
+def run_queries(db, expressions):
+    rows = []
+    for expression in expressions:
+        count, count_time = timed(db.count_segment, expression)
+        chat_ids, iter_time = timed(lambda: list(db.iter_segment(expression)))
+        assert len(chat_ids) == count
+        rows.append((expression, count, count_time, iter_time))
+    return rows
+
+
+def print_rows(rows, scans=None):
+    print(f"{'matches':>9} {'count':>9} {'iterate':>9} {'scan':>9}  segment")
+    for i, (expression, count, count_time, iter_time) in enumerate(rows):
+        scan_text = f"{scans[i] * 1e3:>7.0f}ms" if scans else f"{'':>9}"
+        print(f"{count:>9} {count_time * 1e3:>7.1f}ms {iter_time * 1e3:>7.1f}ms {scan_text}  {expression}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='1m')
+    parser.add_argument('--changes', type=int, default=20_000, help='users touched after the build')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    size = parse_sizes(args.users)[0]
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'users_database.json'
+        write_synthetic_db(path, size)
+        db = Database(path, message_log=None, background_load=False,
+                      flush_interval=3600, flush_every=float('inf'))
+        chat_ids = list(db.data['users'])
+        db.log_messages_sent(rng.sample(chat_ids, size * 3 // 10), 'campaign')
+
+        before, _ = rss_mb()
+        _, build_time = timed(db.count_segment, 'status=active')
+        after, _ = rss_mb()
+        print(f"{size} users: indexes built in {build_time:.2f}s, ~{after - before:.0f}MB\n")
+
+        rows = run_queries(db, EXPRESSIONS)
+        scans = []
+        for expression, count, _, _ in rows:
+            matched, scan_time = timed(scan, db, expression)
+            assert len(matched) == count, expression
+            scans.append(scan_time)
+        print_rows(rows, scans)
+
+        for chat_id in rng.sample(chat_ids, args.changes):
+            db.update_last_active(chat_id)
+        db.log_messages_sent(rng.sample(chat_ids, args.changes), 'campaign')
+        print(f"\nafter {args.changes} touches and {args.changes} campaign deliveries "
+              f"({len(db._segments.dirty)} users checked individually):")
+        print_rows(run_queries(db, EXPRESSIONS))
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
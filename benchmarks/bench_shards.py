@@ -0,0 +1,94 @@
+"""Save cost and lookup latency of ShardedDatabase as the shard count grows.
+
+For each shard count the synthetic file is split with rebalance_shards,
+then one user is touched and the resulting flush timed: only that user's
+shard is rewritten. 1 shard is the plain Database.
+
+    python benchmarks/bench_shards.py --users 1m --shards 1,2,4,8
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes, timed
+
+from database import Database, ShardedDatabase
+from rebalance_shards import rebalance
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def open_store(path, shards):
+    # Flushes are triggered by hand; keep the background flushers idle
+    options = dict(flush_interval=3600, flush_every=float('inf'), background_load=False)
+    if shards == 1:
+        return Database(path, message_log=None, **options)
+    return ShardedDatabase(path, shards, message_log=None, **options)
+
+
+def run(path, shards, args):
+    if shards > 1:
+        _, split = timed(rebalance, path, 1, shards, message_log=None, jobs_dir=None)
+    else:
+        split = 0.0
+    db, load = timed(open_store, path, shards)
+    chat_ids = [chat_id for chat_id, _ in db.iter_users()]
+    rng = random.Random(7)
+
+    saves = []
+    for _ in range(args.saves):
+        db.update_last_active(rng.choice(chat_ids))
+        saves.append(timed(db.flush)[1])
+
+    lookups = []
+    for _ in range(args.lookups):
+        chat_id = rng.choice(chat_ids)
+        started = time.perf_counter()
+        db.get_user(chat_id)
+        lookups.append(time.perf_counter() - started)
+
+    _, active = timed(db.get_active_users, 100)
+    _, scan = timed(lambda: sum(1 for _ in db.iter_users()))
+    db.close()
+
+    if shards > 1:
+        rebalance(path, shards, 1, message_log=None, jobs_dir=None)
+    return {
+        'split': split, 'load': load, 'save': percentile(saves, 50),
+        'get_p50': percentile(lookups, 50), 'get_p99': percentile(lookups, 99),
+        'active': active, 'scan': scan,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', default='100k')
+    parser.add_argument('--shards', default='1,2,4,8')
+    parser.add_argument('--saves', type=int, default=20)
+    parser.add_argument('--lookups', type=int, default=100_000)
+    args = parser.parse_args()
+    size = parse_sizes(args.users)[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'users_database.json'
+        path.write_text(json.dumps(synthetic_data(size)))
+        # Backfill the rollups once so every row loads the same file
+        Database(path, write_behind=False, message_log=None, background_load=False).close()
+
+        print(f"{'shards':>6} {'split':>8} {'load':>8} {'save/op':>9} {'get p50':>9} "
+              f"{'get p99':>9} {'active100':>10} {'full scan':>10}")
+        for shards in (int(n) for n in args.shards.split(',')):
+            r = run(path, shards, args)
+            print(f"{shards:>6} {r['split']:>7.2f}s {r['load']:>7.2f}s {r['save'] * 1e3:>7.1f}ms "
+                  f"{r['get_p50'] * 1e6:>7.2f}us {r['get_p99'] * 1e6:>7.2f}us "
+                  f"{r['active'] * 1e3:>8.2f}ms {r['scan'] * 1e3:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Startup time and peak RSS: json.load vs the streaming loader.
+
+Each loader runs in a fresh process so ru_maxrss is its own peak.
+
+    python benchmarks/bench_startup.py --sizes 100k,1m
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes
+
+from database import Database
+from user_record import UserRecord
+
+MODES = ('json.load', 'stream', 'background')
+
+
+class JsonLoadDatabase(Database):
+    """The previous loader: parse the whole file in one json.load call."""
+
+    def _read_snapshot(self):
+        with open(self.db_file, 'r') as f:
+            self.data = json.load(f)
+        users = self.data['users']
+        for chat_id, user in users.items():
+            users[chat_id] = UserRecord.from_dict(user)
+        return True
+
+
+def child(mode, path, first, middle):
+    started = time.perf_counter()
+    if mode == 'json.load':
+        db = JsonLoadDatabase(path, write_behind=False, background_load=False)
+    else:
+        db = Database(path, write_behind=False, background_load=mode == 'background')
+    assert db.get_user(first) is not None
+    first_read = time.perf_counter() - started
+    assert db.get_user(middle) is not None
+    middle_read = time.perf_counter() - started
+    db.wait_until_loaded()
+    ready = time.perf_counter() - started
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(json.dumps({'first_read': first_read, 'middle_read': middle_read, 'ready': ready,
+                      'rss_mb': rss, 'users': db.user_count()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100k,1m')
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    # get_user columns: time from startup until the first / middle record
+    # in the file can be read
+    print(f"{'users':>10} {'loader':>11} {'first':>8} {'middle':>8} {'ready':>8} {'peak RSS':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in parse_sizes(args.sizes):
+            path = Path(tmp) / 'users_database.json'
+            data = synthetic_data(size)
+            data['daily_stats'] = {}  # skip the one-off analytics backfill
+            chat_ids = list(data['users'])
+            first, middle = chat_ids[0], chat_ids[len(chat_ids) // 2]
+            del chat_ids
+            with open(path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            del data
+
+            for mode in MODES:
+                out = subprocess.run(
+                    [sys.executable, __file__, '--child', mode, str(path), first, middle],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(out.strip().splitlines()[-1])
+                assert result['users'] == size
+                print(f"{size:>10} {mode:>11} {result['first_read']:>7.2f}s {result['middle_read']:>7.2f}s "
+                      f"{result['ready']:>7.2f}s {result['rss_mb']:>7.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Aggregate handler throughput with 1..N bot workers sharing a storage server.
+
+Starts storage_server.py on a synthetic database in its own process,
+then runs 1, 2, 4, ... worker processes against it for `--seconds` each.
+Every worker loops over a stand-in for a handler: `--handler-ms` of CPU
+work (what python-telegram-bot spends parsing an update and rendering a
+reply) plus the storage calls /stats and /downline make (get_user,
+get_downline, update_last_active). The in-process Database running the
+same loop is the single-worker baseline. Also times N get_user calls one
+round trip at a time versus one pipeline().
+
+Workers only scale while there are cores left for them and for the
+server, so run it on the machine size you deploy on.
+
+    python benchmarks/bench_storage_server.py --users 100k --workers 1,2,4,8
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import ROOT, parse_sizes, percentile, write_synthetic_db
+
+FIRST_USER_ID = 1_000_000_000
+
+
+def handler(db, chat_id, handler_ms):
+    deadline = time.perf_counter() + handler_ms / 1000
+    while time.perf_counter() < deadline:
+        pass
+    db.get_user(chat_id)
+    db.get_downline(chat_id)
+    db.update_last_active(chat_id)
+
+
+def run_handlers(db, args, seed, start_at):
+    rng = random.Random(seed)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    latencies = []
+    end = time.perf_counter() + args.seconds
+    while True:
+        started = time.perf_counter()
+        if started >= end:
+            break
+        handler(db, str(FIRST_USER_ID + rng.randrange(args.user_count)), args.handler_ms)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def worker(socket_path, args, seed, start_at, results):
+    from remote_database import RemoteDatabase
+    db = RemoteDatabase(socket_path)
+    results.put(run_handlers(db, args, seed, start_at))
+    db.close()
+
+
+def run_workers(socket_path, args, count):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    # Give every worker time to start up before the clock does
+    start_at = time.time() + 2
+    processes = [
+        ctx.Process(target=worker, args=(socket_path, args, seed, start_at, results))
+        for seed in range(count)
+    ]
+    for process in processes:
+        process.start()
+    latencies = []
+    for _ in processes:
+        latencies.extend(results.get())
+    for process in processes:
+        process.join()
+    return latencies
+
+
+def start_server(db_path, socket_path):
+    env = dict(os.environ, DB_PATH=str(db_path), DB_SERVER_SOCKET=str(socket_path), DB_BACKGROUND_LOAD='0')
+    server = subprocess.Popen([sys.executable, str(ROOT / 'storage_server.py')], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    while not os.path.exists(socket_path):
+        if server.poll() is not None:
+            raise RuntimeError('storage server exited on startup')
+        time.sleep(0.05)
+    return server
+
+
+def pipeline_comparison(socket_path, args):
+    from remote_database import RemoteDatabase
+    db = RemoteDatabase(socket_path)
+    chat_ids = [str(FIRST_USER_ID + i % args.user_count) for i in range(args.pipeline)]
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        db.get_user(chat_id)
+    one_by_one = time.perf_counter() - started
+    started = time.perf_counter()
+    db.pipeline([('get_user', (chat_id,)) for chat_id in chat_ids])
+    pipelined = time.perf_counter() - started
+    db.close()
+    return one_by_one, pipelined
+
+
+def report(label, latencies, seconds):
+    print(f"{label:>18} {len(latencies) / seconds:>10.0f} "
+          f"{percentile(latencies, 50) * 1e3:>8.2f}ms {percentile(latencies, 99) * 1e3:>8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='100k')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--seconds', type=float, default=5.0, help='per run')
+    parser.add_argument('--handler-ms', type=float, default=1.0, help='CPU per handler outside storage')
+    parser.add_argument('--pipeline', type=int, default=1000, help='get_user calls in the pipeline test')
+    args = parser.parse_args()
+    args.user_count = parse_sizes(args.users)[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'users_database.json'
+        socket_path = str(Path(tmp) / 'storage.sock')
+        write_synthetic_db(db_path, args.user_count)
+
+        print(f"{os.cpu_count()} CPUs, {args.user_count} users, {args.handler_ms}ms of CPU per handler\n")
+        print(f"{'workers':>18} {'handlers/s':>10} {'p50':>10} {'p99':>10}")
+        from database import Database
+        local = Database(db_path, message_log=None, background_load=False,
+                         flush_interval=3600, flush_every=float('inf'))
+        report('in-process', run_handlers(local, args, 0, time.time()), args.seconds)
+        local.close()
+
+        server = start_server(db_path, socket_path)
+        try:
+            for count in parse_sizes(args.workers):
+                report(f"{count} x remote", run_workers(socket_path, args, count), args.seconds)
+            one_by_one, pipelined = pipeline_comparison(socket_path, args)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"\n{args.pipeline} get_user calls: {one_by_one * 1e3:.1f}ms one round trip each, "
+          f"{pipelined * 1e3:.1f}ms pipelined")
+
+
+if __name__ == '__main__':
+    main()
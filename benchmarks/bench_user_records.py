@@ -0,0 +1,56 @@
+"""Bytes per user: json-decoded user dicts vs UserRecord.
+
+Both tables are decoded from the same JSON text, the way Database loads
+them, so dict keys are shared the same way they would be in production.
+
+    python benchmarks/bench_user_records.py --users 1m
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from common import synthetic_data, parse_sizes, timed
+
+from json_stream import iter_snapshot_users
+from user_record import UserRecord
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    table = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return table, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', default='1m')
+    args = parser.parse_args()
+
+    import tempfile
+    from pathlib import Path
+
+    print(f"{'users':>10} {'format':>8} {'bytes/user':>11} {'to JSON':>8}")
+    for size in parse_sizes(args.users):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'users_database.json'
+            with open(path, 'w') as f:
+                json.dump(synthetic_data(size), f, separators=(',', ':'))
+
+            for name, build in (
+                ('dict', lambda: dict(iter_snapshot_users(path))),
+                ('record', lambda: {c: UserRecord.from_dict(u) for c, u in iter_snapshot_users(path)}),
+            ):
+                table, used = measure(build)
+                _, dump = timed(json.dumps, table, separators=(',', ':'),
+                                default=UserRecord.to_dict)
+                print(f"{size:>10} {name:>8} {used / size:>11.0f} {dump:>7.2f}s")
+                del table
+
+
+if __name__ == '__main__':
+    main()
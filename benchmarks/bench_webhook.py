@@ -0,0 +1,105 @@
+"""Webhook ingestion: updates/sec and queueing latency.
+
+Starts WebhookServer on localhost with a bounded queue drained by
+--workers consumers that each take --handler-time per update, then POSTs
+synthetic /start updates over --connections keep-alive connections.
+
+    python benchmarks/bench_webhook.py --updates 5000 --workers 8
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import common  # noqa: F401  (sets up sys.path and env)
+
+from telegram import Bot
+
+from webhook import WebhookServer
+
+SECRET = 'bench-secret'
+
+
+def synthetic_update(update_id):
+    chat_id = 1_000_000_000 + update_id
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'User{update_id}'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+        }
+    }
+
+
+async def client(port, path, update_ids, sent_at, statuses):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for update_id in update_ids:
+        body = json.dumps(synthetic_update(update_id)).encode()
+        sent_at[update_id] = time.perf_counter()
+        writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        status = int(status_line.split()[1])
+        statuses[status] = statuses.get(status, 0) + 1
+    writer.close()
+
+
+async def main(args):
+    queue = asyncio.Queue(maxsize=args.queue_size)
+    server = WebhookServer(queue, Bot('123456:BENCHMARK'), listen='127.0.0.1', port=args.port,
+                           path='/telegram', secret_token=SECRET, enqueue_timeout=args.enqueue_timeout)
+    await server.start()
+
+    sent_at, latencies, statuses = {}, [], {}
+
+    async def worker():
+        while True:
+            update = await queue.get()
+            latencies.append(time.perf_counter() - sent_at[update.update_id])
+            await asyncio.sleep(args.handler_time)
+            queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(args.workers)]
+    ids = list(range(1, args.updates + 1))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(args.port, '/telegram', ids[i::args.connections], sent_at, statuses)
+        for i in range(args.connections)
+    ))
+    accepted = time.perf_counter() - started
+    await queue.join()
+    processed = time.perf_counter() - started
+    for task in workers:
+        task.cancel()
+    await server.stop()
+
+    latencies.sort()
+    pick = lambda pct: latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))] * 1e3
+    print(f"updates:          {args.updates} over {args.connections} connections, {args.workers} workers")
+    print(f"responses:        {statuses}")
+    print(f"accepted:         {server.received / accepted:.0f} updates/s")
+    print(f"processed:        {len(latencies) / processed:.0f} updates/s")
+    print(f"queue latency:    p50 {pick(50):.1f}ms  p99 {pick(99):.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--connections', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--handler-time', type=float, default=0.005)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--enqueue-timeout', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=18443)
+    asyncio.run(main(parser.parse_args()))
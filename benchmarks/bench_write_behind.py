@@ -0,0 +1,58 @@
+"""Mutations/sec for Database with save-per-mutation vs write-behind.
+
+    python benchmarks/bench_write_behind.py --sizes 10k,100k,1m
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from common import synthetic_data, parse_sizes
+
+from database import Database
+
+
+def run(size, write_behind, seconds, max_ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'users_database.json'
+        path.write_text(json.dumps(synthetic_data(size)))
+        db = Database(path, write_behind=write_behind, flush_interval=1.0)
+        chat_ids = list(db.data['users'])
+
+        ops = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while ops < max_ops and time.perf_counter() < deadline:
+            chat_id = chat_ids[ops % len(chat_ids)]
+            if ops % 2:
+                db.update_last_active(chat_id)
+            else:
+                db.log_message_sent(chat_id, 'campaign')
+            ops += 1
+        elapsed = time.perf_counter() - started
+
+        close_started = time.perf_counter()
+        db.close()
+        close_elapsed = time.perf_counter() - close_started
+        return ops / elapsed, close_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10k,100k,1m')
+    parser.add_argument('--seconds', type=float, default=5.0,
+                        help='time budget per run')
+    parser.add_argument('--max-ops', type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'mode':>14} {'mutations/s':>14} {'final flush':>12}")
+    for size in parse_sizes(args.sizes):
+        for write_behind in (False, True):
+            rate, close_elapsed = run(size, write_behind, args.seconds, args.max_ops)
+            mode = 'write-behind' if write_behind else 'save-per-op'
+            print(f"{size:>10} {mode:>14} {rate:>14.1f} {close_elapsed:>11.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Shared helpers for the benchmark scripts.
+
+Run benchmarks from the repository root, e.g.::
+
+    python benchmarks/bench_write_behind.py
+"""
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# config.py refuses to import without a token; benchmarks never talk to Telegram
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:BENCHMARK')
+# Keep the global `db` instance and job store away from the real files
+_scratch = tempfile.mkdtemp(prefix='bench-')
+os.environ.setdefault('DB_PATH', os.path.join(_scratch, 'users_database.json'))
+os.environ.setdefault('BROADCAST_JOBS_DIR', os.path.join(_scratch, 'broadcast_jobs'))
+# Benchmarks poke at db.data right after construction; load synchronously
+os.environ.setdefault('DB_BACKGROUND_LOAD', '0')
+
+
+def synthetic_users(count, seed=42):
+    """Build a users dict shaped like users_database.json with `count` users."""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    users = {}
+    ids = []
+    for i in range(count):
+        chat_id = str(1_000_000_000 + i)
+        joined = start + timedelta(seconds=rng.randrange(90 * 86400))
+        referred_by = rng.choice(ids) if ids and rng.random() < 0.3 else None
+        users[chat_id] = {
+            'chat_id': chat_id,
+            'first_name': f'User{i}',
+            'username': f'user{i}' if rng.random() < 0.7 else None,
+            'joined_at': str(joined),
+            'referred_by': referred_by,
+            'referrals': 0,
+            'last_active': str(joined + timedelta(seconds=rng.randrange(86400 * 30))),
+            'status': 'active' if rng.random() < 0.9 else 'blocked',
+            'message_counts': {'welcome': 1},
+            'recent_messages': [['welcome', int(joined.timestamp())]]
+        }
+        if referred_by:
+            users[referred_by]['referrals'] += 1
+        ids.append(chat_id)
+    return users
+
+
+def synthetic_data(count, seed=42):
+    users = synthetic_users(count, seed)
+    return {'users': users, 'total_users': len(users), 'settings': {}}
+
+
+def write_synthetic_db(path, count, seed=42):
+    """Write a users_database.json with `count` users without holding them in memory.
+
+    Same shape and distributions as synthetic_users (30% referred, 70%
+    with a username, 10% blocked), but users are generated and written one
+    at a time, so 1M users take seconds and little RAM. Referrers are
+    drawn up front so their referral counts are known when they're written.
+    """
+    rng = random.Random(seed)
+    referrers = array('l', [-1]) * count
+    referrals = array('l', [0]) * count
+    for i in range(1, count):
+        if rng.random() < 0.3:
+            referrers[i] = rng.randrange(i)
+            referrals[referrers[i]] += 1
+
+    start = datetime(2026, 1, 1)
+    with open(path, 'w') as f:
+        f.write('{"users": {')
+        for i in range(count):
+            chat_id = str(1_000_000_000 + i)
+            joined = start + timedelta(seconds=rng.randrange(90 * 86400))
+            user = {
+                'chat_id': chat_id,
+                'first_name': f'User{i}',
+                'username': f'user{i}' if rng.random() < 0.7 else None,
+                'joined_at': str(joined),
+                'referred_by': str(1_000_000_000 + referrers[i]) if referrers[i] >= 0 else None,
+                'referrals': referrals[i],
+                'last_active': str(joined + timedelta(seconds=rng.randrange(86400 * 30))),
+                'status': 'active' if rng.random() < 0.9 else 'blocked',
+                'message_counts': {'welcome': 1},
+                'recent_messages': [['welcome', int(joined.timestamp())]]
+            }
+            f.write(f'{", " if i else ""}"{chat_id}": {json.dumps(user)}')
+        f.write(f'}}, "total_users": {count}, "settings": {{}}}}')
+
+
+def rss_mb():
+    """(current, peak) resident set size of this process in MB."""
+    with open('/proc/self/statm') as f:
+        current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    # ru_maxrss is in KB on Linux
+    return current / 2**20, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def timed(fn, *args, **kwargs):
+    """Call fn and return (result, elapsed seconds)."""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def parse_sizes(text):
+    """Parse '10k,100k,1m' into [10000, 100000, 1000000]."""
+    sizes = []
+    for part in text.split(','):
+        part = part.strip().lower()
+        scale = 1
+        if part.endswith('k'):
+            scale, part = 1_000, part[:-1]
+        elif part.endswith('m'):
+            scale, part = 1_000_000, part[:-1]
+        sizes.append(int(float(part) * scale))
+    return sizes
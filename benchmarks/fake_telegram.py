@@ -0,0 +1,197 @@
+"""A fake Telegram Bot API server for benchmarks and local load tests.
+
+Speaks just enough of the Bot API over plain HTTP/1.1 (keep-alive) for
+python-telegram-bot: getMe, sendMessage, editMessageText, sendDocument,
+answerCallbackQuery, getUpdates, setWebhook/deleteWebhook, and "ok" for
+anything else. Every call waits `latency` seconds; a new connection
+first waits `connect_delay` (standing in for the TCP + TLS handshake a
+real connection costs), and a `flood_rate` fraction of sends answer 429
+with retry_after. Calls and connections are counted so benchmarks can
+see how many requests each connection carried, and uploads (sendDocument)
+are read in full and counted in `bytes_received`.
+
+Run it standalone and point the bot at it:
+
+    python benchmarks/fake_telegram.py --port 8081 --latency 0.05
+    API_BASE_URL=http://127.0.0.1:8081/bot python bot.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 429: 'Too Many Requests'}
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+
+class FakeTelegram:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, connect_delay=0.0,
+                 flood_rate=0.0, retry_after=1, seed=7):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.connect_delay = connect_delay
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.floods = 0
+        self.bytes_received = 0
+        self.connections = 0
+        self.open_connections = 0
+        self.sent = []  # (chat_id, text) of every message delivered
+        self._message_id = 0
+        self._server = None
+
+    @property
+    def base_url(self):
+        """What to pass as Bot(base_url=...) / API_BASE_URL."""
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def reset(self):
+        self.calls.clear()
+        self.sent.clear()
+        self.floods = 0
+        self.bytes_received = 0
+        self.connections = 0
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        self.open_connections += 1
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self._call(target, headers, body)
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def _call(self, target, headers, body):
+        # /bot<token>/<method>
+        method = target.split('?', 1)[0].rsplit('/', 1)[-1]
+        self.calls[method] += 1
+        self.bytes_received += len(body)
+        params = _parse_params(headers, body)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        handler = getattr(self, f'_{method}', None)
+        if method.startswith('send') and self.flood_rate and self.rng.random() < self.flood_rate:
+            self.floods += 1
+            return 429, {
+                'ok': False, 'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after}
+            }
+        result = await handler(params) if handler else True
+        return 200, {'ok': True, 'result': result}
+
+    def _message(self, chat_id, text=None):
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id, 'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'}, 'from': BOT_USER
+        }
+        if text is not None:
+            message['text'] = text
+        return message
+
+    async def _getMe(self, params):
+        return BOT_USER
+
+    async def _sendMessage(self, params):
+        self.sent.append((params.get('chat_id'), params.get('text')))
+        return self._message(params.get('chat_id', 0), params.get('text'))
+
+    async def _editMessageText(self, params):
+        return self._message(params.get('chat_id', 0), params.get('text'))
+
+    async def _sendDocument(self, params):
+        return self._message(params.get('chat_id', 0))
+
+    async def _getUpdates(self, params):
+        # Long poll that never has anything to deliver
+        await asyncio.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+        return []
+
+
+def _parse_params(headers, body):
+    content_type = headers.get('content-type', '')
+    if content_type.startswith('application/json'):
+        return json.loads(body or b'{}')
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        return dict(parse_qsl(body.decode('utf-8')))
+    return {}  # multipart uploads: the file itself is ignored
+
+
+async def _serve(args):
+    server = FakeTelegram(args.host, args.port, latency=args.latency,
+                          connect_delay=args.connect_delay, flood_rate=args.flood_rate)
+    await server.start()
+    print(f"Fake Bot API on {server.base_url} (latency {args.latency}s)")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"{sum(server.calls.values())} calls over {server.connections} connections: "
+                  f"{dict(server.calls)}")
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--connect-delay', type=float, default=0.0)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
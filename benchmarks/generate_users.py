@@ -0,0 +1,26 @@
+"""Write a synthetic users_database.json for load tests.
+
+    python benchmarks/generate_users.py --users 1m --out /tmp/users_database.json
+
+Point the bot (or a benchmark) at it with DB_PATH=/tmp/users_database.json.
+Users are streamed to the file, so even 1M users need little memory.
+"""
+import argparse
+
+from common import parse_sizes, timed, write_synthetic_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', default='10k', help='e.g. 10k, 100k, 1m')
+    parser.add_argument('--out', default='users_database.json')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    count = parse_sizes(args.users)[0]
+    _, elapsed = timed(write_synthetic_db, args.out, count, args.seed)
+    print(f"✅ Wrote {count} users to {args.out} in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
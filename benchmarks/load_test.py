@@ -0,0 +1,248 @@
+"""Offline load test: the real bot Application against the fake Bot API.
+
+Generates a synthetic database, starts benchmarks/fake_telegram.py in
+process, builds the bot with bot.build_application() pointed at it, and
+drives updates through the same ChatOrderedUpdateProcessor that polling
+and the webhook use. Scenarios:
+
+    start      /start storm: new users arriving via referral links, plus
+               returning users tapping /start again
+    taps       inline button storm on existing users' menus
+    broadcast  /broadcast to the N most recently active users
+    export     /export of every user as CSV
+
+Updates arrive all at once, or at `--rate` per second. Latency is from
+an update's arrival to its handler finishing (for broadcast: per
+sendMessage call). Throughput, p50/p99 latency, RSS and the Bot API calls
+made are printed, and written as JSON with `--json` for regression
+tracking.
+
+    python benchmarks/load_test.py --users 100k --scenarios start,taps --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from common import parse_sizes, percentile, rss_mb, write_synthetic_db
+
+from telegram import Update
+
+from fake_telegram import FakeTelegram
+
+ADMIN_CHAT_ID = 1
+FIRST_USER_ID = 1_000_000_000
+BUTTONS = ('get_link', 'stats', 'how_it_works', 'main_menu')
+
+
+def user_json(chat_id):
+    return {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}'}
+
+
+def command_update(update_id, chat_id, text):
+    command = text.split(' ', 1)[0]
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'}, 'from': user_json(chat_id),
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+        }
+    }
+
+
+def tap_update(update_id, chat_id, data):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id), 'from': user_json(chat_id), 'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': 1, 'date': int(time.time()), 'text': 'menu',
+                'chat': {'id': chat_id, 'type': 'private'},
+            },
+        }
+    }
+
+
+class LoadTest:
+    def __init__(self, application, bot_module, server, args):
+        self.application = application
+        self.bot = bot_module
+        self.server = server
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.next_update_id = 1
+
+    def _update(self, payload):
+        self.next_update_id += 1
+        return Update.de_json(payload, self.application.bot)
+
+    async def drive(self, updates):
+        """Feed updates through the processor; returns per-update latencies."""
+        processor = self.application.update_processor
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        latencies = []
+
+        async def one(i, update):
+            arrival = started + (i / self.args.rate if self.args.rate else 0)
+            if arrival > loop.time():
+                await asyncio.sleep(arrival - loop.time())
+            await processor.process_update(update, self.application.process_update(update))
+            latencies.append(loop.time() - arrival)
+
+        await asyncio.gather(*(one(i, update) for i, update in enumerate(updates)))
+        return latencies
+
+    async def scenario_start(self):
+        updates = []
+        for i in range(self.args.starts):
+            if self.rng.random() < 0.7:
+                # A new user following an existing user's referral link
+                chat_id = FIRST_USER_ID + self.args.user_count + i
+                referrer = FIRST_USER_ID + self.rng.randrange(self.args.user_count)
+                text = f'/start {referrer}'
+            else:
+                chat_id = FIRST_USER_ID + self.rng.randrange(self.args.user_count)
+                text = '/start'
+            updates.append(self._update(command_update(self.next_update_id, chat_id, text)))
+        latencies = await self.drive(updates)
+        # Referrer notifications go out in the background; count them in
+        await self.bot.notifications.stop()
+        self.bot.notifications.start(self.application.bot)
+        return len(updates), latencies
+
+    async def scenario_taps(self):
+        updates = [
+            self._update(tap_update(
+                self.next_update_id, FIRST_USER_ID + self.rng.randrange(self.args.user_count),
+                self.rng.choice(BUTTONS)
+            ))
+            for _ in range(self.args.taps)
+        ]
+        return len(updates), await self.drive(updates)
+
+    async def scenario_broadcast(self):
+        update = self._update(command_update(
+            self.next_update_id, ADMIN_CHAT_ID, f'/broadcast {self.args.broadcast_size}'))
+        await self.drive([update])
+        job = await self.bot.broadcast_jobs.latest()
+        while job['status'] == 'running':
+            await asyncio.sleep(0.05)
+        stats = self.bot.api_latency.endpoints.get('sendMessage')
+        latencies = list(stats.recent) if stats else []
+        return job['sent'] + job['failed'], latencies
+
+    async def scenario_export(self):
+        update = self._update(command_update(self.next_update_id, ADMIN_CHAT_ID, '/export'))
+        return self.bot.db.user_count(), await self.drive([update])
+
+    async def run(self, name):
+        self.server.reset()
+        self.bot.api_latency.endpoints.clear()
+        started, cpu_started = time.perf_counter(), time.process_time()
+        count, latencies = await getattr(self, f'scenario_{name}')()
+        elapsed = time.perf_counter() - started
+        # The fake server runs in this process too, so this includes its share
+        cpu = time.process_time() - cpu_started
+        current, peak = rss_mb()
+        return {
+            'scenario': name,
+            'count': count,
+            'seconds': round(elapsed, 3),
+            'cpu_seconds': round(cpu, 3),
+            'throughput': round(count / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1e3, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1e3, 2),
+            'rss_mb': round(current, 1),
+            'peak_rss_mb': round(peak, 1),
+            'api_calls': dict(self.server.calls),
+            'api_429s': self.server.floods,
+            'api_bytes_received': self.server.bytes_received,
+            'connections': self.server.connections,
+        }
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp(prefix='load-test-')
+    db_path = Path(tmp) / 'users_database.json'
+    if args.db:
+        shutil.copy(args.db, db_path)
+    else:
+        write_synthetic_db(db_path, args.user_count)
+
+    async with FakeTelegram(latency=args.latency, flood_rate=args.flood_rate) as server:
+        # config.py reads these on import, so set them before importing bot
+        os.environ.update({
+            'DB_PATH': str(db_path), 'BROADCAST_JOBS_DIR': str(Path(tmp) / 'broadcast_jobs'),
+            'ADMIN_CHAT_ID': str(ADMIN_CHAT_ID), 'API_BASE_URL': server.base_url,
+            'BROADCAST_RATE': str(args.broadcast_rate), 'DB_BACKGROUND_LOAD': '0',
+        })
+        import bot
+        logging.getLogger().setLevel(logging.WARNING)
+        application = bot.build_application()
+        load_test = LoadTest(application, bot, server, args)
+
+        results = []
+        async with application:
+            await application.post_init(application)
+            await application.start()
+            try:
+                for name in args.scenarios.split(','):
+                    results.append(await load_test.run(name))
+            finally:
+                await application.stop()
+                await application.post_stop(application)
+        bot.store.close()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"{'scenario':>10} {'count':>8} {'seconds':>8} {'cpu':>8} {'per sec':>8} {'p50':>9} {'p99':>9} "
+          f"{'rss':>8} {'peak rss':>9}")
+    for r in results:
+        print(f"{r['scenario']:>10} {r['count']:>8} {r['seconds']:>7.2f}s {r['cpu_seconds']:>7.2f}s {r['throughput']:>8.0f} "
+              f"{r['p50_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms {r['rss_mb']:>6.0f}MB {r['peak_rss_mb']:>7.0f}MB")
+    if args.json:
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'users': args.user_count,
+            'latency': args.latency,
+            'flood_rate': args.flood_rate,
+            'rate': args.rate,
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='10k', help='synthetic database size, e.g. 10k, 1m')
+    parser.add_argument('--db', help='load test a copy of this database instead')
+    parser.add_argument('--scenarios', default='start,taps,broadcast,export')
+    parser.add_argument('--starts', type=int, default=2000)
+    parser.add_argument('--taps', type=int, default=2000)
+    parser.add_argument('--broadcast-size', type=int, default=1000)
+    parser.add_argument('--broadcast-rate', type=float, default=1000,
+                        help="messages/s; Telegram's real limit is ~30")
+    parser.add_argument('--rate', type=float, default=0, help='updates per second (0: all at once)')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake Bot API latency (s)')
+    parser.add_argument('--flood-rate', type=float, default=0.0, help='fraction of sends answered 429')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+    args.user_count = parse_sizes(args.users)[0]
+    if args.db:
+        with open(args.db) as f:
+            args.user_count = len(json.load(f)['users'])
+    asyncio.run(main(args))
@@ -1,416 +1,741 @@
-
-import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from config import BOT_TOKEN, ADMIN_CHAT_ID, WELCOME_MESSAGE, REFERRAL_REWARD, FRIEND_REWARD
-from database import db
-from datetime import datetime
-
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
-
-# ============================================
-# COMMAND: /start - New users + Referral tracking
-# ============================================
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /start command. This is your opt-in AND referral tracker."""
-    
-    user = update.effective_user
-    chat_id = str(update.effective_chat.id)
-    
-    # Check if this is a referral (user clicked referral link)
-    referred_by = None
-    if context.args:
-        # The argument is the referrer's chat_id
-        referred_by = context.args[0]
-        logger.info(f"➕ Referral detected! {chat_id} referred by {referred_by}")
-    
-    # Add user to database
-    db_user = db.add_user(
-        chat_id=chat_id,
-        first_name=user.first_name,
-        username=user.username,
-        referred_by=referred_by
-    )
-    
-    # Get bot username for referral link
-    bot_username = (await context.bot.get_me()).username
-    
-    # Personalize welcome message
-    welcome = WELCOME_MESSAGE.format(
-        name=user.first_name,
-        bot_username=bot_username,
-        chat_id=chat_id,
-        reward=REFERRAL_REWARD
-    )
-    
-    # Create inline keyboard
-    keyboard = [
-        [InlineKeyboardButton("🔗 GET YOUR REFERRAL LINK", callback_data='get_link')],
-        [InlineKeyboardButton("📊 MY STATS", callback_data='stats')],
-        [InlineKeyboardButton("🎁 HOW IT WORKS", callback_data='how_it_works')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Send welcome message
-    await update.message.reply_text(
-        welcome,
-        parse_mode='Markdown',
-        reply_markup=reply_markup
-    )
-    
-    # If user was referred, notify the referrer
-    if referred_by and referred_by in db.data['users']:
-        try:
-            await context.bot.send_message(
-                chat_id=int(referred_by),
-                text=f"🎉 **Congratulations!**\n\n"
-                     f"{user.first_name} joined using your referral link!\n"
-                     f"You now have {db.data['users'][referred_by]['referrals']} referrals.\n\n"
-                     f"Your {REFERRAL_REWARD} is ready! 🎁",
-                parse_mode='Markdown'
-            )
-            logger.info(f"✅ Referral notification sent to {referred_by}")
-        except Exception as e:
-            logger.error(f"❌ Failed to notify referrer {referred_by}: {e}")
-    
-    # Log message sent
-    db.log_message_sent(chat_id, 'welcome')
-
-
-# ============================================
-# COMMAND: /referral - Get referral link
-# ============================================
-async def referral(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Send user their personalized referral link."""
-    
-    user = update.effective_user
-    chat_id = str(update.effective_chat.id)
-    
-    # Update last active
-    db.update_last_active(chat_id)
-    
-    # Get bot username
-    bot_username = (await context.bot.get_me()).username
-    
-    # Create referral link
-    referral_link = f"https://t.me/{bot_username}?start={chat_id}"
-    
-    # Get user's current referrals
-    db_user = db.get_user(chat_id)
-    referrals = db_user.get('referrals', 0) if db_user else 0
-    
-    # Create share buttons
-    keyboard = [
-        [InlineKeyboardButton("📤 SHARE LINK", url=f"https://t.me/share/url?url={referral_link}&text=Join%20me%20on%20this%20referral%20program%20for%20{REFERRAL_REWARD.replace('%', '%25')}")],
-        [InlineKeyboardButton("📋 COPY LINK", callback_data='copy_link')],
-        [InlineKeyboardButton("◀️ BACK", callback_data='main_menu')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    message = f"""
-🔗 **YOUR PERSONAL REFERRAL LINK**
-
-`{referral_link}`
-
-📊 **Your Stats:**
-• Referrals: **{referrals}**
-• Reward: {REFERRAL_REWARD if referrals > 0 else 'Not yet'}
-
-Share this link with friends!
-When they join, you BOTH get rewards.
-"""
-    
-    await update.message.reply_text(
-        message,
-        parse_mode='Markdown',
-        reply_markup=reply_markup,
-        disable_web_page_preview=True
-    )
-    
-    db.log_message_sent(chat_id, 'referral_link')
-
-
-# ============================================
-# COMMAND: /stats - View personal stats
-# ============================================
-async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show user their referral statistics."""
-    
-    user = update.effective_user
-    chat_id = str(update.effective_chat.id)
-    
-    db_user = db.get_user(chat_id)
-    
-    if not db_user:
-        await update.message.reply_text("Please /start first to join the program!")
-        return
-    
-    referrals = db_user.get('referrals', 0)
-    
-    message = f"""
-📊 **YOUR REFERRAL STATISTICS**
-
-👤 Name: {user.first_name}
-🔢 User ID: `{chat_id}`
-📅 Joined: {db_user.get('joined_at', 'N/A')[:10]}
-
-🎁 **Performance:**
-• Total Referrals: **{referrals}**
-• Reward Earned: {REFERRAL_REWARD if referrals > 0 else 'Not yet'}
-• Status: {db_user.get('status', 'active').upper()}
-
-🔗 Get your link: /referral
-"""
-    
-    await update.message.reply_text(message, parse_mode='Markdown')
-    db.update_last_active(chat_id)
-
-
-# ============================================
-# COMMAND: /broadcast - ADMIN ONLY - Send to X contacts
-# ============================================
-async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """ADMIN COMMAND: Send referral campaign to X users"""
-    
-    # Verify admin
-    if update.effective_chat.id != ADMIN_CHAT_ID:
-        await update.message.reply_text("⛔ This command is for admins only.")
-        return
-    
-    # Check if limit provided
-    if not context.args:
-        await update.message.reply_text(
-            "Usage: /broadcast [number]\n"
-            "Example: /broadcast 50 - sends to first 50 active users"
-        )
-        return
-    
-    try:
-        limit = int(context.args[0])
-    except ValueError:
-        await update.message.reply_text("❌ Please provide a valid number")
-        return
-    
-    # Get active users up to limit
-    users = db.get_active_users(limit=limit)
-    
-    if not users:
-        await update.message.reply_text("❌ No active users found")
-        return
-    
-    # Campaign message
-    campaign_message = """
-🎁 **DOUBLE REFERRAL WEEKEND** 🎁
-
-**For 48 hours only:**
-Refer 2 friends → Get **50% OFF** your next purchase!
-
-Your friends get 30% OFF!
-
-🔗 Get your referral link: /referral
-
-Share now and save big! 🚀
-"""
-    
-    # Send to users
-    sent_count = 0
-    failed_count = 0
-    
-    status_message = await update.message.reply_text(
-        f"📤 Sending campaign to {len(users)} users..."
-    )
-    
-    for user in users:
-        try:
-            await context.bot.send_message(
-                chat_id=int(user['chat_id']),
-                text=campaign_message,
-                parse_mode='Markdown'
-            )
-            db.log_message_sent(user['chat_id'], 'campaign')
-            sent_count += 1
-            
-            # Rate limiting - 1 second between messages
-            import asyncio
-            await asyncio.sleep(1)
-            
-        except Exception as e:
-            logger.error(f"Failed to send to {user['chat_id']}: {e}")
-            failed_count += 1
-    
-    # Update status
-    await status_message.edit_text(
-        f"✅ **Campaign Complete**\n\n"
-        f"📤 Target: {limit}\n"
-        f"✅ Sent: {sent_count}\n"
-        f"❌ Failed: {failed_count}\n"
-        f"📊 Total in DB: {db.data['total_users']}"
-    )
-
-
-# ============================================
-# COMMAND: /export - ADMIN ONLY - Get ALL contacts
-# ============================================
-async def export_contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """ADMIN COMMAND: Export all contacts as CSV"""
-    
-    # Verify admin
-    if update.effective_chat.id != ADMIN_CHAT_ID:
-        await update.message.reply_text("⛔ This command is for admins only.")
-        return
-    
-    import csv
-    import io
-    
-    all_users = db.get_all_users()
-    
-    if not all_users:
-        await update.message.reply_text("❌ No users in database")
-        return
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write headers
-    writer.writerow([
-        'chat_id', 'first_name', 'username', 'joined_date', 
-        'referred_by', 'referrals', 'last_active', 'status'
-    ])
-    
-    # Write user data
-    for chat_id, user in all_users.items():
-        writer.writerow([
-            chat_id,
-            user.get('first_name', ''),
-            user.get('username', ''),
-            user.get('joined_at', ''),
-            user.get('referred_by', ''),
-            user.get('referrals', 0),
-            user.get('last_active', ''),
-            user.get('status', '')
-        ])
-    
-    # Send file
-    output.seek(0)
-    await update.message.reply_document(
-        document=output.getvalue().encode('utf-8'),
-        filename=f'telegram_contacts_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        caption=f"✅ Exported {len(all_users)} contacts"
-    )
-
-
-# ============================================
-# Button callback handlers
-# ============================================
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle inline button presses"""
-    
-    query = update.callback_query
-    await query.answer()
-    
-    chat_id = str(update.effective_chat.id)
-    bot_username = (await context.bot.get_me()).username
-    db_user = db.get_user(chat_id)
-    referrals = db_user.get('referrals', 0) if db_user else 0
-    
-    if query.data == 'get_link':
-        referral_link = f"https://t.me/{bot_username}?start={chat_id}"
-        await query.edit_message_text(
-            f"🔗 **Your Referral Link**\n\n"
-            f"`{referral_link}`\n\n"
-            f"📊 **Current referrals:** {referrals}\n\n"
-            f"Copy and share this link!",
-            parse_mode='Markdown'
-        )
-    
-    elif query.data == 'stats':
-        message = f"""
-📊 **Your Stats**
-
-✅ Referrals: **{referrals}**
-🎁 Reward: {REFERRAL_REWARD if referrals > 0 else 'Not yet'}
-
-Share your link to earn! /referral
-"""
-        await query.edit_message_text(message, parse_mode='Markdown')
-    
-    elif query.data == 'how_it_works':
-        message = f"""
-🎁 **How It Works**
-
-1️⃣ Get your unique referral link
-2️⃣ Share with friends
-3️⃣ They join using your link
-4️⃣ You BOTH get {REFERRAL_REWARD}
-
-Unlimited referrals!
-
-🔗 Get your link: /referral
-"""
-        await query.edit_message_text(message, parse_mode='Markdown')
-    
-    elif query.data == 'copy_link':
-        await query.answer("Copy this link manually", show_alert=True)
-    
-    elif query.data == 'main_menu':
-        keyboard = [
-            [InlineKeyboardButton("🔗 GET YOUR REFERRAL LINK", callback_data='get_link')],
-            [InlineKeyboardButton("📊 MY STATS", callback_data='stats')],
-            [InlineKeyboardButton("🎁 HOW IT WORKS", callback_data='how_it_works')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "🏠 **Main Menu**\n\nChoose an option:",
-            parse_mode='Markdown',
-            reply_markup=reply_markup
-        )
-
-
-# ============================================
-# Error handler
-# ============================================
-async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Log errors"""
-    logger.error(f"Update {update} caused error {context.error}")
-
-
-# ============================================
-# Main function
-# ============================================
-def main():
-    """Start the bot"""
-    
-    # Create Application
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("referral", referral))
-    application.add_handler(CommandHandler("stats", stats))
-    application.add_handler(CommandHandler("broadcast", broadcast))
-    application.add_handler(CommandHandler("export", export_contacts))
-    
-    # Add button callback handler
-    application.add_handler(CallbackQueryHandler(button_callback))
-    
-    # Add error handler
-    application.add_error_handler(error_handler)
-    
-    # Start bot
-    print("🤖 Telegram Referral Bot is starting...")
-    print(f"✅ Admin chat ID: {ADMIN_CHAT_ID}")
-    print("✅ Database: users_database.json")
-    print("✅ Commands loaded: /start, /referral, /stats, /broadcast, /export")
-    print("🚀 Bot is running! Press Ctrl+C to stop.")
-    
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
-
-
-if __name__ == '__main__':
+
+import asyncio
+import logging
+import os
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from config import (
+    BOT_TOKEN, ADMIN_CHAT_ID, DB_PATH, BROADCAST_JOBS_DIR, BOT_MODE, ALLOWED_UPDATES,
+    UPDATE_QUEUE_SIZE, UPDATE_WORKERS, WELCOME_MESSAGE, REFERRAL_REWARD, FRIEND_REWARD,
+    API_BASE_URL, METRICS_ENABLED, UPDATE_DEDUP_SECONDS, START_DEDUP_SECONDS, DEDUP_MAX_KEYS,
+    DB_SERVER_SOCKET
+)
+from database import db
+from async_database import AsyncDatabase
+from broadcast_jobs import BroadcastJobs
+from exporter import export_users, parse_export_args
+from analytics import format_dashboard
+from webhook import run_webhook
+from dispatcher import ChatOrderedUpdateProcessor, UpdateQueue
+from idempotency import TTLCache
+from replies import EditTracker, Template
+from outbound import LatencyTracker, NotificationQueue, TrackedRequest
+import metrics
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+
+# Enable logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Handlers write through `store` so persistence runs off the event loop;
+# reads go straight to `db`. Broadcasts log their deliveries through it too.
+store = AsyncDatabase(db)
+broadcast_jobs = BroadcastJobs(BROADCAST_JOBS_DIR, store)
+# Outgoing Bot API calls: timed per endpoint, and messages to users other
+# than the one being answered are sent from a background queue
+api_latency = LatencyTracker()
+notifications = NotificationQueue()
+
+
+def storage_bytes():
+    """Size on disk of the database file(s), journals included."""
+    total = 0
+    for shard in getattr(db, 'shards', [db]):
+        for path in (shard.db_file, getattr(shard, 'journal_file', None)):
+            if path and os.path.exists(path):
+                total += os.path.getsize(path)
+    return total
+
+
+# Metrics (METRICS_ENABLED=1): every database method is timed, and these
+# are read on each scrape of the /metrics endpoint
+metrics_server = None
+if METRICS_ENABLED:
+    metrics.instrument(db)
+    metrics.gauge('bot_users', 'Registered users', lambda: db.user_count() if store.loaded else None)
+    metrics.gauge('bot_db_file_bytes', 'Size of the database file(s) on disk', storage_bytes)
+    metrics.gauge('bot_db_last_save_seconds', 'Duration of the latest snapshot save',
+                  lambda: getattr(db, 'last_save_seconds', 0.0))
+    metrics.gauge('bot_notifications_pending', 'Notifications waiting to be sent',
+                  notifications.pending)
+    metrics_server = metrics.MetricsServer()
+
+
+# ============================================
+# Bot identity + link/keyboard helpers
+# ============================================
+class BotIdentity:
+    """The bot's username, resolved once instead of a get_me() per update."""
+
+    def __init__(self):
+        self.username = None
+        self._link_prefix = None
+        self.welcome = None
+
+    async def refresh(self, bot):
+        """Fetch the username from Telegram (one getMe call) and cache it."""
+        me = await bot.get_me()
+        self.username = me.username
+        self._link_prefix = f"https://t.me/{me.username}?start="
+        self.welcome = WELCOME_TEMPLATE.bind(bot_username=me.username)
+        logger.info(f"🤖 Running as @{me.username}")
+
+    async def ensure(self, bot):
+        if self.username is None:
+            await self.refresh(bot)
+        return self.username
+
+    def referral_link(self, chat_id):
+        return self._link_prefix + chat_id
+
+
+bot_identity = BotIdentity()
+
+# Static keyboards are built once and reused for every reply
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔗 GET YOUR REFERRAL LINK", callback_data='get_link')],
+    [InlineKeyboardButton("📊 MY STATS", callback_data='stats')],
+    [InlineKeyboardButton("🎁 HOW IT WORKS", callback_data='how_it_works')]
+])
+
+SHARE_TEXT = f"Join%20me%20on%20this%20referral%20program%20for%20{REFERRAL_REWARD.replace('%', '%25')}"
+COPY_LINK_ROW = (InlineKeyboardButton("📋 COPY LINK", callback_data='copy_link'),)
+BACK_ROW = (InlineKeyboardButton("◀️ BACK", callback_data='main_menu'),)
+
+
+@lru_cache(maxsize=4096)
+def share_keyboard(referral_link):
+    # Only the share button is per user; the keyboards are immutable, so
+    # recent ones are reused as is
+    share = InlineKeyboardButton("📤 SHARE LINK", url=f"https://t.me/share/url?url={referral_link}&text={SHARE_TEXT}")
+    return InlineKeyboardMarkup(((share,), COPY_LINK_ROW, BACK_ROW))
+
+
+# WELCOME_MESSAGE is a runtime format string: compile it once (the bot
+# username is bound in BotIdentity.refresh) instead of str.format per /start.
+# Texts written in code stay f-strings, which Python already compiles;
+# the ones without per-user parts are built just once.
+WELCOME_TEMPLATE = Template(WELCOME_MESSAGE, reward=REFERRAL_REWARD)
+
+HOW_IT_WORKS_TEXT = f"""
+🎁 **How It Works**
+
+1️⃣ Get your unique referral link
+2️⃣ Share with friends
+3️⃣ They join using your link
+4️⃣ You BOTH get {REFERRAL_REWARD}
+
+Unlimited referrals!
+
+🔗 Get your link: /referral
+"""
+
+MAIN_MENU_TEXT = "🏠 **Main Menu**\n\nChoose an option:"
+
+# Button taps that would re-send what the message already shows are skipped
+edits = EditTracker()
+# (chat_id, referrer) of recent /start commands, to drop double taps
+recent_starts = TTLCache(DEDUP_MAX_KEYS, START_DEDUP_SECONDS)
+
+
+
+# ============================================
+# COMMAND: /start - New users + Referral tracking
+# ============================================
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /start command. This is your opt-in AND referral tracker."""
+    
+    chat_id = str(update.effective_chat.id)
+    
+    # Check if this is a referral (user clicked referral link)
+    referred_by = None
+    if context.args and context.args[0] != chat_id:
+        # The argument is the referrer's chat_id (your own link doesn't count)
+        referred_by = context.args[0]
+    
+    # A double-tapped start link: the first /start already answered
+    key = (chat_id, referred_by)
+    if not recent_starts.add(key):
+        return
+    try:
+        await _welcome(update, context, chat_id, referred_by)
+    except BaseException:
+        # It failed: the user's next tap should run it again, not be dropped
+        recent_starts.discard(key)
+        raise
+
+
+async def _welcome(update, context, chat_id, referred_by):
+    """Register the user (crediting the referrer) and send the welcome."""
+    user = update.effective_user
+    
+    # Returning users: their referral was counted (or not) when they joined,
+    # so they skip registration and nothing is written unless their name
+    # changed. New users are added; `created` is False if a concurrent
+    # /start got there first, and that one counted the referral.
+    db_user = await store.read(db.get_user, chat_id)
+    created = False
+    if db_user is None:
+        if referred_by:
+            logger.info(f"➕ Referral detected! {chat_id} referred by {referred_by}")
+        db_user, created = await store.register_user(
+            chat_id=chat_id,
+            first_name=user.first_name,
+            username=user.username,
+            referred_by=referred_by
+        )
+    elif (db_user.get('first_name'), db_user.get('username')) != (user.first_name, user.username):
+        await store.update_profile(chat_id, user.first_name, user.username)
+    
+    referrer = await store.read(db.get_user, referred_by) if created and referred_by else None
+    referrer_count = referrer['referrals'] if referrer else 0
+    
+    # Bot username for the referral link in the welcome message
+    await bot_identity.ensure(context.bot)
+    
+    # Personalize welcome message
+    welcome = bot_identity.welcome.render(name=user.first_name, chat_id=chat_id)
+    
+    # Send welcome message
+    await update.message.reply_text(
+        welcome,
+        parse_mode='Markdown',
+        reply_markup=MAIN_MENU_KEYBOARD
+    )
+    
+    # If user was referred, notify the referrer (queued, sent in the background)
+    if referrer:
+        notifications.notify(
+            int(referred_by),
+            f"🎉 **Congratulations!**\n\n"
+            f"{user.first_name} joined using your referral link!\n"
+            f"You now have {referrer_count} referrals.\n\n"
+            f"Your {REFERRAL_REWARD} is ready! 🎁",
+            parse_mode='Markdown'
+        )
+    
+    # Log the welcome once, when the user joined
+    if created:
+        await store.log_message_sent(chat_id, 'welcome')
+
+
+# ============================================
+# COMMAND: /referral - Get referral link
+# ============================================
+async def referral(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send user their personalized referral link."""
+    
+    user = update.effective_user
+    chat_id = str(update.effective_chat.id)
+    
+    # Update last active
+    await store.update_last_active(chat_id)
+    
+    # Create referral link
+    await bot_identity.ensure(context.bot)
+    referral_link = bot_identity.referral_link(chat_id)
+    
+    # Get user's current referrals
+    db_user = await store.read(db.get_user, chat_id)
+    referrals = db_user.get('referrals', 0) if db_user else 0
+    
+    # Create share buttons
+    reply_markup = share_keyboard(referral_link)
+    
+    message = f"""
+🔗 **YOUR PERSONAL REFERRAL LINK**
+
+`{referral_link}`
+
+📊 **Your Stats:**
+• Referrals: **{referrals}**
+• Reward: {REFERRAL_REWARD if referrals > 0 else 'Not yet'}
+
+Share this link with friends!
+When they join, you BOTH get rewards.
+"""
+    
+    await update.message.reply_text(
+        message,
+        parse_mode='Markdown',
+        reply_markup=reply_markup,
+        disable_web_page_preview=True
+    )
+    
+    await store.log_message_sent(chat_id, 'referral_link')
+
+
+# ============================================
+# COMMAND: /stats - View personal stats
+# ============================================
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show user their referral statistics."""
+    
+    user = update.effective_user
+    chat_id = str(update.effective_chat.id)
+    
+    db_user = await store.read(db.get_user, chat_id)
+    
+    if not db_user:
+        await update.message.reply_text("Please /start first to join the program!")
+        return
+    
+    referrals = db_user.get('referrals', 0)
+    
+    message = f"""
+📊 **YOUR REFERRAL STATISTICS**
+
+👤 Name: {user.first_name}
+🔢 User ID: `{chat_id}`
+📅 Joined: {db_user.get('joined_at', 'N/A')[:10]}
+
+🎁 **Performance:**
+• Total Referrals: **{referrals}**
+• Reward Earned: {REFERRAL_REWARD if referrals > 0 else 'Not yet'}
+• Status: {db_user.get('status', 'active').upper()}
+
+🔗 Get your link: /referral
+"""
+    
+    await update.message.reply_text(message, parse_mode='Markdown')
+    await store.update_last_active(chat_id)
+
+
+# ============================================
+# COMMAND: /leaderboard - Top referrers
+# ============================================
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the top referrers."""
+    
+    top = await store.read(db.get_leaderboard, limit=10)
+    
+    if not top:
+        await update.message.reply_text("No referrals yet. Be the first! /referral")
+        return
+    
+    medals = ['🥇', '🥈', '🥉']
+    lines = []
+    for position, (db_user, count) in enumerate(top, 1):
+        marker = medals[position - 1] if position <= len(medals) else f"{position}."
+        name = db_user.get('first_name') or 'Anonymous' if db_user else 'Anonymous'
+        lines.append(f"{marker} {name} — **{count}**")
+    
+    message = "🏆 **TOP REFERRERS**\n\n" + "\n".join(lines) + "\n\n🔗 Get your link: /referral"
+    await update.message.reply_text(message, parse_mode='Markdown')
+
+
+# ============================================
+# COMMAND: /downline - Your referral tree
+# ============================================
+async def downline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show who the user referred and how big their whole downline is."""
+    
+    chat_id = str(update.effective_chat.id)
+    
+    if not await store.read(db.get_user, chat_id):
+        await update.message.reply_text("Please /start first to join the program!")
+        return
+    
+    tree = await store.read(db.get_downline, chat_id)
+    direct = tree['direct']
+    names = []
+    for referral_id in direct[-5:]:
+        referred = await store.read(db.get_user, referral_id)
+        names.append(f"• {referred.get('first_name') or 'Anonymous' if referred else referral_id}")
+    
+    message = f"""
+🌳 **YOUR DOWNLINE**
+
+👥 Direct referrals: **{len(direct)}**
+🌐 Whole downline (all levels): **{tree['total']}**
+🏆 Leaderboard rank: {f"#{tree['rank']}" if tree['rank'] else 'Not ranked yet'}
+"""
+    if names:
+        message += "\n🆕 **Latest referrals:**\n" + "\n".join(reversed(names)) + "\n"
+    
+    await update.message.reply_text(message, parse_mode='Markdown')
+
+
+# ============================================
+# COMMAND: /broadcast - ADMIN ONLY - Send to X contacts
+# ============================================
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ADMIN COMMAND: Send referral campaign to X users"""
+    
+    # Verify admin
+    if update.effective_chat.id != ADMIN_CHAT_ID:
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    
+    # Check if limit provided
+    if not context.args:
+        await update.message.reply_text(
+            "Usage: /broadcast [number] [days | segment]\n"
+            "Example: /broadcast 50 - sends to the 50 most recently active users\n"
+            "Example: /broadcast 500 7 - up to 500 users active in the last 7 days\n"
+            "Example: /broadcast 1000 status=active joined<7d referrals>=1 campaign=never\n"
+            "Segment fields: status, referrals, joined, active, campaign; "
+            "combine with and/or/not and ( )"
+        )
+        return
+    
+    try:
+        limit = int(context.args[0])
+    except ValueError:
+        await update.message.reply_text("❌ Please provide a valid number")
+        return
+    
+    options = context.args[1:]
+    if len(options) == 1 and options[0].isdigit():
+        # Get active users up to limit, within the window
+        users = await store.read(db.get_active_users, limit=limit, within_days=int(options[0]))
+        target, recipients = len(users), [user['chat_id'] for user in users]
+    elif options:
+        # Segment: matched on precomputed indexes, chat ids streamed into the job
+        expression = ' '.join(options)
+        try:
+            # The first segment query builds the indexes; keep that off the loop
+            target = min(limit, await asyncio.to_thread(db.count_segment, expression))
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        recipients = islice(db.iter_segment(expression), limit)
+    else:
+        # Get active users up to limit
+        users = await store.read(db.get_active_users, limit=limit)
+        target, recipients = len(users), [user['chat_id'] for user in users]
+    
+    if not target:
+        await update.message.reply_text("❌ No active users found")
+        return
+    
+    # Campaign message
+    campaign_message = """
+🎁 **DOUBLE REFERRAL WEEKEND** 🎁
+
+**For 48 hours only:**
+Refer 2 friends → Get **50% OFF** your next purchase!
+
+Your friends get 30% OFF!
+
+🔗 Get your referral link: /referral
+
+Share now and save big! 🚀
+"""
+    
+    status_message = await update.message.reply_text(
+        f"📤 Sending campaign to {target} users..."
+    )
+    
+    # Persist the campaign as a job and send it in the background; the
+    # status message above is edited as it progresses
+    job = await broadcast_jobs.create(
+        recipients,
+        campaign_message,
+        message_type='campaign',
+        send_kwargs={'parse_mode': 'Markdown'},
+        status_chat_id=status_message.chat_id,
+        status_message_id=status_message.message_id
+    )
+    broadcast_jobs.schedule(context.application, job['id'])
+    logger.info(f"📤 Broadcast #{job['id']} queued for {len(job['recipients'])} users")
+
+
+# ============================================
+# COMMAND: /broadcast_status - ADMIN ONLY - Progress of a campaign
+# ============================================
+async def broadcast_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ADMIN COMMAND: Show progress of a broadcast (latest if no id given)"""
+    
+    # Verify admin
+    if update.effective_chat.id != ADMIN_CHAT_ID:
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    
+    job = await (broadcast_jobs.get(context.args[0]) if context.args else broadcast_jobs.latest())
+    
+    if not job:
+        await update.message.reply_text("❌ No such broadcast")
+        return
+    
+    await update.message.reply_text(await broadcast_jobs.format_status(job), parse_mode='Markdown')
+
+
+# ============================================
+# COMMAND: /broadcast_cancel - ADMIN ONLY - Stop a running campaign
+# ============================================
+async def broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ADMIN COMMAND: Cancel a running broadcast"""
+    
+    # Verify admin
+    if update.effective_chat.id != ADMIN_CHAT_ID:
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    
+    if not context.args:
+        await update.message.reply_text(
+            "Usage: /broadcast_cancel [id]\n"
+            "See /broadcast_status for the latest campaign id"
+        )
+        return
+    
+    if await broadcast_jobs.cancel(context.args[0]):
+        await update.message.reply_text(f"🛑 Broadcast #{context.args[0]} cancelled")
+    else:
+        await update.message.reply_text("❌ No running broadcast with that id")
+
+
+# ============================================
+# COMMAND: /dashboard - ADMIN ONLY - Funnel metrics
+# ============================================
+async def dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ADMIN COMMAND: Daily signups, activity and delivery from the rollups"""
+    
+    # Verify admin
+    if update.effective_chat.id != ADMIN_CHAT_ID:
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    
+    try:
+        days = int(context.args[0]) if context.args else 7
+    except ValueError:
+        await update.message.reply_text("Usage: /dashboard [days]\nExample: /dashboard 30")
+        return
+    days = max(1, min(days, 90))
+    
+    rows = await store.read(db.get_daily_stats, days)
+    user_count = await store.read(db.user_count)
+    activity = await store.read(db.activity_summary)
+    await update.message.reply_text(
+        format_dashboard(rows, user_count, activity), parse_mode='Markdown'
+    )
+
+
+# ============================================
+# COMMAND: /apistats - ADMIN ONLY - Bot API latency
+# ============================================
+async def api_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ADMIN COMMAND: Latency per Bot API method and the notification queue"""
+    
+    # Verify admin
+    if update.effective_chat.id != ADMIN_CHAT_ID:
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    
+    message = (
+        "📡 **BOT API LATENCY**\n\n"
+        + api_latency.format_summary()
+        + f"\n\n🔔 Notifications: {notifications.sent} sent, {notifications.failed} failed, "
+        f"{notifications.retried} retried, {notifications.dropped} dropped, "
+        f"{notifications.pending()} queued"
+    )
+    await update.message.reply_text(message, parse_mode='Markdown')
+
+
+# ============================================
+# COMMAND: /export - ADMIN ONLY - Get ALL contacts
+# ============================================
+async def export_contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ADMIN COMMAND: Export contacts as CSV, optionally filtered"""
+    
+    # Verify admin
+    if update.effective_chat.id != ADMIN_CHAT_ID:
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    
+    if not await store.read(db.user_count):
+        await update.message.reply_text("❌ No users in database")
+        return
+    
+    try:
+        options = parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ {e}\n\n"
+            "Usage: /export [status=active] [joined_after=YYYY-MM-DD] "
+            "[has_referrals] [columns=chat_id,username,...] [gzip]"
+        )
+        return
+    
+    # Stream rows into a spooled temp file instead of building the CSV in
+    # memory; the scan (and gzip) runs in a thread, off the event loop
+    output, count = await asyncio.to_thread(export_users, db.iter_users(), **options)
+    
+    # Send file; an explicit InputFile streams the spool as is (PTB would
+    # otherwise read it whole and guess a name from it, and an in-memory
+    # spool has none)
+    extension = 'csv.gz' if options.get('compress') else 'csv'
+    filename = f'telegram_contacts_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    with output:
+        await update.message.reply_document(
+            document=InputFile(output, filename=filename, read_file_handle=False),
+            caption=f"✅ Exported {count} contacts"
+        )
+
+
+# ============================================
+# Button callback handlers
+# ============================================
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle inline button presses"""
+    
+    query = update.callback_query
+    await query.answer()
+    
+    chat_id = str(update.effective_chat.id)
+    await bot_identity.ensure(context.bot)
+    db_user = await store.read(db.get_user, chat_id)
+    referrals = db_user.get('referrals', 0) if db_user else 0
+    
+    if query.data == 'get_link':
+        referral_link = bot_identity.referral_link(chat_id)
+        await edits.edit(
+            query,
+            f"🔗 **Your Referral Link**\n\n"
+            f"`{referral_link}`\n\n"
+            f"📊 **Current referrals:** {referrals}\n\n"
+            f"Copy and share this link!",
+            parse_mode='Markdown'
+        )
+    
+    elif query.data == 'stats':
+        message = f"""
+📊 **Your Stats**
+
+✅ Referrals: **{referrals}**
+🎁 Reward: {REFERRAL_REWARD if referrals > 0 else 'Not yet'}
+
+Share your link to earn! /referral
+"""
+        await edits.edit(query, message, parse_mode='Markdown')
+    
+    elif query.data == 'how_it_works':
+        await edits.edit(query, HOW_IT_WORKS_TEXT, parse_mode='Markdown')
+    
+    elif query.data == 'copy_link':
+        await query.answer("Copy this link manually", show_alert=True)
+    
+    elif query.data == 'main_menu':
+        await edits.edit(query, MAIN_MENU_TEXT, parse_mode='Markdown', reply_markup=MAIN_MENU_KEYBOARD)
+
+
+# ============================================
+# Error handler
+# ============================================
+async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Log errors"""
+    logger.error(f"Update {update} caused error {context.error}")
+    # A redelivery of the failed update should run, not be dropped as seen
+    processor = context.application.update_processor
+    if isinstance(processor, ChatOrderedUpdateProcessor):
+        processor.forget(update)
+
+
+# ============================================
+# Startup hook
+# ============================================
+async def post_init(application: Application):
+    """Cache the bot identity and resume broadcasts interrupted by a restart"""
+    await bot_identity.refresh(application.bot)
+    notifications.start(application.bot)
+    if metrics_server is not None:
+        await metrics_server.start()
+    
+    # With several workers on one jobs directory, each job resumes in one of them
+    for job in await broadcast_jobs.claim_unfinished():
+        logger.info(f"🔁 Resuming broadcast #{job['id']}")
+        broadcast_jobs.schedule(application, job['id'])
+
+
+async def post_stop(application: Application):
+    """Let queued notifications go out before the HTTP client is closed"""
+    await notifications.stop()
+    if metrics_server is not None:
+        await metrics_server.stop()
+
+
+# ============================================
+# Main function
+# ============================================
+def build_application():
+    """The Application with every handler registered (also used by benchmarks/load_test.py)"""
+    
+    # Updates from different chats run concurrently, one chat's stay in order,
+    # and an update_id that was already processed is dropped
+    processor = ChatOrderedUpdateProcessor(
+        UPDATE_WORKERS, seen=TTLCache(DEDUP_MAX_KEYS, UPDATE_DEDUP_SECONDS)
+    )
+
+    # Create Application; a bounded update queue, drained only while a worker
+    # is free, gives backpressure when updates arrive faster than
+    # UPDATE_WORKERS can process them
+    # Outgoing calls share a tuned keep-alive pool that records latencies
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(API_BASE_URL)
+        .request(TrackedRequest(api_latency))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .update_queue(UpdateQueue(processor, maxsize=UPDATE_QUEUE_SIZE))
+        .concurrent_updates(processor)
+        .build()
+    )
+    
+    # Add command handlers (timed when metrics are enabled)
+    application.add_handler(CommandHandler("start", metrics.timed_handler(start)))
+    application.add_handler(CommandHandler("referral", metrics.timed_handler(referral)))
+    application.add_handler(CommandHandler("stats", metrics.timed_handler(stats)))
+    application.add_handler(CommandHandler("leaderboard", metrics.timed_handler(leaderboard)))
+    application.add_handler(CommandHandler("downline", metrics.timed_handler(downline)))
+    application.add_handler(CommandHandler("broadcast", metrics.timed_handler(broadcast)))
+    application.add_handler(CommandHandler("broadcast_status", metrics.timed_handler(broadcast_status)))
+    application.add_handler(CommandHandler("broadcast_cancel", metrics.timed_handler(broadcast_cancel)))
+    application.add_handler(CommandHandler("dashboard", metrics.timed_handler(dashboard)))
+    application.add_handler(CommandHandler("export", metrics.timed_handler(export_contacts)))
+    application.add_handler(CommandHandler("apistats", metrics.timed_handler(api_stats)))
+    
+    # Add button callback handler
+    application.add_handler(CallbackQueryHandler(metrics.timed_handler(button_callback)))
+    
+    # Add error handler
+    application.add_error_handler(error_handler)
+    return application
+
+
+def main():
+    """Start the bot"""
+    
+    application = build_application()
+    
+    # Start bot
+    print("🤖 Telegram Referral Bot is starting...")
+    print(f"✅ Admin chat ID: {ADMIN_CHAT_ID}")
+    if DB_SERVER_SOCKET:
+        print(f"✅ Database: storage server on {DB_SERVER_SOCKET}")
+    else:
+        print(f"✅ Database: {DB_PATH}")
+    print("✅ Commands loaded: /start, /referral, /stats, /leaderboard, /downline, /broadcast, /broadcast_status, /broadcast_cancel, /dashboard, /export, /apistats")
+    print(f"✅ Mode: {BOT_MODE} ({UPDATE_WORKERS} update workers)")
+    if METRICS_ENABLED:
+        print(f"✅ Metrics: http://{metrics_server.listen}:{metrics_server.port}/metrics")
+    print("🚀 Bot is running! Press Ctrl+C to stop.")
+    
+    try:
+        if BOT_MODE == 'webhook':
+            asyncio.run(run_webhook(application))
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
+    finally:
+        # Write out anything the write-behind flusher hasn't saved yet
+        broadcast_jobs.close()
+        store.close()
+
+
+if __name__ == '__main__':
     main()
\ No newline at end of file
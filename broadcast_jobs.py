@@ -0,0 +1,406 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from broadcaster import Broadcaster
+from config import BROADCAST_STATUS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastJobs:
+    """Persisted, resumable broadcast campaigns.
+
+    Each job lives in `jobs_dir` as `<id>.json` (text, cursor, counters,
+    status message to update), `<id>.recipients` (one chat id per line,
+    written once when the job is created) and `<id>.log`, an append-only
+    list of `<chat_id> sent|failed` lines written as each delivery settles.
+    A job still marked running at startup is resumed, skipping every chat
+    already in its log.
+
+    Several bot workers may share `jobs_dir`. A job is run by whichever
+    process holds an exclusive flock on its `<id>.lock`; creating that
+    file (O_EXCL) is also how a new job reserves its id, so two workers
+    never pick the same one. Only the owner resumes a job, and it reloads
+    the job's files when it takes it over. Cancelling a job another worker
+    runs leaves an `<id>.cancel` marker that its owner checks at every
+    progress report. Jobs this process doesn't own are read from their
+    files whenever they are asked for, so status and cancel also see jobs
+    other workers created after this one started.
+
+    `db` is the AsyncDatabase handlers use. Job files are written off the
+    event loop too, in order, by one writer thread, so a checkpoint never
+    stalls other updates and the last one written always wins.
+    """
+
+    def __init__(self, jobs_dir, db, status_interval=BROADCAST_STATUS_INTERVAL):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.db = db
+        self.status_interval = status_interval
+        self.jobs = {}
+        self._running = {}
+        # job id -> fd of its lock file, for the jobs this process owns
+        self._locks = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jobs-writer')
+        self._load()
+
+    def _meta_path(self, job_id):
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _log_path(self, job_id):
+        return self.jobs_dir / f"{job_id}.log"
+
+    def _recipients_path(self, job_id):
+        return self.jobs_dir / f"{job_id}.recipients"
+
+    def _lock_path(self, job_id):
+        return self.jobs_dir / f"{job_id}.lock"
+
+    def _cancel_path(self, job_id):
+        return self.jobs_dir / f"{job_id}.cancel"
+
+    def _load(self):
+        for path in self.jobs_dir.glob('*.json'):
+            job = self._read_job(path)
+            if job is not None:
+                self.jobs[job['id']] = job
+
+    def _read_job(self, path):
+        """A job as stored in its files, or None if they can't be used."""
+        try:
+            with open(path, 'r') as f:
+                job = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.error(f"Skipping unreadable broadcast job {path}")
+            return None
+        if 'recipients' in job:
+            # Written before recipients had a file of their own
+            self._write_recipients(job['id'], job['recipients'])
+        else:
+            try:
+                job['recipients'] = self._read_recipients(job['id'])
+            except FileNotFoundError:
+                logger.error(f"Skipping broadcast job {path}: its recipients file is missing")
+                return None
+        job['delivery'] = self._read_log(job['id'])
+        # The log is ahead of the last checkpoint after a crash
+        states = list(job['delivery'].values())
+        job['sent'] = states.count('sent')
+        job['failed'] = states.count('failed')
+        if job['status'] == 'running' and self._cancel_path(job['id']).exists():
+            # Cancelled while its owner was going down
+            job['status'] = 'cancelled'
+            job['finished_at'] = str(datetime.now())
+        return job
+
+    def _lock(self, job_id, new=False):
+        """Take ownership of a job. False if another process holds it.
+
+        With `new`, the lock file must not exist yet (FileExistsError if it
+        does), which reserves `job_id` for a job being created.
+        """
+        flags = os.O_RDWR | os.O_CREAT | (os.O_EXCL if new else 0)
+        fd = os.open(self._lock_path(job_id), flags, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._locks[job_id] = fd
+        return True
+
+    def _unlock(self, job_id):
+        fd = self._locks.pop(job_id, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _reserve_id(self):
+        """A new job id, locked by this process."""
+        taken = [int(path.stem) for path in self.jobs_dir.glob('*.lock') if path.stem.isdigit()]
+        taken += [int(path.stem) for path in self.jobs_dir.glob('*.json') if path.stem.isdigit()]
+        job_id = max(taken, default=0) + 1
+        while True:
+            try:
+                if self._lock(str(job_id), new=True):
+                    return str(job_id)
+            except FileExistsError:
+                pass  # another worker took it just now
+            job_id += 1
+
+    async def _acquire(self, job_id):
+        """Own a running job and reload it from disk, or None if that's not possible.
+
+        Another worker may have run it since this process loaded it; if it
+        is no longer running, the fresh copy replaces the stale one.
+        """
+        if not await self._write(self._lock, job_id):
+            return None
+        job = await self._write(self._read_job, self._meta_path(job_id))
+        if job is not None:
+            self.jobs[job_id] = job
+        if job is None or job['status'] != 'running':
+            self._unlock(job_id)
+            return None
+        return job
+
+    def _read_log(self, job_id):
+        delivery = {}
+        path = self._log_path(job_id)
+        if path.exists():
+            with open(path, 'r') as f:
+                for line in f:
+                    # A torn last line (crash mid-write) counts as not delivered
+                    if not line.endswith('\n'):
+                        break
+                    chat_id, state = line.split()
+                    delivery[chat_id] = state
+        return delivery
+
+    def _read_recipients(self, job_id):
+        with open(self._recipients_path(job_id), 'r') as f:
+            return f.read().split()
+
+    def _write_recipients(self, job_id, recipients):
+        path = self._recipients_path(job_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"{chat_id}\n" for chat_id in recipients)
+        os.replace(tmp_path, path)
+
+    def _meta(self, job):
+        return {k: v for k, v in job.items() if k not in ('delivery', 'recipients')}
+
+    def _write_meta(self, job_id, meta):
+        path = self._meta_path(job_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    async def _write(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._writer, method, *args)
+
+    async def _save(self, job):
+        # The snapshot is taken on the loop, where the job is updated
+        await self._write(self._write_meta, job['id'], self._meta(job))
+
+    async def create(self, recipients, text, message_type='campaign', send_kwargs=None,
+                     status_chat_id=None, status_message_id=None):
+        """Persist a new running job. `recipients` may be lazy; it is read off the loop."""
+        recipients = await asyncio.to_thread(lambda: [str(chat_id) for chat_id in recipients])
+        job_id = await self._write(self._reserve_id)
+        job = {
+            'id': job_id,
+            'status': 'running',
+            'created_at': str(datetime.now()),
+            'finished_at': None,
+            'message_type': message_type,
+            'text': text,
+            'send_kwargs': send_kwargs or {},
+            'recipients': recipients,
+            'cursor': 0,
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'status_chat_id': status_chat_id,
+            'status_message_id': status_message_id,
+            'delivery': {}
+        }
+        self.jobs[job_id] = job
+        # Recipients first: a job file without them is skipped on load
+        await self._write(self._write_recipients, job_id, recipients)
+        await self._save(job)
+        return job
+
+    async def get(self, job_id):
+        """A job by id, or None.
+
+        Jobs this process owns are served from memory. Any other job is
+        re-read from its files, since another worker may have created it
+        or moved it on since this process last looked.
+        """
+        job_id = str(job_id)
+        if job_id in self._locks:
+            return self.jobs.get(job_id)
+        if not job_id.isdigit():
+            return None
+        job = await self._write(self._read_stored_job, job_id)
+        if job is not None:
+            self.jobs[job_id] = job
+        return job
+
+    def _read_stored_job(self, job_id):
+        path = self._meta_path(job_id)
+        return self._read_job(path) if path.exists() else None
+
+    async def latest(self):
+        """The job with the highest id, whichever worker created it."""
+        job_ids = await self._write(
+            lambda: [int(path.stem) for path in self.jobs_dir.glob('*.json') if path.stem.isdigit()]
+        )
+        if not job_ids:
+            return None
+        return await self.get(max(job_ids))
+
+    def unfinished(self):
+        return [job for job in self.jobs.values() if job['status'] == 'running']
+
+    async def claim_unfinished(self):
+        """The running jobs this process now owns, to resume; other workers' stay theirs."""
+        claimed = []
+        for job in self.unfinished():
+            if job['id'] in self._locks:
+                claimed.append(job)
+                continue
+            job = await self._acquire(job['id'])
+            if job is not None:
+                claimed.append(job)
+        return claimed
+
+    async def cancel(self, job_id):
+        """Stop a running job. Returns False if there is nothing to cancel."""
+        job = await self.get(job_id)
+        if not job or job['status'] != 'running':
+            return False
+        if job['id'] not in self._locks:
+            owned = await self._acquire(job['id'])
+            if owned is None:
+                if self.jobs[job['id']]['status'] != 'running':
+                    return False  # it finished in another worker
+                # Another worker runs it and stops at its next progress report
+                await self._write(self._cancel_path(job['id']).touch)
+                return True
+            job = owned
+        job['status'] = 'cancelled'
+        job['finished_at'] = str(datetime.now())
+        await self._save(job)
+        task = self._running.get(job['id'])
+        if task:
+            task.cancel()
+        else:
+            self._unlock(job['id'])
+        return True
+
+    def close(self):
+        """Finish pending writes and give up this process's jobs."""
+        self._writer.shutdown(wait=True)
+        for job_id in list(self._locks):
+            self._unlock(job_id)
+
+    def schedule(self, application, job_id):
+        """Run a job in the background on the application's job queue."""
+        if application.job_queue:
+            application.job_queue.run_once(self._job_callback, 0, data=job_id, name=f"broadcast-{job_id}")
+        else:
+            application.create_task(self.run(application.bot, job_id))
+
+    async def _job_callback(self, context):
+        await self.run(context.bot, context.job.data)
+
+    def _advance_cursor(self, job):
+        recipients, delivery = job['recipients'], job['delivery']
+        cursor = job['cursor']
+        while cursor < len(recipients) and recipients[cursor] in delivery:
+            cursor += 1
+        job['cursor'] = cursor
+
+    async def format_status(self, job):
+        titles = {
+            'running': f"📤 **Campaign #{job['id']} in progress**",
+            'completed': f"✅ **Campaign #{job['id']} Complete**",
+            'cancelled': f"🛑 **Campaign #{job['id']} Cancelled**",
+        }
+        pending = len(job['recipients']) - job['sent'] - job['failed']
+        return (
+            f"{titles[job['status']]}\n\n"
+            f"📤 Target: {len(job['recipients'])}\n"
+            f"✅ Sent: {job['sent']}\n"
+            f"❌ Failed: {job['failed']}\n"
+            f"🔁 Retried: {job['retried']}\n"
+            f"⏳ Pending: {pending}\n"
+            f"📊 Total in DB: {await self.db.read(self.db.user_count)}"
+        )
+
+    async def _update_status_message(self, bot, job, last_text=None):
+        """Edit the admin's status message; skip the call if nothing changed."""
+        text = await self.format_status(job)
+        if text == last_text or not job['status_message_id']:
+            return last_text
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=job['status_chat_id'],
+                message_id=job['status_message_id'],
+                parse_mode='Markdown'
+            )
+        except Exception as e:
+            logger.warning(f"Could not update status for broadcast #{job['id']}: {e}")
+        return text
+
+    async def _report_progress(self, bot, job):
+        last_text = None
+        while True:
+            await asyncio.sleep(self.status_interval)
+            if await self._write(self._cancel_path(job['id']).exists):
+                # Cancelled from another worker
+                job['status'] = 'cancelled'
+                job['finished_at'] = str(datetime.now())
+                self._running[job['id']].cancel()
+                return
+            self._advance_cursor(job)
+            await self._save(job)
+            last_text = await self._update_status_message(bot, job, last_text)
+
+    async def run(self, bot, job_id):
+        job = await self.get(job_id)
+        if not job or job['status'] != 'running' or job['id'] in self._running:
+            return
+        if job['id'] not in self._locks:
+            job = await self._acquire(job['id'])
+            if job is None:
+                return  # another worker runs it, or it is done
+        self._running[job['id']] = asyncio.current_task()
+        delivery = job['delivery']
+        # Handed to the broadcaster lazily, so a big audience isn't copied
+        pending = (c for c in islice(job['recipients'], job['cursor'], None) if c not in delivery)
+        if delivery:
+            left = len(job['recipients']) - len(delivery)
+            logger.info(f"Resuming broadcast #{job['id']}: {left} recipients left")
+
+        # Line-buffered so every settled delivery is on disk before the next send
+        log = open(self._log_path(job['id']), 'a', buffering=1)
+
+        def on_result(chat_id, ok):
+            state = 'sent' if ok else 'failed'
+            delivery[chat_id] = state
+            job[state] += 1
+            log.write(f"{chat_id} {state}\n")
+
+        progress = asyncio.create_task(self._report_progress(bot, job))
+        try:
+            result = await Broadcaster(bot, self.db).run(
+                pending, job['text'], job['message_type'], on_result=on_result, **job['send_kwargs']
+            )
+            job['retried'] += result.retried
+            job['status'] = 'completed'
+            job['finished_at'] = str(datetime.now())
+        except asyncio.CancelledError:
+            # Shutdown leaves the job 'running' so it resumes on the next start;
+            # only an explicit cancel() is swallowed here.
+            if job['status'] != 'cancelled':
+                raise
+        finally:
+            progress.cancel()
+            log.close()
+            self._advance_cursor(job)
+            await self._save(job)
+            self._running.pop(job['id'], None)
+            self._unlock(job['id'])
+        await self._update_status_message(bot, job)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+
+from config import (
+    BROADCAST_RATE, BROADCAST_PER_CHAT_INTERVAL, BROADCAST_WORKERS,
+    BROADCAST_BATCH_SIZE, BROADCAST_MAX_RETRIES
+)
+from metrics import BROADCAST_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Hand out no tokens for `seconds` (e.g. after a 429), then restart empty."""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+
+
+class Broadcaster:
+    """Send one message to many chats through a rate-limited worker pool.
+
+    A global token bucket keeps the whole pool under Telegram's bot-wide
+    limit, and a chat is never messaged twice within `per_chat_interval`.
+    `RetryAfter` pauses the bucket for the requested time and the chat is
+    tried again once it resumes. Delivered chats are logged in the database in batches, and
+    failures are counted for the analytics rollups the same way. `db` is
+    an AsyncDatabase: those writes run on its writer thread, never on the
+    event loop.
+    """
+
+    def __init__(self, bot, db, rate=BROADCAST_RATE,
+                 per_chat_interval=BROADCAST_PER_CHAT_INTERVAL,
+                 workers=BROADCAST_WORKERS, batch_size=BROADCAST_BATCH_SIZE,
+                 max_retries=BROADCAST_MAX_RETRIES):
+        self.bot = bot
+        self.db = db
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+    async def run(self, chat_ids, text, message_type='campaign', on_result=None, **send_kwargs):
+        """Send `text` to every chat. `on_result(chat_id, ok)` sees each final outcome.
+
+        `chat_ids` can be any iterable, e.g. a generator: workers share it
+        and pull the next chat only once they are free, so it is never
+        held in memory all at once here.
+        """
+        result = BroadcastResult()
+        pending = (str(chat_id) for chat_id in chat_ids)
+        delivered = []
+        failures = []
+        last_sent = {}
+
+        async def record_delivered(force=False):
+            # Take the batch before awaiting; other workers keep appending
+            if delivered and (force or len(delivered) >= self.batch_size):
+                batch = delivered[:]
+                delivered.clear()
+                await self.db.log_messages_sent(batch, message_type)
+            if failures and (force or len(failures) >= self.batch_size):
+                batch = failures[:]
+                failures.clear()
+                await self.db.log_delivery_failures(batch, message_type)
+
+        async def record_failed(chat_id):
+            result.failed += 1
+            BROADCAST_MESSAGES.inc('failed')
+            failures.append(chat_id)
+            if on_result:
+                on_result(chat_id, False)
+            await record_delivered()
+
+        async def worker():
+            loop = asyncio.get_running_loop()
+            for chat_id in pending:
+                attempt = 0
+                while True:
+                    try:
+                        wait = last_sent.get(chat_id, float('-inf')) + self.per_chat_interval - loop.time()
+                        if wait > 0:
+                            await asyncio.sleep(wait)
+                        await self.bucket.acquire()
+                        last_sent[chat_id] = loop.time()
+                        await self.bot.send_message(chat_id=int(chat_id), text=text, **send_kwargs)
+                    except RetryAfter as e:
+                        delay = e.retry_after
+                        if isinstance(delay, timedelta):
+                            delay = delay.total_seconds()
+                        if attempt < self.max_retries:
+                            # The paused bucket holds every worker back, this one included
+                            logger.warning(f"Flood control on {chat_id}, retrying in {delay}s")
+                            self.bucket.pause(delay)
+                            result.retried += 1
+                            BROADCAST_MESSAGES.inc('retried')
+                            attempt += 1
+                            continue
+                        logger.error(f"Failed to send to {chat_id}: {e}")
+                        await record_failed(chat_id)
+                    except Exception as e:
+                        logger.error(f"Failed to send to {chat_id}: {e}")
+                        await record_failed(chat_id)
+                    else:
+                        result.sent += 1
+                        BROADCAST_MESSAGES.inc('sent')
+                        delivered.append(chat_id)
+                        if on_result:
+                            on_result(chat_id, True)
+                        await record_delivered()
+                    break
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await record_delivered(force=True)
+        return result
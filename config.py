@@ -1,44 +1,134 @@
-import os
-from dotenv import load_dotenv
-import json
-from pathlib import Path
-
-# Load environment variables
-load_dotenv() 
-
-# Telegram Bot Configuration
-BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-ADMIN_CHAT_ID = int(os.getenv('ADMIN_CHAT_ID', '0'))
-
-# Database file path
-DB_PATH = Path('users_database.json')
-
-# Referral reward settings
-REFERRAL_REWARD = "20% OFF your next purchase"
-FRIEND_REWARD = "20% OFF their first purchase"
-
-# Welcome message template
-WELCOME_MESSAGE = """
-👋 Welcome {name}!
-
-🎁 **REFERRAL PROGRAM ACTIVATED**
-
-Your personal referral link:
-🔗 https://t.me/{bot_username}?start={chat_id}
-
-**How it works:**
-1. Share this link with friends
-2. They click and start the bot
-3. You BOTH get {reward}!
-
-Commands:
-/referral - Get your link
-/stats - Your referral count
-/help - Help
-
-Happy referring! 🚀
-"""
-
-# Verify bot token is set
-if not BOT_TOKEN:
+import os
+from dotenv import load_dotenv
+import json
+from pathlib import Path
+
+# Load environment variables
+load_dotenv() 
+
+# Telegram Bot Configuration
+BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+ADMIN_CHAT_ID = int(os.getenv('ADMIN_CHAT_ID', '0'))
+
+# Database file path (a .db/.sqlite suffix selects the SQLite backend)
+DB_PATH = Path(os.getenv('DB_PATH', 'users_database.json'))
+
+# Write-behind persistence: batch mutations into one save per interval
+DB_WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', '1') != '0'
+DB_FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '2.0'))  # seconds
+DB_FLUSH_EVERY = int(os.getenv('DB_FLUSH_EVERY', '1000'))  # pending changes
+# Stream the file in on a background thread; get_user answers for records
+# already read while the rest loads
+DB_BACKGROUND_LOAD = os.getenv('DB_BACKGROUND_LOAD', '1') != '0'
+
+# Split users across this many files by chat id hash (users_database.0-of-4.json,
+# ...); change it with rebalance_shards.py, never by hand
+DB_SHARDS = int(os.getenv('DB_SHARDS', '1'))
+
+# Journal storage: append each change to <DB_PATH>.journal instead of saving
+DB_JOURNAL = os.getenv('DB_JOURNAL', '0') == '1'
+DB_JOURNAL_COMPACT_BYTES = int(os.getenv('DB_JOURNAL_COMPACT_BYTES', str(64 * 1024 * 1024)))
+DB_JOURNAL_FSYNC = os.getenv('DB_JOURNAL_FSYNC', '0') == '1'
+
+# Storage server: with a socket path set, the bot doesn't open DB_PATH itself
+# but talks to `python storage_server.py` on that Unix socket, so several
+# bot workers can share one store
+DB_SERVER_SOCKET = os.getenv('DB_SERVER_SOCKET')
+DB_SERVER_POOL_SIZE = int(os.getenv('DB_SERVER_POOL_SIZE', '4'))  # connections per worker
+
+# Message history: per-type counts plus this many recent [type, epoch] pairs
+MESSAGE_HISTORY_LIMIT = int(os.getenv('MESSAGE_HISTORY_LIMIT', '10'))
+# Optional append-only JSON-lines file that keeps every message ever logged
+MESSAGE_LOG_PATH = os.getenv('MESSAGE_LOG_PATH')
+# last_active is written through at most once per user per this many
+# seconds (touches in between only update memory); 0 writes every touch
+ACTIVITY_GRANULARITY_SECONDS = int(os.getenv('ACTIVITY_GRANULARITY_SECONDS', '300'))
+
+# Broadcast sending: Telegram allows ~30 msgs/sec per bot and ~1 msg/sec per chat
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))  # messages per second
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '1.0'))  # seconds
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '100'))  # deliveries per DB write
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+
+# Broadcast jobs are checkpointed here so they can resume after a restart
+BROADCAST_JOBS_DIR = Path(os.getenv('BROADCAST_JOBS_DIR', 'broadcast_jobs'))
+BROADCAST_STATUS_INTERVAL = float(os.getenv('BROADCAST_STATUS_INTERVAL', '5.0'))  # seconds
+
+# /export keeps the CSV in memory up to this size, then spills to a temp file
+EXPORT_SPOOL_BYTES = int(os.getenv('EXPORT_SPOOL_BYTES', str(8 * 1024 * 1024)))
+
+# Outbound Bot API calls share one keep-alive connection pool; idle
+# connections stay open this long instead of httpx's 5 seconds
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', '256'))
+API_KEEPALIVE_SECONDS = float(os.getenv('API_KEEPALIVE_SECONDS', '60'))
+API_POOL_TIMEOUT = float(os.getenv('API_POOL_TIMEOUT', '5.0'))  # wait for a free connection
+API_HTTP_VERSION = os.getenv('API_HTTP_VERSION', '1.1')  # '2' needs python-telegram-bot[http2]
+# Bot API server to talk to, e.g. a local one or benchmarks/fake_telegram.py
+API_BASE_URL = os.getenv('API_BASE_URL', 'https://api.telegram.org/bot')
+
+# Fire-and-forget notifications (e.g. "your friend joined") go out from a
+# background queue with retry instead of holding up the handler
+NOTIFY_QUEUE_SIZE = int(os.getenv('NOTIFY_QUEUE_SIZE', '10000'))
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', '4'))
+NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', '5'))
+
+# Update ingestion: 'polling' (default) or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Only the update types our handlers use (commands + inline buttons)
+ALLOWED_UPDATES = ['message', 'callback_query']
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))  # pending updates before backpressure
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '8'))  # concurrent updates (one at a time per chat)
+# Duplicate suppression: an update_id seen within UPDATE_DEDUP_SECONDS
+# (webhook redelivery) is dropped, and so is a repeat /start from the
+# same chat with the same referral link within START_DEDUP_SECONDS
+UPDATE_DEDUP_SECONDS = float(os.getenv('UPDATE_DEDUP_SECONDS', '3600'))
+START_DEDUP_SECONDS = float(os.getenv('START_DEDUP_SECONDS', '30'))
+DEDUP_MAX_KEYS = int(os.getenv('DEDUP_MAX_KEYS', '100000'))
+
+# Webhook mode: embedded HTTP server; WEBHOOK_URL is the public base URL
+# (e.g. behind a TLS-terminating proxy) registered with Telegram
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv('WEBHOOK_ENQUEUE_TIMEOUT', '5.0'))  # seconds
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Metrics: handler/database/API timings and counters served for Prometheus
+# on http://METRICS_LISTEN:METRICS_PORT/metrics. Off by default; when off
+# nothing is wrapped, so there is no overhead.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+
+# Referral reward settings
+REFERRAL_REWARD = "20% OFF your next purchase"
+FRIEND_REWARD = "20% OFF their first purchase"
+
+# Welcome message template
+WELCOME_MESSAGE = """
+👋 Welcome {name}!
+
+🎁 **REFERRAL PROGRAM ACTIVATED**
+
+Your personal referral link:
+🔗 https://t.me/{bot_username}?start={chat_id}
+
+**How it works:**
+1. Share this link with friends
+2. They click and start the bot
+3. You BOTH get {reward}!
+
+Commands:
+/referral - Get your link
+/stats - Your referral count
+/help - Help
+
+Happy referring! 🚀
+"""
+
+# Verify bot token is set
+if not BOT_TOKEN:
     raise ValueError("❌ TELEGRAM_BOT_TOKEN not set in .env file!")
\ No newline at end of file
@@ -1,88 +1,1054 @@
-import json
-import os
-from datetime import datetime
-from config import DB_PATH
-
-class Database:
-    def __init__(self, db_file):
-        self.db_file = db_file
-        self.data = {
-            'users': {},
-            'total_users': 0,
-            'settings': {}
-        }
-        self.load()
-
-    def load(self):
-        if os.path.exists(self.db_file):
-            try:
-                with open(self.db_file, 'r') as f:
-                    self.data = json.load(f)
-            except json.JSONDecodeError:
-                print("Error decoding JSON, starting fresh.")
-                self.save()
-        else:
-            self.save()
-
-    def save(self):
-        with open(self.db_file, 'w') as f:
-            json.dump(self.data, f, indent=4)
-
-    def add_user(self, chat_id, first_name, username, referred_by=None):
-        str_chat_id = str(chat_id)
-        
-        if str_chat_id not in self.data['users']:
-            self.data['users'][str_chat_id] = {
-                'chat_id': str_chat_id,
-                'first_name': first_name,
-                'username': username,
-                'joined_at': str(datetime.now()),
-                'referred_by': referred_by,
-                'referrals': 0,
-                'last_active': str(datetime.now()),
-                'status': 'active',
-                'messages_sent': []
-            }
-            self.data['total_users'] += 1
-            
-            # Update referrer stats if applicable
-            if referred_by and referred_by in self.data['users']:
-                self.data['users'][referred_by]['referrals'] += 1
-                
-            self.save()
-            return self.data['users'][str_chat_id]
-        
-        return self.data['users'][str_chat_id]
-
-    def get_user(self, chat_id):
-        return self.data['users'].get(str(chat_id))
-
-    def update_last_active(self, chat_id):
-        str_chat_id = str(chat_id)
-        if str_chat_id in self.data['users']:
-            self.data['users'][str_chat_id]['last_active'] = str(datetime.now())
-            self.save()
-
-    def get_active_users(self, limit=100):
-        # Return users sorted by last_active (just a simple implementation for now)
-        users = list(self.data['users'].values())
-        # Filter strictly active if needed, currently just returning top N
-        return users[:limit]
-
-    def get_all_users(self):
-        return self.data['users']
-
-    def log_message_sent(self, chat_id, message_type):
-        str_chat_id = str(chat_id)
-        if str_chat_id in self.data['users']:
-            if 'messages_sent' not in self.data['users'][str_chat_id]:
-                self.data['users'][str_chat_id]['messages_sent'] = []
-            
-            self.data['users'][str_chat_id]['messages_sent'].append({
-                'type': message_type,
-                'timestamp': str(datetime.now())
-            })
-            self.save()
-
-# Create global instance
-db = Database(DB_PATH)
\ No newline at end of file
+import gc
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import ChainMap
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from activity import ActivityBuckets, cutoff_micros, merge_summaries, same_window
+from analytics import DailyRollups, backfill, epoch_day, iter_message_log, merge_stats, timestamp_day
+from config import (
+    DB_PATH, DB_WRITE_BEHIND, DB_FLUSH_INTERVAL, DB_FLUSH_EVERY, DB_BACKGROUND_LOAD, DB_SHARDS,
+    DB_JOURNAL, DB_JOURNAL_COMPACT_BYTES, DB_JOURNAL_FSYNC, DB_SERVER_SOCKET, DB_SERVER_POOL_SIZE,
+    MESSAGE_HISTORY_LIMIT, MESSAGE_LOG_PATH, BROADCAST_JOBS_DIR, ACTIVITY_GRANULARITY_SECONDS
+)
+from json_stream import iter_snapshot
+from referral_graph import ReferralGraph
+from remote_database import RemoteDatabase
+from segments import CAMPAIGN_TYPE, SegmentIndex, last_campaign, parse_segment, resolve
+from shards import shard_log_paths, shard_of, shard_paths, stored_shard_counts
+from user_record import UserRecord, to_micros
+from sqlite_database import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+# Wake get_user callers waiting on a background load every this many records
+LOAD_PROGRESS_EVERY = 10000
+
+
+class Database:
+    def __init__(self, db_file, write_behind=DB_WRITE_BEHIND,
+                 flush_interval=DB_FLUSH_INTERVAL, flush_every=DB_FLUSH_EVERY,
+                 history_limit=MESSAGE_HISTORY_LIMIT, message_log=MESSAGE_LOG_PATH,
+                 background_load=DB_BACKGROUND_LOAD,
+                 activity_granularity=ACTIVITY_GRANULARITY_SECONDS):
+        self.db_file = db_file
+        self.data = _empty_data()
+        # Write-behind: mutations only mark the store dirty and a background
+        # thread coalesces them into one save every `flush_interval` seconds,
+        # or sooner once `flush_every` changes are pending.
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._dirty = 0
+        self.last_save_seconds = 0.0
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = None
+        # Max-heap (by negated timestamp) of (-last_active, chat_id,
+        # last_active) over active users, timestamps as UserRecord ints.
+        # Entries go stale when a user is touched again; they are skipped
+        # and dropped lazily.
+        self._recency = []
+        # Users bucketed by the day they were last active (DAU/WAU/MAU).
+        # Touches within the same `activity_granularity` window only update
+        # memory; the exact time reaches disk with the next save.
+        self.activity = ActivityBuckets()
+        self.activity_granularity = activity_granularity
+        self.referral_graph = ReferralGraph()
+        # Attribute indexes for /broadcast segments, built on first use and
+        # told about every user an event touches from then on
+        self._segments = None
+        self._segments_build_lock = threading.Lock()
+        self._segment_changes = None  # users changed while a build runs
+        # Message history is kept as per-type counters plus the last
+        # `history_limit` [type, epoch] pairs; the full history can
+        # optionally be appended to `message_log` as JSON lines.
+        self.history_limit = history_limit
+        self.message_log = message_log
+        self._message_log = None
+        # Daily rollups live in data['daily_stats']; see _attach_analytics
+        self.analytics = DailyRollups()
+        self._analytics_missing = False
+        self._loaded = threading.Event()
+        # Notified as batches of records come in during a background load
+        self._progress = threading.Condition()
+        self._load_failed = False
+        if background_load and os.path.exists(db_file):
+            # The loader holds the lock until everything is in, so any locked
+            # method waits for it while get_user answers for records already read
+            holding = threading.Event()
+            threading.Thread(
+                target=self._open_in_background, args=(holding,), name='db-loader', daemon=True
+            ).start()
+            holding.wait()
+        else:
+            self._open()
+
+    def _open(self):
+        with _gc_paused():
+            self.load()
+            # Backfill before compaction folds legacy message lists away
+            if self._analytics_missing:
+                self.rebuild_analytics()
+                self._mark_dirty()
+            if self._compact_message_history():
+                self._mark_dirty()
+            self._rebuild_recency_index()
+            self._rebuild_activity()
+            self._rebuild_referral_graph()
+        self._loaded.set()
+
+    def _open_in_background(self, holding):
+        with self._lock:
+            holding.set()
+            started = time.perf_counter()
+            try:
+                self._open()
+            except Exception as e:
+                # Never save a partial load over the file
+                self._load_failed = True
+                logger.critical(f"Loading {self.db_file} failed, not saving: {e}")
+            else:
+                logger.info(f"Loaded {len(self.data['users'])} users from {self.db_file} "
+                            f"in {time.perf_counter() - started:.1f}s")
+            finally:
+                self._loaded.set()
+                with self._progress:
+                    self._progress.notify_all()
+
+    def wait_until_loaded(self, timeout=None):
+        """Block until the background load has finished. Returns False on timeout."""
+        return self._loaded.wait(timeout)
+
+    def load(self):
+        if os.path.exists(self.db_file):
+            if not self._read_snapshot():
+                print("Error decoding JSON, starting fresh.")
+                self.data = _empty_data()
+                self.save()
+        else:
+            self.save()
+        self._attach_analytics()
+
+    def _read_snapshot(self):
+        """Stream the snapshot into self.data one user record at a time.
+
+        Users appear in self.data['users'] as they are read, which is what
+        lets get_user serve them during a background load. Returns False if
+        the file is not valid JSON.
+        """
+        data = self.data = {'users': {}, 'total_users': 0, 'settings': {}}
+        users = data['users']
+        try:
+            for section, key, value in iter_snapshot(self.db_file):
+                if section == 'users':
+                    users[key] = UserRecord.from_dict(value)
+                    if len(users) % LOAD_PROGRESS_EVERY == 0:
+                        with self._progress:
+                            self._progress.notify_all()
+                else:
+                    data[key] = value
+        except ValueError:
+            return False
+        return True
+
+    def _attach_analytics(self):
+        # Files written before rollups existed get them backfilled once loaded
+        self._analytics_missing = 'daily_stats' not in self.data
+        self.analytics = DailyRollups(self.data.setdefault('daily_stats', {}))
+
+    def save(self):
+        # Serialize under the data lock, write outside it. The temp file +
+        # os.replace means a crash mid-write never leaves a truncated file.
+        if self._load_failed:
+            raise RuntimeError(f"Not saving over {self.db_file}: it failed to load")
+        with self._save_lock:
+            started = time.perf_counter()
+            with self._lock:
+                payload = _dump(self.data)
+                self._dirty = 0
+            try:
+                self._write_snapshot(payload)
+            except OSError:
+                with self._lock:
+                    self._dirty += 1
+                raise
+            self.last_save_seconds = time.perf_counter() - started
+
+    def _write_snapshot(self, payload):
+        tmp_file = f"{self.db_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.db_file)
+
+    def flush(self):
+        """Persist pending changes now. No-op when nothing is dirty."""
+        if self._message_log is not None:
+            self._message_log.flush()
+        if self._dirty:
+            self.save()
+
+    def close(self):
+        """Stop the background flusher and write out anything pending."""
+        self._closed.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        self._close_message_log()
+
+    def _close_message_log(self):
+        if self._message_log is not None:
+            self._message_log.close()
+            self._message_log = None
+
+    def _mark_dirty(self, changes=1):
+        if not self.write_behind or self._closed.is_set():
+            self.save()
+            return
+        self._dirty += changes
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name='db-flusher', daemon=True
+            )
+            self._flusher.start()
+        if self._dirty >= self.flush_every:
+            self._wake.set()
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Background save of {self.db_file} failed: {e}")
+
+    def _commit(self, event):
+        """Apply a mutation event to the in-memory state and persist it."""
+        self._commit_many([event])
+
+    def _commit_many(self, events):
+        """Apply several events, then persist them with a single write."""
+        for event in events:
+            self._apply(event)
+        if events:
+            self._record_many(events)
+
+    def _apply(self, event):
+        getattr(self, '_apply_' + event['op'])(event)
+        if 'chat_id' in event:
+            self._segment_changed(event['chat_id'])
+            if event.get('referred_by'):
+                self._segment_changed(event['referred_by'])
+
+    def _segment_changed(self, chat_id):
+        if self._segments is not None:
+            self._segments.changed(chat_id)
+        if self._segment_changes is not None:
+            self._segment_changes.add(chat_id)
+
+    def _record_many(self, events):
+        self._mark_dirty(len(events))
+
+    def _rebuild_recency_index(self):
+        with self._lock:
+            self._recency = [
+                (-user.active, chat_id, user.active)
+                for chat_id, user in self.data['users'].items()
+                if user.status == 'active' and isinstance(user.active, int)
+            ]
+            heapq.heapify(self._recency)
+
+    def _rebuild_activity(self):
+        with self._lock:
+            self.activity = ActivityBuckets.build(user.active for user in self.data['users'].values())
+
+    def _rebuild_referral_graph(self):
+        with self._lock:
+            self.referral_graph = ReferralGraph.build(_referral_edges(self.data['users'].items()))
+
+    def rebuild_analytics(self, jobs_dir=BROADCAST_JOBS_DIR, joined_at=None):
+        """Recount the daily rollups from the stored users in one pass."""
+        with self._lock:
+            messages = None
+            if self.message_log and os.path.exists(self.message_log):
+                if self._message_log is not None:
+                    self._message_log.flush()
+                messages = iter_message_log(self.message_log)
+            backfill(self.analytics, self.data['users'].items(), messages, jobs_dir, joined_at)
+
+    def _index_activity(self, chat_id, last_active):
+        heapq.heappush(self._recency, (-last_active, chat_id, last_active))
+        # Touch storms leave mostly stale entries behind; rebuild once they dominate
+        if len(self._recency) > 2 * len(self.data['users']) + 1024:
+            self._rebuild_recency_index()
+
+    def _apply_add_user(self, event):
+        chat_id = event['chat_id']
+        referred_by = event['referred_by']
+        user = self.data['users'][chat_id] = UserRecord(
+            chat_id, event['first_name'], event['username'], event['at'],
+            referred_by, 0, event['at'], 'active'
+        )
+        self.data['total_users'] += 1
+        
+        day = timestamp_day(event['at'])
+        self.analytics.add(day, 'signups')
+        self.analytics.add(day, 'active_users')
+        # Update referrer stats if applicable (never for a self-referral)
+        if referred_by and referred_by != chat_id and referred_by in self.data['users']:
+            self.data['users'][referred_by].referrals += 1
+            self.referral_graph.add(chat_id, referred_by)
+            self.analytics.add(day, 'referred_signups')
+        self._index_activity(chat_id, user.active)
+        self.activity.move(None, user.active)
+
+    def _apply_touch(self, event):
+        user = self.data['users'][event['chat_id']]
+        # First activity of the day counts the user as active that day
+        day = timestamp_day(event['at'])
+        if timestamp_day(user['last_active']) != day:
+            self.analytics.add(day, 'active_users')
+        self._set_active(event['chat_id'], user, to_micros(event['at']))
+
+    def _set_active(self, chat_id, user, active):
+        self.activity.move(user.active, active)
+        user.active = active
+        self._index_activity(chat_id, active)
+
+    def _apply_message(self, event):
+        user = self.data['users'][event['chat_id']]
+        if 'message_counts' not in user:
+            user['message_counts'] = {}
+            user['recent_messages'] = []
+        
+        at = event['at']
+        if isinstance(at, str):
+            at = int(_epoch(at))  # journals written before epoch timestamps
+        message_type = sys.intern(event['type'])
+        counts = user['message_counts']
+        counts[message_type] = counts.get(message_type, 0) + 1
+        recent = user['recent_messages']
+        recent.append((message_type, at))
+        if len(recent) > self.history_limit:
+            del recent[:-self.history_limit]
+        if message_type == CAMPAIGN_TYPE and at > user.get('last_campaign', 0):
+            user['last_campaign'] = at
+        self.analytics.add(epoch_day(at), 'messages', key=message_type)
+
+    def _apply_delivery_failed(self, event):
+        self.analytics.add(epoch_day(event['at']), 'failed', event['count'], key=event['type'])
+
+    def _apply_referral(self, event):
+        self.data['users'][event['chat_id']].referrals += 1
+        # The referred user's shard couldn't tell the signup was credited
+        if 'at' in event:
+            self.analytics.add(timestamp_day(event['at']), 'referred_signups')
+
+    def _apply_profile(self, event):
+        user = self.data['users'][event['chat_id']]
+        user.first_name = event['first_name']
+        user.username = event['username']
+
+    def _compact_message_history(self):
+        """Fold legacy `messages_sent` lists into counters + recent ring.
+
+        Records saved before `last_campaign` was kept get it from their
+        history. Returns the number of users converted.
+        """
+        converted = 0
+        with self._lock:
+            for chat_id, user in self.data['users'].items():
+                messages = user.pop('messages_sent', None)
+                if messages is not None:
+                    converted += 1
+                    legacy = [
+                        [m.get('type'), int(_epoch(m.get('timestamp')))]
+                        for m in messages
+                    ]
+                    for message_type, at in legacy:
+                        self._spill_message(chat_id, message_type, at)
+                    counts = user.setdefault('message_counts', {})
+                    for message_type, _ in legacy:
+                        counts[message_type] = counts.get(message_type, 0) + 1
+                    # Before trimming: the full list has the latest campaign
+                    campaigns = [at for message_type, at in legacy if message_type == CAMPAIGN_TYPE]
+                    if campaigns:
+                        user['last_campaign'] = max(campaigns + [user.get('last_campaign', 0)])
+                    recent = sorted(legacy + user.get('recent_messages', []), key=lambda m: m[1])
+                    user['recent_messages'] = recent[-self.history_limit:]
+                if 'last_campaign' not in user and user.get('message_counts', {}).get(CAMPAIGN_TYPE):
+                    converted += 1
+                    user['last_campaign'] = last_campaign(user)
+        return converted
+
+    def _spill_message(self, chat_id, message_type, at):
+        if not self.message_log:
+            return
+        if self._message_log is None:
+            self._message_log = open(self.message_log, 'a', encoding='utf-8')
+        self._message_log.write(json.dumps(
+            {'chat_id': chat_id, 'type': message_type, 'at': at},
+            separators=(',', ':')
+        ) + '\n')
+
+    def add_user(self, chat_id, first_name, username, referred_by=None):
+        return self.register_user(chat_id, first_name, username, referred_by)[0]
+
+    def register_user(self, chat_id, first_name, username, referred_by=None):
+        """Atomically add a user (and credit the referrer) unless already known.
+
+        Returns (user, created). Concurrent calls for the same chat create
+        the user and bump the referrer's count exactly once.
+        """
+        str_chat_id = str(chat_id)
+        if referred_by == str_chat_id:
+            referred_by = None  # /start with your own link
+        
+        with self._lock:
+            created = str_chat_id not in self.data['users']
+            if created:
+                self._commit({
+                    'op': 'add_user',
+                    'chat_id': str_chat_id,
+                    'first_name': first_name,
+                    'username': username,
+                    'referred_by': referred_by,
+                    'at': str(datetime.now())
+                })
+            
+            return self.data['users'][str_chat_id], created
+
+    def credit_referral(self, chat_id):
+        """Count one more referral for a user registered elsewhere (another shard)."""
+        str_chat_id = str(chat_id)
+        with self._lock:
+            if str_chat_id in self.data['users']:
+                self._commit({'op': 'referral', 'chat_id': str_chat_id, 'at': str(datetime.now())})
+
+    def get_user(self, chat_id):
+        user = self.data['users'].get(str(chat_id))
+        if user is None and not self._loaded.is_set():
+            user = self._wait_for_user(str(chat_id))
+        return user
+
+    def _wait_for_user(self, chat_id):
+        # During a background load a miss may just not be read yet
+        with self._progress:
+            while True:
+                loaded = self._loaded.is_set()
+                user = self.data['users'].get(chat_id)
+                if user is not None or loaded:
+                    return user
+                self._progress.wait()
+
+    def user_count(self):
+        self._loaded.wait()
+        return self.data['total_users']
+
+    def get_leaderboard(self, limit=10):
+        """Top referrers as [(user, direct referrals)], best first."""
+        self._loaded.wait()
+        return [(self.get_user(chat_id), count)
+                for chat_id, count in self.referral_graph.leaderboard(limit)]
+
+    def get_downline(self, chat_id):
+        """Direct referrals, whole-downline size and leaderboard rank of a user."""
+        self._loaded.wait()
+        chat_id = str(chat_id)
+        graph = self.referral_graph
+        return {
+            'direct': list(graph.direct_referrals(chat_id)),
+            'total': graph.downline_size(chat_id),
+            'rank': graph.rank_of(chat_id)
+        }
+
+    def update_last_active(self, chat_id):
+        """Record activity now. Only written through once per granularity window."""
+        str_chat_id = str(chat_id)
+        at = str(datetime.now())
+        with self._lock:
+            user = self.data['users'].get(str_chat_id)
+            if user is None:
+                return
+            active = to_micros(at)
+            if same_window(user.active, active, self.activity_granularity):
+                self._set_active(str_chat_id, user, active)
+                self._segment_changed(str_chat_id)
+            else:
+                self._commit({'op': 'touch', 'chat_id': str_chat_id, 'at': at})
+
+    def activity_summary(self):
+        """{'dau', 'wau', 'mau'}: users last active today / in 7 / in 30 days."""
+        with self._lock:
+            return self.activity.summary()
+
+    def count_active_within(self, days):
+        with self._lock:
+            return self.activity.active_within(days)
+
+    def _segment_index(self):
+        """The segment indexes, (re)built first if missing or stale.
+
+        Building takes seconds at a million users, so it runs outside the
+        store lock on a snapshot of the user table; users changed in the
+        meantime are marked dirty on the new index before it is used.
+        """
+        self._loaded.wait()
+        with self._segments_build_lock:
+            with self._lock:
+                if self._segments is not None and not self._segments.stale:
+                    return self._segments
+                users = list(self.data['users'].items())
+                self._segment_changes = set()
+            index = SegmentIndex(users)
+            with self._lock:
+                for chat_id in self._segment_changes:
+                    index.changed(chat_id)
+                self._segment_changes = None
+                self._segments = index
+            return index
+
+    def _select_segment(self, expression):
+        segment = resolve(parse_segment(expression))
+        index = self._segment_index()
+        with self._lock:
+            bits, extra = index.select(segment, self.data['users'])
+        return index, bits, extra
+
+    def count_segment(self, expression):
+        """Number of users matching a segment expression (see segments.parse_segment)."""
+        _, bits, extra = self._select_segment(expression)
+        return bits.bit_count() + len(extra)
+
+    def iter_segment(self, expression):
+        """Yield the chat ids of users matching a segment expression, lazily.
+
+        The match is worked out up front on the indexes; chat ids are only
+        produced as the caller asks for them, outside the lock.
+        """
+        index, bits, extra = self._select_segment(expression)
+        yield from index.iter_chat_ids(bits)
+        yield from extra
+
+    def update_profile(self, chat_id, first_name, username):
+        """Store a changed name/username. Returns False (and writes nothing) if unchanged."""
+        str_chat_id = str(chat_id)
+        with self._lock:
+            user = self.data['users'].get(str_chat_id)
+            if user is None or (user.first_name, user.username) == (first_name, username):
+                return False
+            self._commit({
+                'op': 'profile', 'chat_id': str_chat_id,
+                'first_name': first_name, 'username': username
+            })
+            return True
+
+    def get_active_users(self, limit=100, within_days=None):
+        """Return up to `limit` active users, most recently active first.
+
+        With `within_days`, only users active in that many days (today
+        included); the walk down the recency heap stops at the cutoff.
+        """
+        cutoff = cutoff_micros(within_days) if within_days else None
+        users = []
+        kept = []
+        with self._lock:
+            while self._recency and len(users) < limit:
+                entry = heapq.heappop(self._recency)
+                user = self.data['users'].get(entry[1])
+                if user is None or user.active != entry[2] or user.status != 'active':
+                    continue  # stale entry, drop it for good
+                kept.append(entry)
+                if cutoff is not None and entry[2] < cutoff:
+                    break
+                users.append(user)
+            for entry in kept:
+                heapq.heappush(self._recency, entry)
+        return users
+
+    def get_all_users(self):
+        self._loaded.wait()
+        return self.data['users']
+
+    def iter_users(self, chunk_size=1000):
+        """Yield (chat_id, user) pairs without copying the user records.
+
+        Walks a snapshot of the chat ids, taking the lock for `chunk_size`
+        users at a time, so a slow consumer (an export, a storage server
+        client) doesn't stall writers and they can't resize the dict under
+        it. Users added after the call started are left out.
+        """
+        with self._lock:
+            chat_ids = list(self.data['users'])
+        for start in range(0, len(chat_ids), chunk_size):
+            with self._lock:
+                users = self.data['users']
+                chunk = [(chat_id, users[chat_id]) for chat_id in chat_ids[start:start + chunk_size]
+                         if chat_id in users]
+            yield from chunk
+
+    def log_message_sent(self, chat_id, message_type):
+        str_chat_id = str(chat_id)
+        with self._lock:
+            if str_chat_id in self.data['users']:
+                at = int(time.time())
+                self._commit({
+                    'op': 'message',
+                    'chat_id': str_chat_id,
+                    'type': message_type,
+                    'at': at
+                })
+                self._spill_message(str_chat_id, message_type, at)
+
+    def log_messages_sent(self, chat_ids, message_type):
+        """Record one message of `message_type` for each chat in one write."""
+        at = int(time.time())
+        with self._lock:
+            chat_ids = [str(c) for c in chat_ids if str(c) in self.data['users']]
+            self._commit_many([
+                {'op': 'message', 'chat_id': chat_id, 'type': message_type, 'at': at}
+                for chat_id in chat_ids
+            ])
+            for chat_id in chat_ids:
+                self._spill_message(chat_id, message_type, at)
+
+    def log_delivery_failures(self, chat_ids, message_type):
+        """Count messages of `message_type` that could not be delivered."""
+        if not chat_ids:
+            return
+        with self._lock:
+            self._commit({
+                'op': 'delivery_failed',
+                'type': message_type,
+                'count': len(chat_ids),
+                'at': int(time.time())
+            })
+
+    def get_daily_stats(self, days=7):
+        """[(day, stats)] for the last `days` days, oldest first."""
+        with self._lock:
+            return self.analytics.last(days)
+
+    def get_message_counts(self, chat_id):
+        """Messages sent to a user so far, by type."""
+        user = self.get_user(chat_id)
+        return dict(user.get('message_counts', {})) if user else {}
+
+
+class JournalDatabase(Database):
+    """Database that appends every mutation to a journal instead of saving.
+
+    On disk there is a JSON snapshot (`db_file`, same format as Database)
+    plus `<db_file>.journal` with one JSON event per line. Startup loads the
+    snapshot and replays the journal on top of it; once the journal grows
+    past `compact_bytes` a background thread folds it into a fresh snapshot.
+    Every event carries a sequence number and the snapshot remembers the
+    last one it contains, so replay after a crash mid-compaction never
+    applies an event twice.
+    """
+
+    def __init__(self, db_file, compact_bytes=DB_JOURNAL_COMPACT_BYTES,
+                 fsync=DB_JOURNAL_FSYNC, **options):
+        self.journal_file = f"{db_file}.journal"
+        self.rotated_journal_file = f"{self.journal_file}.1"
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self._journal = None
+        self._journal_size = 0
+        self._seq = 0
+        self._compactor = None
+        super().__init__(db_file, write_behind=False, **options)
+
+    def load(self):
+        if os.path.exists(self.db_file) and not self._read_snapshot():
+            logger.error(f"Error decoding JSON snapshot {self.db_file}, replaying journal only")
+            self.data = _empty_data()
+        self._seq = self.data.get('journal_seq', 0)
+        self._attach_analytics()
+
+        # A leftover rotated journal means we died mid-compaction
+        if os.path.exists(self.rotated_journal_file):
+            self._replay(self.rotated_journal_file)
+        good_bytes = self._replay(self.journal_file)
+
+        # Drop a torn last record so new events start on a clean line
+        if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) != good_bytes:
+            logger.warning(f"Truncating torn record at byte {good_bytes} of {self.journal_file}")
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(good_bytes)
+        self._journal_size = good_bytes
+
+        # Settle an interrupted compaction (or a first start) before any new
+        # event can rotate the journal over the leftover one
+        if os.path.exists(self.rotated_journal_file) or not os.path.exists(self.db_file):
+            self.data['journal_seq'] = self._seq
+            self._write_snapshot(_dump(self.data))
+            if os.path.exists(self.rotated_journal_file):
+                os.remove(self.rotated_journal_file)
+        self._journal = open(self.journal_file, 'ab')
+
+    def _replay(self, path):
+        """Apply complete journal records from `path`; return bytes consumed."""
+        good_bytes = 0
+        if not os.path.exists(path):
+            return good_bytes
+        replayed = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                good_bytes += len(line)
+                if event['seq'] > self._seq:
+                    self._apply(event)
+                    self._seq = event['seq']
+                    replayed += 1
+        if replayed:
+            logger.info(f"Replayed {replayed} journal events from {path}")
+        return good_bytes
+
+    def _record_many(self, events):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'ab')
+        lines = []
+        for event in events:
+            self._seq += 1
+            event['seq'] = self._seq
+            lines.append(json.dumps(event, separators=(',', ':')) + '\n')
+        block = ''.join(lines).encode('utf-8')
+        self._journal.write(block)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_size += len(block)
+        if self._journal_size >= self.compact_bytes and self._compactor is None:
+            self._compactor = threading.Thread(
+                target=self._compact_in_background, name='db-compactor', daemon=True
+            )
+            self._compactor.start()
+
+    def _compact_in_background(self):
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"Journal compaction of {self.db_file} failed: {e}")
+        finally:
+            self._compactor = None
+
+    def save(self):
+        """Fold the journal into a fresh snapshot."""
+        with self._save_lock:
+            started = time.perf_counter()
+            with self._lock:
+                self.data['journal_seq'] = self._seq
+                payload = _dump(self.data)
+                # New events go to a fresh journal while the snapshot is written
+                if self._journal is not None:
+                    self._journal.close()
+                    os.replace(self.journal_file, self.rotated_journal_file)
+                    self._journal = open(self.journal_file, 'ab')
+                    self._journal_size = 0
+            self._write_snapshot(payload)
+            if os.path.exists(self.rotated_journal_file):
+                os.remove(self.rotated_journal_file)
+            self.last_save_seconds = time.perf_counter() - started
+
+    def flush(self):
+        """Force journal records written so far onto disk."""
+        with self._lock:
+            if self._message_log is not None:
+                self._message_log.flush()
+            if self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            if self._journal is not None:
+                self.flush()
+                self._journal.close()
+                self._journal = None
+            self._close_message_log()
+
+
+class ShardedDatabase:
+    """Users partitioned by chat id across several independent stores.
+
+    Each shard is a full Database (or JournalDatabase) over its own file,
+    `users_database.<i>-of-<n>.json`, with its own lock, flusher and
+    message log, so a save only rewrites the shard that changed and the
+    files could as well be served by separate processes. A user lives on
+    shard `shard_of(chat_id, n)`. Reads spanning shards (user_count,
+    get_active_users, iter_users, get_daily_stats) merge the per-shard
+    results; the referral graph is global and built from all shards the
+    first time it is needed.
+
+    The shard count is part of the file names; change it with
+    rebalance_shards.py.
+    """
+
+    def __init__(self, db_file, shards, backend=Database,
+                 message_log=MESSAGE_LOG_PATH, **options):
+        paths = shard_paths(db_file, shards)
+        stored = [n for n in stored_shard_counts(db_file) if n != shards]
+        if stored and not os.path.exists(paths[0]):
+            raise RuntimeError(
+                f"{db_file} is stored as {stored[0]} shard(s), not {shards}; "
+                f"run rebalance_shards.py --to {shards} first"
+            )
+        self.db_file = db_file
+        self.shards = [
+            backend(path, message_log=log, **options)
+            for path, log in zip(paths, shard_log_paths(message_log, shards))
+        ]
+        self._lock = threading.RLock()
+        self.referral_graph = None
+
+    def shard_for(self, chat_id):
+        return self.shards[shard_of(chat_id, len(self.shards))]
+
+    def _by_shard(self, chat_ids):
+        """[(shard, chat_ids on it)] for a batch of chat ids."""
+        groups = {}
+        for chat_id in chat_ids:
+            groups.setdefault(shard_of(chat_id, len(self.shards)), []).append(chat_id)
+        return [(self.shards[i], ids) for i, ids in groups.items()]
+
+    def wait_until_loaded(self, timeout=None):
+        """Block until every shard has loaded. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self.shards:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not shard.wait_until_loaded(remaining):
+                return False
+        return True
+
+    @property
+    def last_save_seconds(self):
+        """The slowest shard's most recent save."""
+        return max(shard.last_save_seconds for shard in self.shards)
+
+    def save(self):
+        for shard in self.shards:
+            shard.save()
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def rebuild_analytics(self, jobs_dir=BROADCAST_JOBS_DIR):
+        """Recount every shard's rollups; broadcast failures go to the first shard."""
+        # Referrers may live on another shard than the users they referred
+        joined_at = {chat_id: user.get('joined_at') or '' for chat_id, user in self.iter_users()}
+        for i, shard in enumerate(self.shards):
+            shard.rebuild_analytics(jobs_dir if i == 0 else None, joined_at)
+
+    def add_user(self, chat_id, first_name, username, referred_by=None):
+        return self.register_user(chat_id, first_name, username, referred_by)[0]
+
+    def register_user(self, chat_id, first_name, username, referred_by=None):
+        """Add a user to its shard and credit the referrer, wherever it lives.
+
+        The user's shard creates it exactly once, so a referrer on another
+        shard is credited exactly once too.
+        """
+        str_chat_id = str(chat_id)
+        if referred_by == str_chat_id:
+            referred_by = None  # /start with your own link
+
+        shard = self.shard_for(str_chat_id)
+        user, created = shard.register_user(str_chat_id, first_name, username, referred_by)
+        if created and referred_by:
+            referrer_shard = self.shard_for(referred_by)
+            if referrer_shard.get_user(referred_by) is not None:
+                # On the same shard, add_user has credited the referrer already
+                if referrer_shard is not shard:
+                    referrer_shard.credit_referral(referred_by)
+                with self._lock:
+                    if self.referral_graph is not None:
+                        self.referral_graph.add(str_chat_id, referred_by)
+        return user, created
+
+    def credit_referral(self, chat_id):
+        self.shard_for(chat_id).credit_referral(chat_id)
+
+    def get_user(self, chat_id):
+        return self.shard_for(chat_id).get_user(chat_id)
+
+    def user_count(self):
+        return sum(shard.user_count() for shard in self.shards)
+
+    def _graph(self):
+        with self._lock:
+            if self.referral_graph is None:
+                self.wait_until_loaded()
+                self.referral_graph = ReferralGraph.build(_referral_edges(self.iter_users()))
+            return self.referral_graph
+
+    def get_leaderboard(self, limit=10):
+        """Top referrers as [(user, direct referrals)], best first."""
+        return [(self.get_user(chat_id), count)
+                for chat_id, count in self._graph().leaderboard(limit)]
+
+    def get_downline(self, chat_id):
+        """Direct referrals, whole-downline size and leaderboard rank of a user."""
+        chat_id = str(chat_id)
+        graph = self._graph()
+        return {
+            'direct': list(graph.direct_referrals(chat_id)),
+            'total': graph.downline_size(chat_id),
+            'rank': graph.rank_of(chat_id)
+        }
+
+    def update_last_active(self, chat_id):
+        self.shard_for(chat_id).update_last_active(chat_id)
+
+    def activity_summary(self):
+        return merge_summaries(shard.activity_summary() for shard in self.shards)
+
+    def count_active_within(self, days):
+        return sum(shard.count_active_within(days) for shard in self.shards)
+
+    def update_profile(self, chat_id, first_name, username):
+        return self.shard_for(chat_id).update_profile(chat_id, first_name, username)
+
+    def count_segment(self, expression):
+        return sum(shard.count_segment(expression) for shard in self.shards)
+
+    def iter_segment(self, expression):
+        for shard in self.shards:
+            yield from shard.iter_segment(expression)
+
+    def get_active_users(self, limit=100, within_days=None):
+        """Return up to `limit` active users, most recently active first."""
+        # Each shard's list is already newest first; merge them
+        streams = [shard.get_active_users(limit, within_days) for shard in self.shards]
+        return list(islice(heapq.merge(*streams, key=lambda user: user.active, reverse=True), limit))
+
+    def get_all_users(self):
+        """A read-only view over every shard's users dict."""
+        return ChainMap(*(shard.get_all_users() for shard in self.shards))
+
+    def iter_users(self):
+        """Yield (chat_id, user) pairs shard by shard, a locked chunk at a time."""
+        for shard in self.shards:
+            yield from shard.iter_users()
+
+    def log_message_sent(self, chat_id, message_type):
+        self.shard_for(chat_id).log_message_sent(chat_id, message_type)
+
+    def log_messages_sent(self, chat_ids, message_type):
+        """Record one message of `message_type` for each chat, one write per shard."""
+        for shard, ids in self._by_shard(chat_ids):
+            shard.log_messages_sent(ids, message_type)
+
+    def log_delivery_failures(self, chat_ids, message_type):
+        for shard, ids in self._by_shard(chat_ids):
+            shard.log_delivery_failures(ids, message_type)
+
+    def get_daily_stats(self, days=7):
+        """[(day, stats)] for the last `days` days, summed over all shards."""
+        return merge_stats(shard.get_daily_stats(days) for shard in self.shards)
+
+    def get_message_counts(self, chat_id):
+        return self.shard_for(chat_id).get_message_counts(chat_id)
+
+
+def _referral_edges(users):
+    """(chat_id, referred_by, joined) triples for ReferralGraph.build."""
+    return (
+        (chat_id, user['referred_by'], user.joined if isinstance(user.joined, int) else None)
+        for chat_id, user in users
+    )
+
+
+def _dump(data):
+    # Records serialize as the dicts they stand in for
+    return json.dumps(data, separators=(',', ':'), default=_encode_record)
+
+
+def _encode_record(obj):
+    if isinstance(obj, UserRecord):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _empty_data():
+    return {'users': {}, 'total_users': 0, 'settings': {}, 'daily_stats': {}}
+
+
+@contextmanager
+def _gc_paused():
+    """Suspend the cyclic GC while bulk-loading records and their indexes.
+
+    A million fresh dicts would otherwise set off repeated collections
+    that walk everything loaded so far. Afterwards the loaded objects are
+    frozen (moved out of the collected generations): they are long-lived
+    and never form cycles, so later collections don't need to walk them
+    either. Freed records are still released by reference counting.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.freeze()
+        if enabled:
+            gc.enable()
+
+
+def _epoch(timestamp):
+    """Seconds since the epoch for a stored `str(datetime)` timestamp."""
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def open_database(db_file, server_socket=DB_SERVER_SOCKET):
+    """Create the storage backend selected in config.
+
+    With a storage server socket, a client of that server (which connects
+    on first use). Otherwise a DB_PATH ending in .db/.sqlite/.sqlite3
+    selects SQLite, and the JSON file is used, journaled when DB_JOURNAL is
+    set and split into DB_SHARDS files when that is more than one.
+    """
+    if server_socket:
+        return RemoteDatabase(server_socket, db_file, DB_SERVER_POOL_SIZE)
+    if Path(db_file).suffix in SQLITE_SUFFIXES:
+        return SQLiteDatabase(db_file)
+    if DB_SHARDS > 1:
+        return ShardedDatabase(db_file, DB_SHARDS, JournalDatabase if DB_JOURNAL else Database)
+    if DB_JOURNAL:
+        return JournalDatabase(db_file)
+    return Database(db_file)
+
+
+# Create global instance
+db = open_database(DB_PATH)
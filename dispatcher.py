@@ -0,0 +1,149 @@
+import asyncio
+import sys
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently, but one at a time per chat.
+
+    Updates from different chats run in parallel (up to `workers`);
+    updates from the same chat wait on a per-chat lock, so they are
+    handled in the order they arrived. asyncio locks wake waiters
+    first-in first-out, and the application starts one task per update in
+    arrival order. Locks are dropped as soon as nobody holds or waits on
+    them, so the table stays as small as the number of chats with updates
+    in flight.
+
+    The chat lock is taken before a worker slot, so a burst from one chat
+    holds at most one slot and other chats' updates don't queue behind
+    it. BaseUpdateProcessor acquires its own semaphore before calling
+    do_process_update, i.e. before the chat lock, so that one is left
+    unbounded and the limit is enforced here instead.
+
+    The application starts a task for every update it takes off its queue
+    as soon as it gets it, whatever the limit, so on its own the queue
+    would drain straight into tasks and never push back. UpdateQueue
+    reserves a worker (reserve()) before handing out an update; the update
+    runs on that worker, or hands it back while it waits behind its own
+    chat. The fetcher stops taking updates while all `workers` are busy,
+    the queue fills up, and a full queue is what the webhook answers 503 to.
+
+    With `seen` (an idempotency.TTLCache), an update whose update_id was
+    already processed, e.g. one Telegram redelivered after a slow webhook
+    response, is dropped without running its handlers. The id is marked
+    when the update starts, so a copy arriving mid-flight is dropped too,
+    and forgotten again if processing fails (forget(), which the error
+    handler calls for handler errors the application catches itself).
+    """
+
+    def __init__(self, workers, seen=None):
+        # Unbounded: the base class counts updates in flight, including
+        # those waiting on their chat; `workers` bounds the ones running
+        super().__init__(sys.maxsize)
+        if workers < 1:
+            raise ValueError("`workers` must be a positive integer!")
+        self.workers = workers
+        self._slots = asyncio.BoundedSemaphore(workers)
+        self._reserved = 0
+        self.seen = seen
+        self._locks = {}
+        self._waiters = {}
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        if self.seen is not None and isinstance(update, Update) and not self.seen.add(update.update_id):
+            coroutine.close()  # never started; closing avoids a "never awaited" warning
+            self.release_reserved()
+            return
+
+        try:
+            await self._process(update, coroutine)
+        except BaseException:
+            self.forget(update)
+            raise
+
+    async def reserve(self):
+        """Wait for a free worker and keep it for the next update to start."""
+        await self._slots.acquire()
+        self._reserved += 1
+
+    def release_reserved(self):
+        """Give back a worker reserved for an update that won't run on it."""
+        if self._reserved:
+            self._reserved -= 1
+            self._slots.release()
+
+    def forget(self, update):
+        """Let a redelivered copy of a failed `update` run again."""
+        if self.seen is not None and isinstance(update, Update):
+            self.seen.discard(update.update_id)
+
+    async def _process(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        ahead = self._waiters.get(key, 0)
+        self._waiters[key] = ahead + 1
+        try:
+            if ahead:
+                # Waiting behind its own chat isn't running; another chat can use the worker
+                self.release_reserved()
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def _run(self, coroutine):
+        if self._reserved:
+            self._reserved -= 1
+        else:
+            await self._slots.acquire()
+        try:
+            await coroutine
+        finally:
+            self._slots.release()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class UpdateQueue(asyncio.Queue):
+    """The application's update queue, handed out only when a worker is free.
+
+    Application.update_queue for a ChatOrderedUpdateProcessor: get()
+    reserves one of the processor's workers first, so updates stay queued,
+    and `maxsize` applies backpressure, while every worker is busy.
+    """
+
+    def __init__(self, processor, maxsize=0):
+        super().__init__(maxsize)
+        self.processor = processor
+
+    async def get(self):
+        await self.processor.reserve()
+        try:
+            return await super().get()
+        except BaseException:
+            self.processor.release_reserved()
+            raise
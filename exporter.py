@@ -0,0 +1,111 @@
+import csv
+import gzip
+import io
+import tempfile
+from datetime import datetime
+
+from config import EXPORT_SPOOL_BYTES
+
+EXPORT_COLUMNS = [
+    'chat_id', 'first_name', 'username', 'joined_date',
+    'referred_by', 'referrals', 'last_active', 'status'
+]
+
+# CSV column -> (user field, default)
+_FIELDS = {
+    'chat_id': ('chat_id', ''),
+    'first_name': ('first_name', ''),
+    'username': ('username', ''),
+    'joined_date': ('joined_at', ''),
+    'referred_by': ('referred_by', ''),
+    'referrals': ('referrals', 0),
+    'last_active': ('last_active', ''),
+    'status': ('status', ''),
+}
+
+
+def parse_export_args(args):
+    """Parse /export arguments into keyword arguments for export_users().
+
+    Accepts `status=<s>`, `joined_after=<YYYY-MM-DD>`, `has_referrals`,
+    `columns=<a,b,...>` and `gzip`. Raises ValueError on anything else.
+    """
+    options = {}
+    for arg in args:
+        key, _, value = arg.partition('=')
+        if key == 'status' and value:
+            options['status'] = value
+        elif key == 'joined_after' and value:
+            try:
+                options['joined_after'] = datetime.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"joined_after needs a date like 2026-01-31, not {value!r}") from None
+        elif key == 'has_referrals' and not value:
+            options['has_referrals'] = True
+        elif key == 'columns' and value:
+            columns = value.split(',')
+            unknown = [c for c in columns if c not in _FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+            options['columns'] = columns
+        elif key == 'gzip' and not value:
+            options['compress'] = True
+        else:
+            raise ValueError(f"Unknown option: {arg}")
+    return options
+
+
+def _timestamp(value):
+    """A date/datetime (or ISO string) in the stored `str(datetime)` form."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return str(value)
+
+
+def _matches(user, status, joined_after, has_referrals):
+    if status and user.get('status') != status:
+        return False
+    # Stored timestamps are str(datetime), 'YYYY-MM-DD HH:MM:SS[.ffffff]',
+    # so once joined_after is in that form too string order is time order
+    if joined_after and (user.get('joined_at') or '') <= joined_after:
+        return False
+    if has_referrals and not user.get('referrals'):
+        return False
+    return True
+
+
+def export_users(users, columns=None, status=None, joined_after=None,
+                 has_referrals=False, compress=False):
+    """Stream (chat_id, user) pairs into a CSV held in a spooled temp file.
+
+    Rows are written one at a time, so only the encoder's buffer and the
+    spool (in memory up to EXPORT_SPOOL_BYTES, on disk past that) are ever
+    held. Returns (file positioned at 0, rows written).
+    """
+    columns = columns or EXPORT_COLUMNS
+    if joined_after:
+        joined_after = _timestamp(joined_after)
+    fields = [_FIELDS[c] for c in columns]
+
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES, mode='w+b')
+    raw = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='', write_through=False)
+    writer = csv.writer(text)
+
+    writer.writerow(columns)
+    count = 0
+    for chat_id, user in users:
+        if not _matches(user, status, joined_after, has_referrals):
+            continue
+        writer.writerow([
+            chat_id if field == 'chat_id' else user.get(field, default)
+            for field, default in fields
+        ])
+        count += 1
+
+    text.flush()
+    text.detach()
+    if compress:
+        raw.close()  # writes the gzip trailer; leaves the spool open
+    spool.seek(0)
+    return spool, count
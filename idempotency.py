@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A bounded set of recently seen keys, each forgotten after `ttl` seconds.
+
+    add() remembers a key and says whether it was already there, which
+    makes it a cheap duplicate check for redelivered updates and
+    double-tapped commands; discard() forgets one whose work failed, so a
+    retry gets through. Every key lives for the same `ttl`,
+    so insertion order is expiry order and expired keys are dropped from
+    the front as new ones come in; beyond `maxsize` keys the oldest go
+    early.
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.duplicates = 0
+        self._expires = OrderedDict()
+
+    def add(self, key):
+        """Remember `key`. Returns False if it was seen within the last `ttl` seconds."""
+        now = self.clock()
+        self._expire(now)
+        if key in self._expires:
+            self.duplicates += 1
+            return False
+        self._expires[key] = now + self.ttl
+        if len(self._expires) > self.maxsize:
+            self._expires.popitem(last=False)
+        return True
+
+    def discard(self, key):
+        """Forget `key`, so the next add() of it succeeds."""
+        self._expires.pop(key, None)
+
+    def _expire(self, now):
+        expires = self._expires
+        while expires:
+            key, expiry = next(iter(expires.items()))
+            if expiry > now:
+                break
+            del expires[key]
+
+    def __contains__(self, key):
+        expiry = self._expires.get(key)
+        return expiry is not None and expiry > self.clock()
+
+    def __len__(self):
+        return len(self._expires)
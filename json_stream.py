@@ -0,0 +1,136 @@
+import json
+import re
+import sys
+from json.scanner import make_scanner
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _Stream:
+    """Pull JSON values one at a time out of a file read in chunks."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.scan = make_scanner(json.JSONDecoder())
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def next_char(self):
+        """Like peek(), but consume the character."""
+        char = self.peek()
+        self.pos += len(char)
+        return char
+
+    def expect(self, char):
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f"Expected {char!r}, got {found!r}")
+
+    def value(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            try:
+                value, end = self.scan(self.buf, self.pos)
+            except (StopIteration, json.JSONDecodeError):
+                # Most likely the value runs past the buffer; read more
+                if self._fill():
+                    continue
+                raise ValueError(f"Invalid or truncated JSON value at {self.pos}") from None
+            # A number could continue in the next chunk
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def keys(self):
+        """Yield the keys of the object starting here; the caller reads each value."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            separator = self.next_char()
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}', got {separator!r}")
+
+    def items(self):
+        """Yield (key, value) pairs of the object starting here, one at a time."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        scan, skip = self.scan, _WHITESPACE.match
+        while True:
+            buf = self.buf
+            try:
+                key, pos = scan(buf, skip(buf, self.pos).end())
+                pos = skip(buf, pos).end()
+                if buf[pos] != ':':
+                    raise ValueError(f"Expected ':', got {buf[pos]!r}")
+                value, pos = scan(buf, skip(buf, pos + 1).end())
+                pos = skip(buf, pos).end()
+                separator = buf[pos]
+            except (StopIteration, json.JSONDecodeError, IndexError):
+                # The member runs past the buffer: read more and retry it
+                if not self._fill():
+                    raise ValueError("Invalid or truncated JSON object") from None
+                continue
+            self.pos = pos + 1
+            yield key, value
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}', got {separator!r}")
+
+
+def iter_snapshot(path, chunk_size=1024 * 1024):
+    """Stream a users_database.json snapshot record by record.
+
+    Yields ('users', chat_id, user) for each user and (None, key, value)
+    for every other top-level key, in file order. Only one user record is
+    decoded at a time, so peak memory is the records kept plus one chunk,
+    not the whole text on top of the whole object tree. User keys are
+    interned so a million records share one copy of each field name, as
+    they would after json.load.
+    """
+    intern = sys.intern
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _Stream(f, chunk_size)
+        for key in stream.keys():
+            if key != 'users':
+                yield None, key, stream.value()
+                continue
+            for chat_id, user in stream.items():
+                yield 'users', chat_id, {intern(k): v for k, v in user.items()}
+        if stream.next_char():
+            raise ValueError("Extra data after the snapshot object")
+
+
+def iter_snapshot_users(path, chunk_size=1024 * 1024):
+    """Yield (chat_id, user) from a users_database.json without loading it whole."""
+    for section, key, value in iter_snapshot(path, chunk_size):
+        if section == 'users':
+            yield key, value
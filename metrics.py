@@ -0,0 +1,241 @@
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+
+from config import METRICS_ENABLED, METRICS_LISTEN, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a dict lookup to a slow Telegram call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)) + '}'
+
+
+class Counter:
+    """A monotonically increasing count, one per combination of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_label_text(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """A value read from `fn` at scrape time (user count, file size, ...)."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def samples(self):
+        value = self.fn()
+        # None: not known yet (e.g. the user count while the store loads)
+        if value is not None:
+            yield f"{self.name} {value}"
+
+
+class Histogram:
+    """Counts of observed durations per bucket, plus their sum and count.
+
+    Buckets are stored non-cumulatively and summed at scrape time, so an
+    observation is one bisect and two additions under a lock.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = sorted((labels, values[:]) for labels, values in self._series.items())
+        names = self.labelnames + ('le',)
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                yield f"{self.name}_bucket{_label_text(names, labels + (bound,))} {cumulative}"
+            text = _label_text(self.labelnames, labels)
+            yield f"{self.name}_sum{text} {values[-1]}"
+            yield f"{self.name}_count{text} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                logger.error(f"Collecting {metric.name} failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    'bot_handler_seconds', 'Time spent handling an update, by handler', ('handler',)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors_total', 'Handlers that raised, by handler', ('handler',)))
+DB_SECONDS = REGISTRY.register(Histogram(
+    'bot_db_seconds', 'Time spent in database methods, by method', ('method',)))
+API_SECONDS = REGISTRY.register(Histogram(
+    'bot_api_seconds', 'Bot API call latency, by endpoint', ('endpoint',)))
+BROADCAST_MESSAGES = REGISTRY.register(Counter(
+    'bot_broadcast_messages_total', 'Broadcast deliveries, by outcome (sent/failed/retried)',
+    ('outcome',)))
+
+
+def gauge(name, help, fn):
+    """Register a gauge read from `fn()` on every scrape."""
+    return REGISTRY.register(Gauge(name, help, fn))
+
+
+def timed_handler(callback):
+    """Wrap an update handler to record its duration. Returns it as is when metrics are off."""
+    if not METRICS_ENABLED:
+        return callback
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+def instrument(obj, histogram=DB_SECONDS):
+    """Time every public method of `obj`, labelled with the method name.
+
+    The wrappers are set on the instance, so calls the object makes on
+    itself (e.g. the background flusher calling self.save()) are timed
+    too. Does nothing when metrics are off.
+    """
+    if not METRICS_ENABLED:
+        return obj
+    for name in dir(type(obj)):
+        if name.startswith('_'):
+            continue
+        method = getattr(obj, name)
+        if not callable(method) or asyncio.iscoroutinefunction(method):
+            continue
+        setattr(obj, name, _timed_method(method, name, histogram))
+    return obj
+
+
+def _timed_method(method, name, histogram):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+class MetricsServer:
+    """Serves REGISTRY on GET /metrics over plain HTTP, for Prometheus to scrape.
+
+    Binds to localhost by default; the numbers aren't secret but there is
+    no reason to expose them further than the scraper.
+    """
+
+    def __init__(self, registry=REGISTRY, listen=METRICS_LISTEN, port=METRICS_PORT):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"📈 Metrics on http://{self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if method != 'GET' or target.split('?', 1)[0] != '/metrics':
+                status, body = '404 Not Found', b''
+            else:
+                status, body = '200 OK', self.registry.render().encode('utf-8')
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,30 @@
+"""One-shot migration of users_database.json into a SQLite database.
+
+Usage:
+    python migrate_to_sqlite.py [source.json] [target.db]
+
+Afterwards point DB_PATH at the .db file to run the bot on SQLite.
+"""
+import sys
+from pathlib import Path
+
+from sqlite_database import SQLiteDatabase
+
+
+def main():
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else Path('users_database.json')
+    target = Path(sys.argv[2]) if len(sys.argv) > 2 else source.with_suffix('.db')
+
+    if not source.exists():
+        print(f"❌ {source} not found")
+        return
+
+    db = SQLiteDatabase(target)
+    count = db.import_json(source)
+    print(f"✅ Imported {count} users from {source} into {target}")
+    print(f"📊 Users now in {target}: {db.user_count()}")
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
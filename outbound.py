@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+
+import httpx
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
+
+from config import (
+    API_POOL_SIZE, API_KEEPALIVE_SECONDS, API_POOL_TIMEOUT, API_HTTP_VERSION,
+    NOTIFY_QUEUE_SIZE, NOTIFY_WORKERS, NOTIFY_MAX_RETRIES, METRICS_ENABLED
+)
+from metrics import API_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class EndpointLatency:
+    """Call count, errors and recent latencies of one Bot API method."""
+
+    def __init__(self, window):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds, ok):
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+    def percentile(self, pct):
+        values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class LatencyTracker:
+    """Per-endpoint latency of outgoing Bot API calls (sendMessage, ...).
+
+    Percentiles are over the last `window` calls of each endpoint; counts
+    and the max cover everything since startup.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.endpoints = {}
+
+    def record(self, endpoint, seconds, ok=True):
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = EndpointLatency(self.window)
+        stats.record(seconds, ok)
+
+    def format_summary(self):
+        if not self.endpoints:
+            return "No Bot API calls yet"
+        lines = ["`endpoint               calls  err    p50    p95    max`"]
+        for endpoint, stats in sorted(self.endpoints.items(), key=lambda item: -item[1].calls):
+            lines.append(
+                f"`{endpoint:<21} {stats.calls:>6} {stats.errors:>4} "
+                f"{stats.percentile(50) * 1e3:>5.0f}ms {stats.percentile(95) * 1e3:>4.0f}ms "
+                f"{stats.max * 1e3:>4.0f}ms`"
+            )
+        return "\n".join(lines)
+
+
+class TrackedRequest(HTTPXRequest):
+    """HTTPXRequest with a tuned keep-alive pool that times every call.
+
+    Handlers, broadcasts and notifications share `pool_size` connections,
+    and idle ones are kept open for `keepalive` seconds (httpx closes them
+    after 5s by default), so bursts after a quiet spell don't pay for new
+    TCP + TLS handshakes. Latency is recorded per Bot API method, and
+    also exported as a histogram when metrics are enabled.
+    """
+
+    def __init__(self, tracker, pool_size=API_POOL_SIZE, keepalive=API_KEEPALIVE_SECONDS,
+                 pool_timeout=API_POOL_TIMEOUT, http_version=API_HTTP_VERSION, **kwargs):
+        super().__init__(
+            connection_pool_size=pool_size,
+            pool_timeout=pool_timeout,
+            http_version=http_version,
+            httpx_kwargs={'limits': httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive
+            )},
+            **kwargs
+        )
+        self.tracker = tracker
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        ok = False
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            ok = code < 400
+            return code, payload
+        finally:
+            elapsed = time.perf_counter() - started
+            self.tracker.record(endpoint, elapsed, ok)
+            if METRICS_ENABLED:
+                API_SECONDS.observe(elapsed, endpoint)
+
+
+class NotificationQueue:
+    """Fire-and-forget messages, sent by background workers with retry.
+
+    notify() only enqueues, so a handler can reply to its own user without
+    waiting on a message to somebody else. Flood control (RetryAfter) waits
+    the requested time and network errors back off exponentially, up to
+    `max_retries`; a blocked chat or a bad request is given up on at once.
+    A timed-out send may in fact have arrived, so a retry can deliver the
+    same notification twice; that beats losing it. When the queue is full
+    new notifications are dropped and counted.
+    """
+
+    def __init__(self, maxsize=NOTIFY_QUEUE_SIZE, workers=NOTIFY_WORKERS,
+                 max_retries=NOTIFY_MAX_RETRIES, backoff=1.0):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.bot = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+
+    def start(self, bot):
+        self.bot = bot
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f'notify-{i}') for i in range(self.workers)
+        ]
+
+    async def stop(self, timeout=10.0):
+        """Give queued notifications up to `timeout` seconds to go out, then stop."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self._queue.qsize()} notifications unsent")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self, chat_id, text, **send_kwargs):
+        """Queue a message for `chat_id`. Returns False if it had to be dropped."""
+        try:
+            self._queue.put_nowait((chat_id, text, send_kwargs))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Notification queue full, dropping message to {chat_id}")
+            return False
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    async def _worker(self):
+        while True:
+            chat_id, text, send_kwargs = await self._queue.get()
+            try:
+                await self._send(chat_id, text, send_kwargs)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, chat_id, text, send_kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **send_kwargs)
+                self.sent += 1
+                return
+            except RetryAfter as e:
+                error, delay = e, e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+            except (BadRequest, Forbidden) as e:
+                error = e
+                break  # retrying won't help
+            except NetworkError as e:
+                error, delay = e, self.backoff * 2 ** attempt
+            except Exception as e:
+                error = e
+                break
+            if attempt == self.max_retries:
+                break
+            self.retried += 1
+            await asyncio.sleep(delay)
+        self.failed += 1
+        logger.error(f"Giving up on notification to {chat_id}: {error}")
@@ -0,0 +1,177 @@
+"""Move the user database from one shard layout to another (see DB_SHARDS).
+
+Usage:
+    python rebalance_shards.py --to N [--from M] [db_path]
+
+Stop the bot first. Every source file is streamed one record at a time and
+each user is written straight into the file of its new shard, so memory
+use stays flat however many users there are. Daily rollups are summed
+into the first new shard, message logs (MESSAGE_LOG_PATH) are split by
+chat id as well, and the old files are removed once the new ones are in
+place. Journaled shards (DB_JOURNAL) must have their journal compacted
+first. --from defaults to the layout found on disk; 1 is the unsharded
+users_database.json.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+from analytics import DailyRollups, backfill, iter_message_log, merge_stats
+from config import BROADCAST_JOBS_DIR, DB_PATH, MESSAGE_LOG_PATH
+from json_stream import iter_snapshot, iter_snapshot_users
+from shards import shard_log_paths, shard_of, shard_paths, stored_shard_counts
+
+
+class ShardWriter:
+    """Write a snapshot file user by user, without holding it in memory."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmp_file = f"{path}.tmp"
+        self.count = 0
+        self._f = open(self.tmp_file, 'w', encoding='utf-8')
+        self._f.write('{"users":{')
+
+    def add(self, chat_id, user):
+        if self.count:
+            self._f.write(',')
+        self._f.write(f"{json.dumps(chat_id)}:{json.dumps(user, separators=(',', ':'))}")
+        self.count += 1
+
+    def finish(self, settings, daily_stats):
+        self._f.write(f'}},"total_users":{self.count}')
+        self._f.write(f',"settings":{json.dumps(settings, separators=(",", ":"))}')
+        self._f.write(f',"daily_stats":{json.dumps(daily_stats, separators=(",", ":"))}}}')
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+
+    def commit(self):
+        os.replace(self.tmp_file, self.path)
+
+
+def check_journal(path):
+    """Refuse to move a journaled shard whose journal isn't folded in yet."""
+    journal = f"{path}.journal"
+    if os.path.exists(f"{journal}.1") or (os.path.exists(journal) and os.path.getsize(journal)):
+        raise ValueError(
+            f"{journal} has changes that are not in {path} yet; run the bot once with "
+            f"DB_JOURNAL_COMPACT_BYTES=1 so the next update compacts it, then stop it"
+        )
+
+
+def split_message_logs(sources, targets):
+    """Route every complete message log record to its chat's new shard log.
+
+    Returns the temp files written, as (tmp, final path) pairs.
+    """
+    if not targets[0]:
+        return []
+    outputs = [open(f"{target}.tmp", 'w', encoding='utf-8') for target in targets]
+    for source in sources:
+        if not os.path.exists(source):
+            continue
+        with open(source, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # torn last record
+                outputs[shard_of(json.loads(line)['chat_id'], len(targets))].write(line)
+    for output in outputs:
+        output.flush()
+        os.fsync(output.fileno())
+        output.close()
+    return [(f"{target}.tmp", target) for target in targets]
+
+
+def rebalance(db_file, source, target, message_log=MESSAGE_LOG_PATH, jobs_dir=BROADCAST_JOBS_DIR):
+    """Rewrite a `source`-way split of db_file as a `target`-way split.
+
+    Returns the number of users written to each new shard.
+    """
+    sources = shard_paths(db_file, source)
+    source_logs = shard_log_paths(message_log, source)
+    missing = [str(path) for path in sources if not path.exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing shard file(s): {', '.join(missing)}")
+    for path in sources:
+        check_journal(path)
+
+    writers = [ShardWriter(path) for path in shard_paths(db_file, target)]
+    settings = {}
+    stats = []
+    joined_at = None
+    for path, log in zip(sources, source_logs):
+        daily_stats = None
+        for section, key, value in iter_snapshot(path):
+            if section == 'users':
+                writers[shard_of(key, target)].add(key, value)
+            elif key == 'settings':
+                settings.update(value)
+            elif key == 'daily_stats':
+                daily_stats = value
+        if daily_stats is None:
+            # Written before rollups existed: count them from the file itself
+            messages = iter_message_log(log) if log and os.path.exists(log) else None
+            if joined_at is None and len(sources) > 1:
+                # Referrers may be in another source file: one pass for join times
+                joined_at = {
+                    chat_id: user.get('joined_at') or ''
+                    for source_path in sources for chat_id, user in iter_snapshot_users(source_path)
+                }
+            daily_stats = backfill(DailyRollups(), iter_snapshot_users(path), messages, jobs_dir, joined_at).days
+            jobs_dir = None  # broadcast failures are only counted once
+        stats.append(daily_stats.items())
+
+    # Totals don't depend on where a user lives, so they all go to shard 0
+    writers[0].finish(settings, dict(merge_stats(stats)))
+    for writer in writers[1:]:
+        writer.finish({}, {})
+    logs = split_message_logs(source_logs, shard_log_paths(message_log, target))
+
+    for writer in writers:
+        writer.commit()
+    for tmp_file, log in logs:
+        os.replace(tmp_file, log)
+    for path, log in zip(sources, source_logs):
+        os.remove(path)
+        if os.path.exists(f"{path}.journal"):
+            os.remove(f"{path}.journal")
+        if log and os.path.exists(log):
+            os.remove(log)
+    return [writer.count for writer in writers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('db_path', nargs='?', default=str(DB_PATH))
+    parser.add_argument('--to', type=int, required=True, help='new number of shards')
+    parser.add_argument('--from', dest='source', type=int,
+                        help='current number of shards (default: detected from the files)')
+    args = parser.parse_args()
+
+    source = args.source
+    if source is None:
+        stored = stored_shard_counts(args.db_path)
+        if len(stored) != 1:
+            found = ', '.join(map(str, stored)) or 'none'
+            print(f"❌ Can't tell the current layout of {args.db_path} (found: {found}); pass --from")
+            return
+        source = stored[0]
+    if args.to < 1 or source == args.to:
+        print(f"❌ Nothing to do for --from {source} --to {args.to}")
+        return
+
+    try:
+        counts = rebalance(args.db_path, source, args.to)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        return
+    print(f"✅ Moved {sum(counts)} users from {source} to {args.to} shard(s)")
+    for path, count in zip(shard_paths(args.db_path, args.to), counts):
+        print(f"📊 {path}: {count} users")
+    print(f"Set DB_SHARDS={args.to} before starting the bot.")
+
+
+if __name__ == '__main__':
+    main()
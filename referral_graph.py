@@ -0,0 +1,145 @@
+import bisect
+
+
+class ReferralGraph:
+    """In-memory referral tree with O(1) downline lookups and a leaderboard.
+
+    Keeps referrer -> direct referrals, each user's referrer, and the size
+    of every user's whole downline (all levels). Counts of direct referrals
+    are bucketed (count -> users, kept sorted) with a sorted list of the
+    distinct counts, so the top N referrers come out in O(N + D) without a
+    scan or a sort, however large the ties. Each bucket also knows how many
+    referrers are above it, which is a user's rank.
+
+    Edges that would make a user their own referrer, directly or through a
+    loop, are refused.
+    """
+
+    def __init__(self):
+        self.children = {}
+        self.parent = {}
+        self.downline = {}
+        self._buckets = {}
+        self._counts = []
+        # count -> referrers with more direct referrals than that
+        self._above = {}
+        self._referrers = 0
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, chat_id, referred_by):
+        """Record that `referred_by` referred `chat_id`. Returns False if refused."""
+        if not self._link(chat_id, referred_by):
+            return False
+        self._move_bucket(referred_by, len(self.children[referred_by]))
+        return True
+
+    def _link(self, chat_id, referred_by):
+        """Add the edge to the tree and downline sizes, leaving the buckets alone."""
+        if not referred_by or chat_id == referred_by or chat_id in self.parent:
+            return False
+        # Walk up from the referrer: finding chat_id there would close a loop
+        ancestors = []
+        node = referred_by
+        while node is not None:
+            if node == chat_id:
+                return False
+            ancestors.append(node)
+            node = self.parent.get(node)
+
+        self.parent[chat_id] = referred_by
+        kids = self.children.setdefault(referred_by, [])
+        kids.append(chat_id)
+
+        moved = self.downline.get(chat_id, 0) + 1
+        for node in ancestors:
+            self.downline[node] = self.downline.get(node, 0) + moved
+        return True
+
+    def _rebuild_buckets(self):
+        by_count = {}
+        for chat_id, kids in self.children.items():
+            by_count.setdefault(len(kids), []).append(chat_id)
+        self._counts = sorted(by_count)
+        self._buckets = {count: sorted(by_count[count]) for count in self._counts}
+        self._above = {}
+        above = 0
+        for count in reversed(self._counts):
+            self._above[count] = above
+            above += len(self._buckets[count])
+        self._referrers = above
+
+    def _move_bucket(self, chat_id, count):
+        """`chat_id` went from `count - 1` direct referrals to `count`."""
+        old = count - 1
+        # Referrers above `old` before the move: above `count` after it
+        above = self._above[old] if old else self._referrers
+        if old:
+            bucket = self._buckets[old]
+            del bucket[bisect.bisect_left(bucket, chat_id)]
+            if bucket:
+                self._above[old] += 1
+            else:
+                del self._buckets[old]
+                del self._above[old]
+                del self._counts[bisect.bisect_left(self._counts, old)]
+        else:
+            self._referrers += 1
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = []
+            self._above[count] = above
+            bisect.insort(self._counts, count)
+        bisect.insort(bucket, chat_id)
+
+    def direct_referrals(self, chat_id):
+        return self.children.get(chat_id, [])
+
+    def downline_size(self, chat_id):
+        """Everyone below `chat_id`, at any depth."""
+        return self.downline.get(chat_id, 0)
+
+    def referrer_of(self, chat_id):
+        return self.parent.get(chat_id)
+
+    def leaderboard(self, limit=10):
+        """[(chat_id, direct referrals)] for the top `limit` referrers."""
+        top = []
+        for count in reversed(self._counts):
+            if len(top) >= limit:
+                break
+            top.extend((chat_id, count) for chat_id in self._buckets[count][:limit - len(top)])
+        return top
+
+    def rank_of(self, chat_id):
+        """1-based position on the leaderboard (ties share a rank), or None."""
+        count = len(self.children.get(chat_id, ()))
+        if not count:
+            return None
+        return 1 + self._above[count]
+
+    @classmethod
+    def build(cls, users):
+        """Build from (chat_id, referred_by, joined_at) triples.
+
+        Only referrals where the referrer had already joined count, which
+        is the rule add_user applies; that also rules out loops in stored
+        data. `joined_at` may be any orderable value (string or int); users
+        without one count as having joined first.
+        """
+        graph = cls()
+        users = list(users)
+        undated = [u for u in users if u[2] is None or u[2] == '']
+        users = undated + sorted((u for u in users if u[2] is not None and u[2] != ''),
+                                 key=lambda u: u[2])
+        joined = {chat_id: joined_at or None for chat_id, _, joined_at in users}
+        for chat_id, referred_by, joined_at in users:
+            if referred_by not in joined:
+                continue
+            referrer_joined = joined[referred_by]
+            if referrer_joined is None or (joined_at and referrer_joined <= joined_at):
+                graph._link(chat_id, referred_by)
+        # Sorting each bucket once beats inserting into it edge by edge
+        graph._rebuild_buckets()
+        return graph
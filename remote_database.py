@@ -0,0 +1,264 @@
+import builtins
+import json
+import queue
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+
+from user_record import UserRecord
+
+# Wire format: every message is a 4-byte big-endian length and a compact
+# JSON array. Requests are [id, method, args]; responses [id, status, value].
+HEADER = struct.Struct('>I')
+OK, ERROR, ITEMS, END = range(4)
+# Items per ITEMS frame when a method streams (iter_users)
+STREAM_CHUNK = 1000
+
+
+def encode_frame(message):
+    # Records go over the wire as the dicts they stand in for
+    body = json.dumps(message, separators=(',', ':'), default=_encode_record).encode('utf-8')
+    return HEADER.pack(len(body)) + body
+
+
+def decode_frame(body):
+    return json.loads(body)
+
+
+def _encode_record(obj):
+    if isinstance(obj, UserRecord):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError('Storage server closed the connection')
+    return data
+
+
+def _read_frame(stream):
+    (size,) = HEADER.unpack(_read_exactly(stream, HEADER.size))
+    return decode_frame(_read_exactly(stream, size))
+
+
+def _error(value):
+    """Rebuild an exception raised in the server (builtins only, else RuntimeError)."""
+    name, message = value
+    cls = getattr(builtins, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        return RuntimeError(f"{name}: {message}")
+    return cls(message)
+
+
+class _Connection:
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(path))
+        self.stream = self.sock.makefile('rb')
+        self.next_id = 0
+
+    def send(self, calls):
+        """Write all `calls` in one go; returns their request ids."""
+        ids = []
+        frames = []
+        for method, args in calls:
+            self.next_id += 1
+            ids.append(self.next_id)
+            frames.append(encode_frame([self.next_id, method, args]))
+        self.sock.sendall(b''.join(frames))
+        return ids
+
+    def receive(self):
+        return _read_frame(self.stream)
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+class RemoteDatabase:
+    """Client for a storage server (storage_server.py) with the Database API.
+
+    Lets several bot worker processes share one store: the server process
+    owns the data and every method here is a request to it over a Unix
+    socket. Connections are pooled (up to `pool_size`, opened on first
+    use) and each call checks one out for its round trip, so threads
+    don't wait on each other's requests. pipeline() sends several calls in
+    one write and reads the answers back together.
+
+    Records come back as plain dicts, which is what SQLiteDatabase returns
+    too. Calls block for a local round trip (tens of microseconds), the
+    same as the in-memory reads they replace block on the lock.
+    """
+
+    def __init__(self, path, db_file=None, pool_size=4):
+        self.path = path
+        # The server's file, for size gauges (storage is on the same machine)
+        self.db_file = db_file
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+
+    # --- connection pool --------------------------------------------------
+
+    @contextmanager
+    def _connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+        except BaseException:
+            # Its replies may be half read; never hand it out again
+            self._discard(conn)
+            raise
+        self._idle.put(conn)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            opening = self._opened < self.pool_size
+            if opening:
+                self._opened += 1
+        if not opening:
+            return self._idle.get()
+        try:
+            return _Connection(self.path)
+        except OSError:
+            with self._pool_lock:
+                self._opened -= 1
+            raise
+
+    def _discard(self, conn):
+        conn.close()
+        with self._pool_lock:
+            self._opened -= 1
+
+    def pipeline(self, calls):
+        """Run [(method, args), ...] in one round trip; returns the results in order.
+
+        If any call failed, every reply is still read and the first error
+        is raised.
+        """
+        calls = [(method, list(args)) for method, args in calls]
+        with self._connection() as conn:
+            ids = conn.send(calls)
+            replies = {}
+            while len(replies) < len(ids):
+                request_id, status, value = conn.receive()
+                replies[request_id] = (status, value)
+        results = []
+        for request_id in ids:
+            status, value = replies[request_id]
+            if status == ERROR:
+                raise _error(value)
+            results.append(value)
+        return results
+
+    def _call(self, method, *args):
+        return self.pipeline([(method, args)])[0]
+
+    def _stream(self, method, *args):
+        with self._connection() as conn:
+            conn.send([(method, list(args))])
+            while True:
+                _, status, value = conn.receive()
+                if status == END:
+                    break
+                if status == ERROR:
+                    raise _error(value)
+                yield from value
+
+    # --- Database API -------------------------------------------------------
+
+    def wait_until_loaded(self, timeout=None):
+        return self._call('wait_until_loaded', timeout)
+
+    def save(self):
+        self._call('save')
+
+    def flush(self):
+        self._call('flush')
+
+    def close(self):
+        """Close this client's connections. The server and its data stay up."""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def rebuild_analytics(self):
+        return self._call('rebuild_analytics')
+
+    def add_user(self, chat_id, first_name, username, referred_by=None):
+        return self._call('add_user', chat_id, first_name, username, referred_by)
+
+    def register_user(self, chat_id, first_name, username, referred_by=None):
+        user, created = self._call('register_user', chat_id, first_name, username, referred_by)
+        return user, created
+
+    def credit_referral(self, chat_id):
+        return self._call('credit_referral', chat_id)
+
+    def get_user(self, chat_id):
+        return self._call('get_user', chat_id)
+
+    def user_count(self):
+        return self._call('user_count')
+
+    def get_leaderboard(self, limit=10):
+        return [(user, count) for user, count in self._call('get_leaderboard', limit)]
+
+    def get_downline(self, chat_id):
+        return self._call('get_downline', chat_id)
+
+    def update_last_active(self, chat_id):
+        self._call('update_last_active', chat_id)
+
+    def activity_summary(self):
+        return self._call('activity_summary')
+
+    def count_active_within(self, days):
+        return self._call('count_active_within', days)
+
+    def update_profile(self, chat_id, first_name, username):
+        return self._call('update_profile', chat_id, first_name, username)
+
+    def get_active_users(self, limit=100, within_days=None):
+        return self._call('get_active_users', limit, within_days)
+
+    def count_segment(self, expression):
+        return self._call('count_segment', expression)
+
+    def iter_segment(self, expression):
+        """Yield matching chat ids, streamed from the server in chunks."""
+        return self._stream('iter_segment', expression)
+
+    def get_all_users(self):
+        return dict(self.iter_users())
+
+    def iter_users(self):
+        """Yield (chat_id, user) pairs, streamed from the server in chunks."""
+        for chat_id, user in self._stream('iter_users'):
+            yield chat_id, user
+
+    def log_message_sent(self, chat_id, message_type):
+        self._call('log_message_sent', chat_id, message_type)
+
+    def log_messages_sent(self, chat_ids, message_type):
+        self._call('log_messages_sent', list(chat_ids), message_type)
+
+    def log_delivery_failures(self, chat_ids, message_type):
+        self._call('log_delivery_failures', list(chat_ids), message_type)
+
+    def get_daily_stats(self, days=7):
+        return [(day, stats) for day, stats in self._call('get_daily_stats', days)]
+
+    def get_message_counts(self, chat_id):
+        return self._call('get_message_counts', chat_id)
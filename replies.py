@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from string import Formatter
+
+from telegram.error import BadRequest
+
+
+class Template:
+    """A message text compiled once, with the per-user fields left open.
+
+    The text is split up front into literal runs and `{field}` slots, and
+    fields known ahead of time (the reward, the bot's username) are folded
+    into the literals, so render() only copies a short list, drops the
+    per-user values into their slots and joins it. That is a few times
+    cheaper than str.format, which re-parses the whole text on every call.
+    Format specs and conversions (`{x:>5}`, `{x!r}`) are not supported.
+    """
+
+    def __init__(self, text, **constants):
+        self.text = text
+        self._constants = constants
+        self._parts = []
+        self._slots = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if spec or conversion:
+                raise ValueError(f"Unsupported format in {{{field}}}")
+            self._literal(literal)
+            if field is None:
+                continue
+            if field in constants:
+                self._literal(str(constants[field]))
+            else:
+                self._slots.append((len(self._parts), field))
+                self._parts.append(None)
+        self.fields = tuple(field for _, field in self._slots)
+
+    def _literal(self, text):
+        if self._parts and self._parts[-1] is not None:
+            self._parts[-1] += text
+        else:
+            self._parts.append(text)
+
+    def bind(self, **constants):
+        """A copy with more fields filled in for good (e.g. once the bot username is known)."""
+        return Template(self.text, **self._constants, **constants)
+
+    def render(self, **values):
+        parts = self._parts[:]
+        for i, field in self._slots:
+            value = values[field]
+            parts[i] = value if type(value) is str else str(value)
+        return ''.join(parts)
+
+
+class EditTracker:
+    """Skip editing a message into exactly what it already shows.
+
+    Re-tapping a button asks for the same text and keyboard again, which
+    Telegram rejects with "Message is not modified". The last content each
+    message was edited to is remembered (for the `maxsize` most recently
+    edited messages) and an identical edit isn't sent at all. After a
+    restart, or for messages edited elsewhere, the API error is still
+    caught and treated as a skipped edit.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._shown = OrderedDict()
+
+    @staticmethod
+    def _key(query):
+        if query.inline_message_id:
+            return query.inline_message_id
+        if query.message is not None:
+            return query.message.chat.id, query.message.message_id
+        return None
+
+    async def edit(self, query, text, reply_markup=None, **kwargs):
+        """Edit the query's message; returns False if nothing had to change."""
+        key = self._key(query)
+        content = (text, reply_markup)
+        if key is not None and self._shown.get(key) == content:
+            self._shown.move_to_end(key)
+            return False
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+            edited = True
+        except BadRequest as e:
+            if 'message is not modified' not in str(e).lower():
+                raise
+            edited = False
+        if key is not None:
+            self._shown[key] = content
+            self._shown.move_to_end(key)
+            if len(self._shown) > self.maxsize:
+                self._shown.popitem(last=False)
+        return edited
@@ -0,0 +1,329 @@
+import operator
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from user_record import parse_micros
+
+# Segment fields and what their values are compared as. Times are given
+# as an age ('7d', '12h', '30m', '2w') or a date ('2026-01-01'; one with
+# an offset, '2026-01-01T09:00+02:00', is compared in local time), and
+# `campaign` (when the user last received one) can also be 'never'.
+FIELDS = {
+    'status': 'text',
+    'referrals': 'number',
+    'joined': 'time',
+    'active': 'time',
+    'campaign': 'time',
+}
+CAMPAIGN_TYPE = 'campaign'
+
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|([a-z_]+)\s*(>=|<=|!=|=|<|>)\s*([\w.:+-]+)|(and|or|not)\b)", re.IGNORECASE)
+_AGE = re.compile(r'(\d+)([mhdw])')
+_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+# "joined<7d" (less than 7 days ago) means joined after now - 7 days
+_AGE_OPS = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}
+_OPS = {
+    '=': operator.eq, '!=': operator.ne, '<': operator.lt,
+    '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+
+@lru_cache(maxsize=256)
+def parse_segment(expression):
+    """Parse a segment expression into a tree of tuples.
+
+    Terms are `<field><op><value>`, e.g. `status=active`, `referrals>=1`,
+    `joined<7d`, `active>=2026-01-01`, `campaign=never`; `and` (also
+    implied between adjacent terms), `or`, `not` and parentheses combine
+    them. Raises ValueError on anything else.
+    """
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match:
+            raise ValueError(f"Can't parse segment at: {expression[position:]}")
+        opening, closing, field, op, value, keyword = match.groups()
+        if opening or closing:
+            tokens.append(opening or closing)
+        elif keyword:
+            tokens.append(keyword.lower())
+        else:
+            tokens.append(_term(field.lower(), op, value))
+        position = match.end()
+    if not tokens:
+        raise ValueError("Empty segment")
+
+    tree, rest = _parse_or(tokens)
+    if rest:
+        raise ValueError(f"Unexpected {rest[0]!r} in segment")
+    return tree
+
+
+def _term(field, op, value):
+    kind = FIELDS.get(field)
+    if kind is None:
+        raise ValueError(f"Unknown segment field: {field} (use {', '.join(FIELDS)})")
+    if kind == 'text':
+        if op not in ('=', '!='):
+            raise ValueError(f"{field} only supports = and !=")
+        return ('cmp', field, op, value)
+    if kind == 'number':
+        try:
+            return ('cmp', field, op, int(value))
+        except ValueError:
+            raise ValueError(f"{field} needs a whole number, not {value!r}") from None
+    if value.lower() == 'never':
+        if op not in ('=', '!='):
+            raise ValueError(f"{field}=never and {field}!=never are the only comparisons with never")
+        return ('cmp', field, op, None)
+    age = _AGE.fullmatch(value.lower())
+    if age:
+        if op not in _AGE_OPS:
+            raise ValueError(f"Compare {field} with an age using <, <=, > or >=")
+        return ('age', field, op, int(age.group(1)) * _UNITS[age.group(2)])
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} needs an age like 7d or a date like 2026-01-01, not {value!r}") from None
+    if moment.tzinfo is not None:
+        # Stored times are naive local time; compare in the same terms
+        moment = moment.astimezone().replace(tzinfo=None)
+    return ('cmp', field, op, moment)
+
+
+def _parse_or(tokens):
+    left, tokens = _parse_and(tokens)
+    while tokens and tokens[0] == 'or':
+        right, tokens = _parse_and(tokens[1:])
+        left = ('or', left, right)
+    return left, tokens
+
+
+def _parse_and(tokens):
+    left, tokens = _parse_not(tokens)
+    while tokens and tokens[0] not in ('or', ')'):
+        if tokens[0] == 'and':
+            tokens = tokens[1:]
+        right, tokens = _parse_not(tokens)
+        left = ('and', left, right)
+    return left, tokens
+
+
+def _parse_not(tokens):
+    if not tokens:
+        raise ValueError("Segment ends too early")
+    token = tokens[0]
+    if token == 'not':
+        node, tokens = _parse_not(tokens[1:])
+        return ('not', node), tokens
+    if token == '(':
+        node, tokens = _parse_or(tokens[1:])
+        if not tokens or tokens[0] != ')':
+            raise ValueError("Missing ) in segment")
+        return node, tokens[1:]
+    if isinstance(token, tuple):
+        return token, tokens[1:]
+    raise ValueError(f"Unexpected {token!r} in segment")
+
+
+def resolve(tree, now=None):
+    """Turn ages into cutoff datetimes, leaving only `cmp` comparisons."""
+    now = now or datetime.now()
+    kind = tree[0]
+    if kind == 'age':
+        _, field, op, seconds = tree
+        return ('cmp', field, _AGE_OPS[op], now - timedelta(seconds=seconds))
+    if kind == 'cmp':
+        return tree
+    return (kind,) + tuple(resolve(node, now) for node in tree[1:])
+
+
+def last_campaign(user, campaign_type=CAMPAIGN_TYPE):
+    """Epoch of the user's latest campaign as far as their recent history shows.
+
+    For records saved before `last_campaign` was kept on them. 0 if they
+    never got one; 1 if they did but it has rotated out of the recent
+    history, which sorts it before any real date.
+    """
+    latest = 0
+    for message_type, at in user.get('recent_messages', ()):
+        if message_type == campaign_type and isinstance(at, int) and at > latest:
+            latest = at
+    if not latest and user.get('message_counts', {}).get(campaign_type):
+        return 1
+    return latest
+
+
+# How each field is read off a UserRecord, in the units the index stores
+_GETTERS = {
+    'status': lambda user: user.status,
+    'referrals': lambda user: user.referrals or 0,
+    'joined': lambda user: user.joined if type(user.joined) is int else 0,
+    'active': lambda user: user.active if type(user.active) is int else 0,
+    'campaign': lambda user: user.last_campaign or 0,
+}
+
+
+def _index_value(field, value):
+    """A resolved comparison value in the units the index stores for `field`."""
+    if value is None:
+        return 0
+    if not isinstance(value, datetime):
+        return value
+    if field == 'campaign':
+        return int(value.timestamp())  # message history keeps epoch seconds
+    return parse_micros(str(value))
+
+
+class SegmentIndex:
+    """Attribute indexes over the user table for evaluating segments.
+
+    Users are numbered by row, and a set of rows is a Python int used as a
+    bitset, so and/or/not on a million users are single big-int
+    operations. `status` keeps one bitset per value. Numeric and time
+    fields keep their values sorted alongside the rows in that order,
+    plus bitsets of every 1/CHECKPOINTS prefix of that order: a
+    comparison is two bisects, and the bits between each end and its
+    nearest checkpoint.
+
+    The index is a snapshot. Users changed since it was built are marked
+    dirty (and new ones appended): they are masked out of the bitsets and
+    checked one by one against their live records instead, until there
+    are enough of them that rebuilding is cheaper.
+    """
+
+    NUMERIC = ('referrals', 'joined', 'active', 'campaign')
+    # Bitsets of the first k/CHECKPOINTS of each sorted field are kept, so
+    # a range only sets the bits of the rows between it and a checkpoint
+    CHECKPOINTS = 32
+
+    def __init__(self, users):
+        users = list(users)
+        self.chat_ids = [chat_id for chat_id, _ in users]
+        self.rows = {chat_id: row for row, chat_id in enumerate(self.chat_ids)}
+        records = [user for _, user in users]
+        del users
+        self.size = len(records)
+        self.all = (1 << self.size) - 1
+        self.step = max(1, -(-self.size // self.CHECKPOINTS))
+
+        statuses = [user.status for user in records]
+        self.status = {
+            value: self._bits(row for row, status in enumerate(statuses) if status == value)
+            for value in set(statuses)
+        }
+        self.sorted = {}
+        for field in self.NUMERIC:
+            column = array('q', map(_GETTERS[field], records))
+            order = array('i', sorted(range(self.size), key=column.__getitem__))
+            values = array('q', map(column.__getitem__, order))
+            checkpoints = [0]
+            for start in range(0, self.size, self.step):
+                checkpoints.append(checkpoints[-1] | self._bits(order[start:start + self.step]))
+            self.sorted[field] = (values, order, checkpoints)
+
+        self.dirty = set()
+        self._dirty_bits = bytearray((self.size + 7) // 8)
+        self.added = []
+        self._added = set()
+
+    def _bits(self, rows):
+        buf = bytearray((self.size + 7) // 8)
+        for row in rows:
+            buf[row >> 3] |= 1 << (row & 7)
+        return int.from_bytes(buf, 'little')
+
+    def _prefix_bits(self, field, rank):
+        """Bitset of the rows ranked below `rank` in `field`'s sort order."""
+        _, order, checkpoints = self.sorted[field]
+        k, extra = divmod(rank, self.step)
+        if extra > self.step // 2 and k + 1 < len(checkpoints):
+            return checkpoints[k + 1] ^ self._bits(order[rank:min(self.size, (k + 1) * self.step)])
+        return checkpoints[k] | self._bits(order[k * self.step:rank])
+
+    def changed(self, chat_id):
+        """A user's record changed (or a new user appeared) since the build."""
+        row = self.rows.get(chat_id)
+        if row is None:
+            if chat_id not in self._added:
+                self._added.add(chat_id)
+                self.added.append(chat_id)
+        elif row not in self.dirty:
+            self.dirty.add(row)
+            self._dirty_bits[row >> 3] |= 1 << (row & 7)
+
+    @property
+    def stale(self):
+        return len(self.dirty) + len(self.added) > max(1024, self.size // 16)
+
+    def select(self, segment, users):
+        """Match a resolved segment. Returns (row bitset, [chat_ids of changed users])."""
+        segment = self._bind(segment)
+        bits = self._eval(segment)
+        if self.dirty:
+            bits &= ~int.from_bytes(self._dirty_bits, 'little')
+        extra = []
+        for chat_id in [self.chat_ids[row] for row in sorted(self.dirty)] + self.added:
+            user = users.get(chat_id)
+            if user is not None and self._test(user, segment):
+                extra.append(chat_id)
+        return bits, extra
+
+    def iter_chat_ids(self, bits):
+        """Chat ids of the rows set in `bits`, in row order, one at a time."""
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        chat_ids = self.chat_ids
+        for i, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                yield chat_ids[(i << 3) + low.bit_length() - 1]
+                byte ^= low
+
+    def _bind(self, node):
+        if node[0] == 'cmp':
+            _, field, op, value = node
+            return ('cmp', field, op, _index_value(field, value))
+        return (node[0],) + tuple(self._bind(child) for child in node[1:])
+
+    def _eval(self, node):
+        kind = node[0]
+        if kind == 'and':
+            return self._eval(node[1]) & self._eval(node[2])
+        if kind == 'or':
+            return self._eval(node[1]) | self._eval(node[2])
+        if kind == 'not':
+            return self.all ^ self._eval(node[1])
+        _, field, op, value = node
+        if field == 'status':
+            bits = self.status.get(value, 0)
+            return bits if op == '=' else self.all ^ bits
+        values = self.sorted[field][0]
+        if op == '<':
+            lo, hi = 0, bisect_left(values, value)
+        elif op == '<=':
+            lo, hi = 0, bisect_right(values, value)
+        elif op == '>':
+            lo, hi = bisect_right(values, value), self.size
+        elif op == '>=':
+            lo, hi = bisect_left(values, value), self.size
+        else:
+            lo, hi = bisect_left(values, value), bisect_right(values, value)
+        bits = self._prefix_bits(field, hi) ^ self._prefix_bits(field, lo)
+        return self.all ^ bits if op == '!=' else bits
+
+    def _test(self, user, node):
+        """Whether one (live) user record matches a bound segment."""
+        kind = node[0]
+        if kind == 'and':
+            return self._test(user, node[1]) and self._test(user, node[2])
+        if kind == 'or':
+            return self._test(user, node[1]) or self._test(user, node[2])
+        if kind == 'not':
+            return not self._test(user, node[1])
+        _, field, op, value = node
+        return _OPS[op](_GETTERS[field](user), value)
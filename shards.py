@@ -0,0 +1,39 @@
+import re
+import zlib
+from pathlib import Path
+
+
+def shard_of(chat_id, shards):
+    """Shard index for a chat id; stable across processes and restarts."""
+    return zlib.crc32(str(chat_id).encode()) % shards
+
+
+def shard_paths(db_file, shards):
+    """Files of a `shards`-way split of db_file; one shard is db_file itself."""
+    path = Path(db_file)
+    if shards == 1:
+        return [path]
+    return [path.with_name(f"{path.stem}.{i}-of-{shards}{path.suffix}") for i in range(shards)]
+
+
+def shard_log_paths(message_log, shards):
+    """Per-shard message log files, so shards never append to the same file."""
+    if not message_log:
+        return [None] * shards
+    if shards == 1:
+        return [message_log]
+    return [f"{message_log}.{i}-of-{shards}" for i in range(shards)]
+
+
+def stored_shard_counts(db_file):
+    """Shard counts db_file is currently stored as on disk (1 = unsharded)."""
+    path = Path(db_file)
+    counts = set()
+    if path.exists():
+        counts.add(1)
+    pattern = re.compile(rf"{re.escape(path.stem)}\.\d+-of-(\d+){re.escape(path.suffix)}")
+    for found in path.parent.glob(f"{path.stem}.*-of-*{path.suffix}"):
+        match = pattern.fullmatch(found.name)
+        if match:
+            counts.add(int(match.group(1)))
+    return sorted(counts)
@@ -0,0 +1,455 @@
+import json
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+from activity import same_window
+from analytics import DailyRollups, backfill
+from config import BROADCAST_JOBS_DIR, ACTIVITY_GRANULARITY_SECONDS
+from referral_graph import ReferralGraph
+from segments import CAMPAIGN_TYPE, parse_segment, resolve
+from user_record import to_micros
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    chat_id TEXT PRIMARY KEY,
+    first_name TEXT,
+    username TEXT,
+    joined_at TEXT NOT NULL,
+    referred_by TEXT,
+    referrals INTEGER NOT NULL DEFAULT 0,
+    last_active TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active'
+);
+CREATE INDEX IF NOT EXISTS idx_users_last_active ON users (last_active);
+CREATE INDEX IF NOT EXISTS idx_users_status ON users (status);
+CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users (referred_by);
+
+CREATE TABLE IF NOT EXISTS messages_sent (
+    id INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL REFERENCES users (chat_id),
+    type TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_sent_chat_id ON messages_sent (chat_id);
+
+-- Messages imported from a JSON store that only kept their count: they had
+-- rotated out of its recent history, so their times are gone
+CREATE TABLE IF NOT EXISTS earlier_messages (
+    chat_id TEXT NOT NULL REFERENCES users (chat_id),
+    type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, type)
+);
+
+-- Daily rollups; `key` is the message type for 'messages'/'failed', else ''
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    key TEXT NOT NULL DEFAULT '',
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, metric, key)
+);
+"""
+
+# Segment field -> SQL; a missing campaign compares as '' (never), one
+# only known from earlier_messages as '0' (before any date)
+SEGMENT_COLUMNS = {
+    'status': 'status',
+    'referrals': 'referrals',
+    'joined': 'joined_at',
+    'active': 'last_active',
+    'campaign': "COALESCE((SELECT MAX(timestamp) FROM messages_sent m "
+                "WHERE m.chat_id = users.chat_id AND m.type = 'campaign'), "
+                "(SELECT '0' FROM earlier_messages e "
+                "WHERE e.chat_id = users.chat_id AND e.type = 'campaign'), '')",
+}
+
+USER_COLUMNS = (
+    'chat_id', 'first_name', 'username', 'joined_at',
+    'referred_by', 'referrals', 'last_active', 'status'
+)
+
+
+class SQLiteDatabase:
+    """SQLite-backed store with the same method surface as Database.
+
+    Users come back as plain dicts shaped like the JSON records, minus the
+    message history, which lives in its own table (see get_messages).
+    """
+
+    def __init__(self, db_file, activity_granularity=ACTIVITY_GRANULARITY_SECONDS):
+        self.db_file = db_file
+        self.activity_granularity = activity_granularity
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(db_file), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(SCHEMA)
+        self._rebuild_referral_graph()
+        # Databases created before rollups existed get them backfilled once
+        has_users, has_stats = self.conn.execute(
+            'SELECT EXISTS (SELECT 1 FROM users), EXISTS (SELECT 1 FROM daily_stats)'
+        ).fetchone()
+        if has_users and not has_stats:
+            self.rebuild_analytics()
+
+    def _rebuild_referral_graph(self):
+        with self._lock:
+            self.referral_graph = ReferralGraph.build(
+                tuple(row) for row in self.conn.execute(
+                    'SELECT chat_id, referred_by, joined_at FROM users'
+                )
+            )
+
+    def _count(self, day, metric, n=1, key=''):
+        # Callers hold the lock and an open transaction
+        self.conn.execute(
+            'INSERT INTO daily_stats (day, metric, key, value) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (day, metric, key) DO UPDATE SET value = value + excluded.value',
+            (day, metric, key, n)
+        )
+
+    def _row_to_user(self, row):
+        return dict(row) if row else None
+
+    def add_user(self, chat_id, first_name, username, referred_by=None):
+        return self.register_user(chat_id, first_name, username, referred_by)[0]
+
+    def register_user(self, chat_id, first_name, username, referred_by=None):
+        """Atomically add a user (and credit the referrer). Returns (user, created)."""
+        str_chat_id = str(chat_id)
+        if referred_by == str_chat_id:
+            referred_by = None  # /start with your own link
+        now = str(datetime.now())
+        
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT OR IGNORE INTO users '
+                '(chat_id, first_name, username, joined_at, referred_by, last_active) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (str_chat_id, first_name, username, now, referred_by, now)
+            )
+            created = cursor.rowcount > 0
+            credited = 0
+            # Update referrer stats if applicable
+            if created and referred_by:
+                credited = self.conn.execute(
+                    'UPDATE users SET referrals = referrals + 1 WHERE chat_id = ?',
+                    (referred_by,)
+                ).rowcount
+                if credited:
+                    self.referral_graph.add(str_chat_id, referred_by)
+            if created:
+                day = now[:10]
+                self._count(day, 'signups')
+                # Only signups that credited a referrer, as the JSON store counts
+                if credited:
+                    self._count(day, 'referred_signups')
+                self._count(day, 'active_users')
+            return self.get_user(str_chat_id), created
+
+    def get_user(self, chat_id):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT * FROM users WHERE chat_id = ?', (str(chat_id),)
+            ).fetchone()
+        return self._row_to_user(row)
+
+    def get_leaderboard(self, limit=10):
+        """Top referrers as [(user, direct referrals)], best first."""
+        return [(self.get_user(chat_id), count)
+                for chat_id, count in self.referral_graph.leaderboard(limit)]
+
+    def get_downline(self, chat_id):
+        """Direct referrals, whole-downline size and leaderboard rank of a user."""
+        chat_id = str(chat_id)
+        graph = self.referral_graph
+        return {
+            'direct': list(graph.direct_referrals(chat_id)),
+            'total': graph.downline_size(chat_id),
+            'rank': graph.rank_of(chat_id)
+        }
+
+    def user_count(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def update_last_active(self, chat_id):
+        now = str(datetime.now())
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                'SELECT last_active FROM users WHERE chat_id = ?', (str(chat_id),)
+            ).fetchone()
+            if row is None:
+                return
+            # Nothing is kept in memory here, so touches within the same
+            # window are dropped rather than debounced
+            if same_window(to_micros(row['last_active']), to_micros(now), self.activity_granularity):
+                return
+            self.conn.execute(
+                'UPDATE users SET last_active = ? WHERE chat_id = ?',
+                (now, str(chat_id))
+            )
+            # First activity of the day counts the user as active that day
+            if row['last_active'][:10] != now[:10]:
+                self._count(now[:10], 'active_users')
+
+    def update_profile(self, chat_id, first_name, username):
+        """Store a changed name/username. Returns False (and writes nothing) if unchanged."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'UPDATE users SET first_name = ?, username = ? WHERE chat_id = ? '
+                'AND (first_name IS NOT ? OR username IS NOT ?)',
+                (first_name, username, str(chat_id), first_name, username)
+            )
+            return cursor.rowcount > 0
+
+    def activity_summary(self):
+        """{'dau', 'wau', 'mau'}: users last active today / in 7 / in 30 days."""
+        return {key: self.count_active_within(days)
+                for key, days in (('dau', 1), ('wau', 7), ('mau', 30))}
+
+    def count_active_within(self, days):
+        # A range count over idx_users_last_active
+        since = str(date.today() - timedelta(days=days - 1))
+        with self._lock:
+            return self.conn.execute(
+                'SELECT COUNT(*) FROM users WHERE last_active >= ?', (since,)
+            ).fetchone()[0]
+
+    def get_active_users(self, limit=100, within_days=None):
+        # Most recently active first, served by idx_users_last_active
+        since = str(date.today() - timedelta(days=within_days - 1)) if within_days else ''
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM users WHERE status = 'active' AND last_active >= ? "
+                'ORDER BY last_active DESC LIMIT ?',
+                (since, limit)
+            ).fetchall()
+        return [self._row_to_user(row) for row in rows]
+
+    def get_all_users(self):
+        with self._lock:
+            rows = self.conn.execute('SELECT * FROM users ORDER BY rowid').fetchall()
+        return {row['chat_id']: self._row_to_user(row) for row in rows}
+
+    def count_segment(self, expression):
+        where, params = _segment_sql(resolve(parse_segment(expression)))
+        with self._lock:
+            return self.conn.execute(f'SELECT COUNT(*) FROM users WHERE {where}', params).fetchone()[0]
+
+    def iter_segment(self, expression, chunk_size=1000):
+        """Yield the chat ids of users matching a segment expression."""
+        where, params = _segment_sql(resolve(parse_segment(expression)))
+        for row in self._pages(f'SELECT rowid, chat_id FROM users WHERE ({where})', params, chunk_size):
+            yield row['chat_id']
+
+    def iter_users(self, chunk_size=1000):
+        """Yield (chat_id, user) pairs, fetching rows `chunk_size` at a time."""
+        for row in self._pages('SELECT rowid, * FROM users WHERE 1', (), chunk_size):
+            user = self._row_to_user(row)
+            del user['rowid']  # only there to page by
+            yield row['chat_id'], user
+
+    def _pages(self, query, params, chunk_size):
+        """Rows of `query` in rowid order, one locked `chunk_size` page at a time.
+
+        The lock isn't held while the caller works through a page, so a
+        slow consumer (an export, a storage server client) doesn't stall
+        writers.
+        """
+        after = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    f'{query} AND rowid > ? ORDER BY rowid LIMIT ?', (*params, after, chunk_size)
+                ).fetchall()
+            if not rows:
+                break
+            after = rows[-1]['rowid']
+            yield from rows
+
+    def log_message_sent(self, chat_id, message_type):
+        now = str(datetime.now())
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO messages_sent (chat_id, type, timestamp) '
+                'SELECT chat_id, ?, ? FROM users WHERE chat_id = ?',
+                (message_type, now, str(chat_id))
+            )
+            if cursor.rowcount:
+                self._count(now[:10], 'messages', key=message_type)
+
+    def log_messages_sent(self, chat_ids, message_type):
+        """Record one message of `message_type` for each chat in one transaction."""
+        now = str(datetime.now())
+        with self._lock, self.conn:
+            cursor = self.conn.executemany(
+                'INSERT INTO messages_sent (chat_id, type, timestamp) '
+                'SELECT chat_id, ?, ? FROM users WHERE chat_id = ?',
+                ((message_type, now, str(chat_id)) for chat_id in chat_ids)
+            )
+            if cursor.rowcount:
+                self._count(now[:10], 'messages', cursor.rowcount, key=message_type)
+
+    def log_delivery_failures(self, chat_ids, message_type):
+        """Count messages of `message_type` that could not be delivered."""
+        if not chat_ids:
+            return
+        with self._lock, self.conn:
+            self._count(str(date.today()), 'failed', len(chat_ids), key=message_type)
+
+    def get_daily_stats(self, days=7):
+        """[(day, stats)] for the last `days` days, oldest first."""
+        since = str(date.today() - timedelta(days=days - 1))
+        rollups = DailyRollups()
+        with self._lock:
+            for row in self.conn.execute(
+                'SELECT day, metric, key, value FROM daily_stats WHERE day >= ?', (since,)
+            ):
+                rollups.add(row['day'], row['metric'], row['value'], key=row['key'] or None)
+        return rollups.last(days)
+
+    def rebuild_analytics(self, jobs_dir=BROADCAST_JOBS_DIR):
+        """Recount the daily rollups from the users and messages tables."""
+        with self._lock:
+            messages = self.conn.execute(
+                'SELECT substr(timestamp, 1, 10), type FROM messages_sent'
+            )
+            self.store_analytics(backfill(DailyRollups(), self.iter_users(), messages, jobs_dir))
+
+    def store_analytics(self, rollups):
+        """Replace the stored rollups with a DailyRollups built elsewhere."""
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM daily_stats')
+                self.conn.executemany(
+                    'INSERT INTO daily_stats (day, metric, key, value) VALUES (?, ?, ?, ?)',
+                    (
+                        (day, metric, key, n)
+                        for day, stats in rollups.days.items()
+                        for metric, value in stats.items()
+                        for key, n in (value.items() if isinstance(value, dict) else [('', value)])
+                    )
+                )
+
+    def get_messages(self, chat_id):
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT type, timestamp FROM messages_sent WHERE chat_id = ? ORDER BY id',
+                (str(chat_id),)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_message_counts(self, chat_id):
+        """Messages sent to a user so far, by type."""
+        counts = {}
+        with self._lock:
+            for row in self.conn.execute(
+                'SELECT type, COUNT(*) FROM messages_sent WHERE chat_id = ? GROUP BY type '
+                'UNION ALL SELECT type, count FROM earlier_messages WHERE chat_id = ?',
+                (str(chat_id), str(chat_id))
+            ):
+                counts[row[0]] = counts.get(row[0], 0) + row[1]
+        return counts
+
+    def import_json(self, json_file):
+        """One-shot import of a users_database.json file. Returns users imported."""
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        users = data.get('users', {})
+        
+        imported = 0
+        with self._lock, self.conn:
+            for chat_id, user in users.items():
+                # Users already present are left alone so a re-run can't duplicate history
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        str(chat_id),
+                        user.get('first_name'),
+                        user.get('username'),
+                        user.get('joined_at') or str(datetime.now()),
+                        user.get('referred_by'),
+                        user.get('referrals', 0),
+                        user.get('last_active') or user.get('joined_at') or str(datetime.now()),
+                        user.get('status', 'active'),
+                    )
+                )
+                if not cursor.rowcount:
+                    continue
+                imported += 1
+                messages, earlier = _message_rows(user)
+                self.conn.executemany(
+                    'INSERT INTO messages_sent (chat_id, type, timestamp) VALUES (?, ?, ?)',
+                    ((str(chat_id), message_type, at) for message_type, at in messages)
+                )
+                self.conn.executemany(
+                    'INSERT INTO earlier_messages (chat_id, type, count) VALUES (?, ?, ?)',
+                    ((str(chat_id), message_type, n) for message_type, n in earlier.items())
+                )
+        self._rebuild_referral_graph()
+        self.rebuild_analytics()
+        return imported
+
+    def wait_until_loaded(self, timeout=None):
+        """Nothing loads in the background: the tables are ready once opened."""
+        return True
+
+    def flush(self):
+        """Every mutation commits immediately; checkpoint the WAL into the main file."""
+        with self._lock:
+            self.conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+
+def _message_rows(user):
+    """A JSON user's history as ([(type, timestamp)], {type: count without a time}).
+
+    Records saved since message history was compacted keep per-type
+    counts plus the recent [type, epoch] pairs; the recent ones become
+    rows and the rest of each count is kept as a number. The latest
+    campaign becomes a row too when it has rotated out of the recent
+    pairs (its time is in `last_campaign`), so segments see its date.
+    Older records still carry their full `messages_sent` list.
+    """
+    if 'message_counts' not in user:
+        return [(m.get('type'), m.get('timestamp')) for m in user.get('messages_sent', [])], {}
+    messages = []
+    earlier = dict(user['message_counts'])
+    recent = user.get('recent_messages', [])
+    last = user.get('last_campaign')
+    if (last and last > 1 and earlier.get(CAMPAIGN_TYPE, 0) > 0
+            and [CAMPAIGN_TYPE, last] not in [list(m) for m in recent]):
+        recent = [(CAMPAIGN_TYPE, last)] + list(recent)
+    for message_type, at in recent:
+        if isinstance(at, (int, float)):
+            at = str(datetime.fromtimestamp(at))
+        messages.append((message_type, at))
+        earlier[message_type] = earlier.get(message_type, 0) - 1
+    return messages, {message_type: n for message_type, n in earlier.items() if n > 0}
+
+
+def _segment_sql(node):
+    """A resolved segment tree as a WHERE clause and its parameters."""
+    kind = node[0]
+    if kind in ('and', 'or'):
+        left, left_params = _segment_sql(node[1])
+        right, right_params = _segment_sql(node[2])
+        return f"({left} {kind.upper()} {right})", left_params + right_params
+    if kind == 'not':
+        clause, params = _segment_sql(node[1])
+        return f"(NOT {clause})", params
+    _, field, op, value = node
+    if value is None:
+        value = ''
+    elif isinstance(value, datetime):
+        value = str(value)
+    return f"{SEGMENT_COLUMNS[field]} {op} ?", [value]
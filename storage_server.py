@@ -0,0 +1,191 @@
+"""Storage server: one process owns the database, bot workers share it.
+
+Usage:
+    DB_SERVER_SOCKET=/run/referral-bot/storage.sock python storage_server.py
+
+Opens DB_PATH the way the bot would (JSON, journal, shards or SQLite,
+per config) and serves it on the DB_SERVER_SOCKET Unix socket. Start any
+number of bot workers with the same DB_SERVER_SOCKET; their `db` is then
+a RemoteDatabase talking to this process.
+
+Stop it with Ctrl+C or SIGTERM, which saves and closes the database.
+"""
+import asyncio
+import logging
+import os
+import signal
+import types
+from itertools import islice
+
+from config import DB_PATH, DB_SERVER_SOCKET
+from database import open_database
+from remote_database import END, ERROR, ITEMS, OK, STREAM_CHUNK, HEADER, decode_frame, encode_frame
+
+logger = logging.getLogger(__name__)
+
+# The backend methods RemoteDatabase calls, and the only ones a client
+# can reach; close() stays with the server, which decides when to stop
+METHODS = frozenset({
+    'wait_until_loaded', 'save', 'flush', 'rebuild_analytics',
+    'add_user', 'register_user', 'credit_referral', 'update_last_active', 'update_profile',
+    'get_user', 'user_count', 'get_leaderboard', 'get_downline', 'get_active_users',
+    'activity_summary', 'count_active_within', 'count_segment', 'iter_segment', 'iter_users',
+    'log_message_sent', 'log_messages_sent', 'log_delivery_failures',
+    'get_daily_stats', 'get_message_counts',
+})
+READ_SIZE = 64 * 1024
+
+
+class StorageServer:
+    """Answers RemoteDatabase requests against a local backend.
+
+    Each connection is read in order and answered in order, so a client
+    can pipeline requests without waiting for replies; all the requests
+    that arrived together are answered with one write.
+
+    Once the backend has loaded, calls run on the event loop thread: reads
+    come from memory (or SQLite), and with write-behind, the default,
+    saves and compaction happen on a background thread. Without
+    write-behind every write saves inline and holds up the other
+    connections while it does. Until the background load has finished,
+    calls (and stream chunks) run in a thread instead, since user_count or
+    a get_user miss waits for it.
+    """
+
+    def __init__(self, db, path):
+        self.db = db
+        self.path = str(path)
+        self.methods = {name for name in METHODS if callable(getattr(db, name, None))}
+        self.requests = 0
+        self._loaded = False
+        self._server = None
+
+    @property
+    def loaded(self):
+        """Whether the backend has finished loading (backends without a background load always have)."""
+        if not self._loaded:
+            wait_until_loaded = getattr(self.db, 'wait_until_loaded', None)
+            self._loaded = wait_until_loaded is None or wait_until_loaded(0)
+        return self._loaded
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a server that didn't exit cleanly
+        self._server = await asyncio.start_unix_server(self._handle_connection, self.path)
+        os.chmod(self.path, 0o600)
+        logger.info(f"🗄️ Storage server on {self.path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def _handle_connection(self, reader, writer):
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                buffer += data
+                # Answer every complete request that arrived, in one write
+                replies = []
+                offset = 0
+                while len(buffer) - offset >= HEADER.size:
+                    (size,) = HEADER.unpack_from(buffer, offset)
+                    end = offset + HEADER.size + size
+                    if len(buffer) < end:
+                        break
+                    request_id, method, args = decode_frame(buffer[offset + HEADER.size:end])
+                    offset = end
+                    self.requests += 1
+                    result = await self._call(method, args)
+                    if isinstance(result, types.GeneratorType):
+                        writer.write(b''.join(replies))
+                        replies = []
+                        await self._stream(writer, request_id, result)
+                    elif isinstance(result, Exception):
+                        replies.append(encode_frame([request_id, ERROR, [type(result).__name__, str(result)]]))
+                    else:
+                        replies.append(self._encode(request_id, result))
+                del buffer[:offset]
+                writer.write(b''.join(replies))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _call(self, method, args):
+        """The method's result, or the exception it raised."""
+        try:
+            if method not in self.methods:
+                if method == 'wait_until_loaded':
+                    return True  # nothing loads in the background
+                raise AttributeError(f"Unknown method {method!r}")
+            if self.loaded:
+                return getattr(self.db, method)(*args)
+            return await asyncio.to_thread(getattr(self.db, method), *args)
+        except Exception as e:
+            return e
+
+    def _encode(self, request_id, result):
+        try:
+            return encode_frame([request_id, OK, result])
+        except (TypeError, ValueError) as e:
+            return encode_frame([request_id, ERROR, [type(e).__name__, str(e)]])
+
+    async def _stream(self, writer, request_id, items):
+        # One chunk at a time, as the client reads them. The backends'
+        # iterators only hold their lock while producing a chunk, never
+        # across the awaits in between.
+        while True:
+            try:
+                if self.loaded:
+                    chunk = list(islice(items, STREAM_CHUNK))
+                else:
+                    chunk = await asyncio.to_thread(list, islice(items, STREAM_CHUNK))
+            except Exception as e:
+                writer.write(encode_frame([request_id, ERROR, [type(e).__name__, str(e)]]))
+                return
+            if not chunk:
+                break
+            writer.write(encode_frame([request_id, ITEMS, chunk]))
+            await writer.drain()
+        writer.write(encode_frame([request_id, END, None]))
+
+
+async def serve(path):
+    db = open_database(DB_PATH, server_socket=None)
+    server = StorageServer(db, path)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await server.start()
+    print(f"🗄️ Serving {DB_PATH} on {path} ({db.user_count()} users)")
+    try:
+        await stopping.wait()
+    finally:
+        await server.stop()
+        db.close()
+        print(f"✅ Storage server stopped after {server.requests} requests")
+
+
+def main():
+    if not DB_SERVER_SOCKET:
+        print("❌ Set DB_SERVER_SOCKET to the socket path to serve on")
+        return
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    asyncio.run(serve(DB_SERVER_SOCKET))
+
+
+if __name__ == '__main__':
+    main()
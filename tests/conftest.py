@@ -0,0 +1,29 @@
+"""Shared setup for the tests.
+
+Run them from the repository root::
+
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# config.py refuses to import without a token; tests never talk to Telegram
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:TEST')
+# Keep the global `db` instance and job store away from the real files
+_scratch = tempfile.mkdtemp(prefix='tests-')
+os.environ.setdefault('DB_PATH', os.path.join(_scratch, 'users_database.json'))
+os.environ.setdefault('BROADCAST_JOBS_DIR', os.path.join(_scratch, 'broadcast_jobs'))
+os.environ.setdefault('DB_BACKGROUND_LOAD', '0')
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return tmp_path / 'users_database.json'
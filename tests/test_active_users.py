@@ -0,0 +1,72 @@
+import json
+from datetime import datetime, timedelta
+
+from database import Database
+
+
+def write_users(db_file, days_ago, status=None):
+    """A store whose user i was last active `days_ago[i]` days ago."""
+    now = datetime.now()
+    users = {}
+    for i, days in enumerate(days_ago):
+        chat_id = str(100 + i)
+        at = str(now - timedelta(days=days))
+        users[chat_id] = {
+            'chat_id': chat_id, 'first_name': f'User{i}', 'username': None,
+            'joined_at': at, 'referred_by': None, 'referrals': 0,
+            'last_active': at, 'status': (status or {}).get(chat_id, 'active'),
+        }
+    db_file.write_text(json.dumps({'users': users, 'total_users': len(users), 'settings': {}}))
+
+
+def open_db(db_file):
+    return Database(db_file, write_behind=False, message_log=None,
+                    background_load=False, activity_granularity=0)
+
+
+def chat_ids(users):
+    return [user['chat_id'] for user in users]
+
+
+def test_most_recently_active_first(db_file):
+    write_users(db_file, [5, 1, 3, 2, 4], status={'104': 'blocked'})
+    db = open_db(db_file)
+    assert chat_ids(db.get_active_users()) == ['101', '103', '102', '100']
+    assert chat_ids(db.get_active_users(limit=2)) == ['101', '103']
+    # Reading doesn't consume the index
+    assert chat_ids(db.get_active_users(limit=2)) == ['101', '103']
+
+
+def test_touch_moves_user_to_the_front(db_file):
+    write_users(db_file, [5, 1, 3])
+    db = open_db(db_file)
+    db.update_last_active('100')
+    assert chat_ids(db.get_active_users()) == ['100', '101', '102']
+    db.update_last_active('102')
+    assert chat_ids(db.get_active_users()) == ['102', '100', '101']
+
+
+def test_repeated_touches_leave_no_duplicates(db_file):
+    write_users(db_file, [5, 1, 3])
+    db = open_db(db_file)
+    for _ in range(50):
+        db.update_last_active('100')
+        db.update_last_active('102')
+    # Every touch pushed a heap entry; all but the newest per user are stale
+    assert len(db._recency) > 3
+    assert chat_ids(db.get_active_users()) == ['102', '100', '101']
+    assert chat_ids(db.get_active_users(limit=2)) == ['102', '100']
+    # Stale entries met on the way are dropped for good
+    db.get_active_users()
+    assert len(db._recency) == 3
+
+
+def test_within_days_stops_at_the_cutoff(db_file):
+    write_users(db_file, [0, 3, 10, 40, 6])
+    db = open_db(db_file)
+    assert chat_ids(db.get_active_users(within_days=1)) == ['100']
+    assert chat_ids(db.get_active_users(within_days=7)) == ['100', '101', '104']
+    assert chat_ids(db.get_active_users(within_days=30)) == ['100', '101', '104', '102']
+    assert chat_ids(db.get_active_users(limit=2, within_days=30)) == ['100', '101']
+    db.update_last_active('103')
+    assert chat_ids(db.get_active_users(within_days=1)) == ['103', '100']
@@ -0,0 +1,63 @@
+from analytics import DailyRollups, backfill
+from database import Database, ShardedDatabase
+from shards import shard_of
+from sqlite_database import SQLiteDatabase
+
+
+def referred_signups(db):
+    return sum(stats.get('referred_signups', 0) for _, stats in db.get_daily_stats(1))
+
+
+def sign_up(db):
+    db.add_user('1', 'Referrer', None)
+    db.add_user('2', 'Credited', None, referred_by='1')
+    db.add_user('3', 'Unknown referrer', None, referred_by='999')
+    db.add_user('4', 'Self', None, referred_by='4')
+
+
+def test_json_store_counts_only_credited_referrals(db_file):
+    db = Database(db_file, write_behind=False, message_log=None, background_load=False)
+    sign_up(db)
+    assert db.get_user('1')['referrals'] == 1
+    assert referred_signups(db) == 1
+    # A recount from the stored users applies the same rule
+    db.rebuild_analytics(jobs_dir=None)
+    assert referred_signups(db) == 1
+    db.close()
+
+
+def test_sqlite_store_counts_only_credited_referrals(tmp_path):
+    db = SQLiteDatabase(tmp_path / 'users.db')
+    sign_up(db)
+    assert db.get_user('1')['referrals'] == 1
+    assert referred_signups(db) == 1
+    db.rebuild_analytics(jobs_dir=None)
+    assert referred_signups(db) == 1
+    db.close()
+
+
+def test_sharded_store_counts_referrers_on_other_shards(db_file):
+    db = ShardedDatabase(db_file, 4, message_log=None, write_behind=False, background_load=False)
+    referrer = '1'
+    referred = next(str(i) for i in range(2, 100) if shard_of(str(i), 4) != shard_of(referrer, 4))
+    db.add_user(referrer, 'Referrer', None)
+    db.add_user(referred, 'Credited', None, referred_by=referrer)
+    db.add_user('999999', 'Unknown referrer', None, referred_by='888888')
+    assert db.get_user(referrer)['referrals'] == 1
+    assert referred_signups(db) == 1
+    db.rebuild_analytics(jobs_dir=None)
+    assert referred_signups(db) == 1
+    db.close()
+
+
+def test_backfill_needs_a_referrer_who_joined_first():
+    users = [
+        ('2', {'joined_at': '2026-01-02 10:00:00', 'referred_by': '1'}),
+        ('3', {'joined_at': '2026-01-02 11:00:00', 'referred_by': '4'}),
+        ('1', {'joined_at': '2026-01-01 10:00:00', 'referred_by': None}),
+        ('4', {'joined_at': '2026-01-03 10:00:00', 'referred_by': None}),
+        ('5', {'joined_at': '2026-01-03 11:00:00', 'referred_by': 'gone'}),
+    ]
+    days = backfill(DailyRollups(), users).days
+    assert days['2026-01-02'] == {'signups': 2, 'referred_signups': 1, 'active_users': 2}
+    assert days['2026-01-03'] == {'signups': 2, 'active_users': 2}
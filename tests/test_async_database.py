@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+from async_database import AsyncDatabase
+from database import Database
+
+
+class SlowDatabase(Database):
+    """A Database whose background load waits until the test releases it."""
+
+    release = None
+
+    def load(self):
+        self.release.wait()
+        super().load()
+
+
+def test_reads_wait_for_the_load_off_the_event_loop(db_file):
+    seed = Database(db_file, write_behind=False, message_log=None, background_load=False)
+    seed.add_user('1', 'One', None)
+    seed.add_user('2', 'Two', None, referred_by='1')
+    seed.close()
+
+    SlowDatabase.release = threading.Event()
+    db = SlowDatabase(db_file, write_behind=False, message_log=None, background_load=True)
+    store = AsyncDatabase(db)
+
+    async def main():
+        assert not store.loaded
+        count = asyncio.create_task(store.read(db.user_count))
+        user = asyncio.create_task(store.read(db.get_user, '2'))
+        board = asyncio.create_task(store.read(db.get_leaderboard, limit=10))
+        # The loop keeps running while all three wait for the load
+        await asyncio.sleep(0.05)
+        assert not (count.done() or user.done() or board.done())
+        SlowDatabase.release.set()
+        assert await count == 2
+        assert (await user)['referred_by'] == '1'
+        assert [(u['chat_id'], n) for u, n in await board] == [('1', 1)]
+        assert store.loaded
+
+    try:
+        asyncio.run(main())
+    finally:
+        SlowDatabase.release.set()
+        store.close()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+from async_database import AsyncDatabase
+from broadcast_jobs import BroadcastJobs
+from database import Database
+
+
+class FakeBot:
+    def __init__(self, fail=()):
+        self.fail = {int(chat_id) for chat_id in fail}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.fail:
+            raise RuntimeError('Forbidden: bot was blocked by the user')
+        self.sent.append(str(chat_id))
+
+    async def edit_message_text(self, text, **kwargs):
+        pass
+
+
+def open_store(db_file, chat_ids):
+    db = Database(db_file, write_behind=False, message_log=None, background_load=False)
+    for chat_id in chat_ids:
+        db.add_user(chat_id, f'User{chat_id}', None)
+    return AsyncDatabase(db)
+
+
+def test_job_runs_and_logs_deliveries_through_the_store(db_file, tmp_path):
+    store = open_store(db_file, ['1', '2', '3'])
+    jobs = BroadcastJobs(tmp_path / 'jobs', store, status_interval=0.01)
+    bot = FakeBot(fail=['2'])
+
+    async def scenario():
+        job = await jobs.create(iter(['1', '2', '3']), 'hello')
+        await jobs.run(bot, job['id'])
+        return job
+
+    job = asyncio.run(scenario())
+    store.close()
+    assert job['status'] == 'completed'
+    assert (job['sent'], job['failed']) == (2, 1)
+    assert sorted(bot.sent) == ['1', '3']
+    assert store.get_message_counts('1') == {'campaign': 1}
+    assert store.get_message_counts('2') == {}
+
+    meta = json.loads((tmp_path / 'jobs' / '1.json').read_text())
+    assert 'recipients' not in meta and meta['status'] == 'completed'
+    assert (tmp_path / 'jobs' / '1.recipients').read_text().split() == ['1', '2', '3']
+
+
+def test_interrupted_job_resumes_after_the_logged_chats(db_file, tmp_path):
+    store = open_store(db_file, ['1', '2', '3'])
+    jobs_dir = tmp_path / 'jobs'
+    jobs = BroadcastJobs(jobs_dir, store)
+    asyncio.run(jobs.create(['1', '2', '3'], 'hello'))
+    (jobs_dir / '1.log').write_text('1 sent\n')
+    jobs.close()  # the worker stops before running it
+
+    jobs = BroadcastJobs(jobs_dir, store, status_interval=0.01)
+    assert [job['id'] for job in jobs.unfinished()] == ['1']
+    bot = FakeBot()
+    asyncio.run(jobs.run(bot, '1'))
+    store.close()
+    assert sorted(bot.sent) == ['2', '3']
+    assert asyncio.run(jobs.get('1'))['sent'] == 3
+
+
+def test_workers_sharing_the_directory_split_the_jobs(db_file, tmp_path):
+    store = open_store(db_file, ['1', '2', '3'])
+    jobs_dir = tmp_path / 'jobs'
+    first, second = BroadcastJobs(jobs_dir, store), BroadcastJobs(jobs_dir, store)
+
+    async def create_both():
+        return await asyncio.gather(*(
+            jobs.create(['1', '2', '3'], f'hello {i}') for i, jobs in enumerate((first, second, first, second))
+        ))
+
+    created = asyncio.run(create_both())
+    assert sorted(int(job['id']) for job in created) == [1, 2, 3, 4]
+    first.close()
+    second.close()
+
+    # After a restart, each running job is resumed by exactly one worker
+    first, second = BroadcastJobs(jobs_dir, store), BroadcastJobs(jobs_dir, store)
+    claimed = [asyncio.run(jobs.claim_unfinished()) for jobs in (first, second)]
+    assert [len(jobs) for jobs in claimed] == [4, 0]
+    second_bot = FakeBot()
+    asyncio.run(second.run(second_bot, '1'))
+    assert second_bot.sent == []
+    first.close()
+    second.close()
+    store.close()
+
+
+def test_cancel_reaches_the_worker_running_the_job(db_file, tmp_path):
+    store = open_store(db_file, [str(i) for i in range(1, 51)])
+    jobs_dir = tmp_path / 'jobs'
+    # Both workers are up before the job exists
+    owner = BroadcastJobs(jobs_dir, store, status_interval=0.01)
+    other = BroadcastJobs(jobs_dir, store)
+
+    class SlowBot(FakeBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            await asyncio.sleep(0.01)
+            await super().send_message(chat_id, text, **kwargs)
+
+    async def scenario():
+        job = await owner.create([str(i) for i in range(1, 51)], 'hello')
+        running = asyncio.create_task(owner.run(bot, job['id']))
+        await asyncio.sleep(0.05)
+        seen = await other.latest()
+        assert seen['id'] == job['id'] and seen['status'] == 'running' and seen['sent'] > 0
+        assert await other.cancel(job['id'])
+        await asyncio.wait_for(running, 5)
+        return job
+
+    bot = SlowBot()
+    job = asyncio.run(scenario())
+    assert job['status'] == 'cancelled'
+    assert 0 < len(bot.sent) < 50
+    assert not asyncio.run(other.cancel(job['id']))
+    assert asyncio.run(other.get('../1')) is None
+    owner.close()
+    other.close()
+    assert asyncio.run(BroadcastJobs(jobs_dir, store).get(job['id']))['status'] == 'cancelled'
+    store.close()
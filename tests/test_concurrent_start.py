@@ -0,0 +1,122 @@
+"""Concurrent /start through the dispatcher, as benchmarks/bench_concurrent_start.py
+times it: many new users joining via a few referrers, each double-tapping
+/start, with some updates redelivered under the same update_id."""
+import asyncio
+import random
+from types import SimpleNamespace
+
+from telegram import Update
+
+import bot
+from dispatcher import ChatOrderedUpdateProcessor
+from idempotency import TTLCache
+
+USERS = 400
+REFERRERS = 8
+FIRST_CHAT_ID = 1_500_000_000
+
+
+class FakeBot:
+    async def get_me(self):
+        return SimpleNamespace(username='test_bot')
+
+    async def send_message(self, *args, **kwargs):
+        await asyncio.sleep(random.random() * 0.001)
+
+
+class FakeMessage:
+    async def reply_text(self, *args, **kwargs):
+        await asyncio.sleep(random.random() * 0.001)
+
+
+def make_update(update_id, chat_id):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': '/start',
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}'},
+        }
+    }, None)
+
+
+def test_concurrent_starts_credit_each_referral_once():
+    rng = random.Random(3)
+    fake_bot = FakeBot()
+    referrers = [str(FIRST_CHAT_ID - 1 - i) for i in range(REFERRERS)]
+    for chat_id in referrers:
+        bot.db.add_user(chat_id, 'Referrer', None)
+
+    expected = dict.fromkeys(referrers, 0)
+    updates = []
+    for i in range(USERS):
+        referrer = rng.choice(referrers)
+        expected[referrer] += 1
+        for _ in range(2):
+            updates.append((make_update(FIRST_CHAT_ID + len(updates), FIRST_CHAT_ID + i), referrer))
+    updates.extend(rng.sample(updates, len(updates) // 10))
+    rng.shuffle(updates)
+
+    arrival, handled = {}, {}
+    for update, _ in updates:
+        ids = arrival.setdefault(update.effective_chat.id, [])
+        if update.update_id not in ids:
+            ids.append(update.update_id)
+
+    async def handle(update, referrer):
+        handled.setdefault(update.effective_chat.id, []).append(update.update_id)
+        await bot.start(SimpleNamespace(
+            effective_user=update.effective_user,
+            effective_chat=update.effective_chat,
+            message=FakeMessage()
+        ), SimpleNamespace(bot=fake_bot, args=[referrer]))
+
+    async def scenario():
+        await bot.bot_identity.refresh(fake_bot)
+        bot.notifications.start(fake_bot)
+        processor = ChatOrderedUpdateProcessor(16, seen=TTLCache(100_000, 3600))
+        await asyncio.gather(*(
+            processor.process_update(update, handle(update, referrer)) for update, referrer in updates
+        ))
+        await bot.notifications.stop()
+
+    asyncio.run(scenario())
+
+    assert {r: bot.db.get_user(r)['referrals'] for r in referrers} == expected
+    assert handled == arrival
+    for i in range(USERS):
+        user = bot.db.get_user(FIRST_CHAT_ID + i)
+        assert user['referred_by'] in referrers
+        assert user['message_counts'] == {'welcome': 1}
+    assert bot.notifications.sent == USERS
+
+
+def test_start_that_failed_is_not_dropped_as_a_double_tap():
+    fake_bot = FakeBot()
+    update = make_update(1, FIRST_CHAT_ID - 100)
+    replies = []
+
+    class FlakyMessage:
+        async def reply_text(self, text, **kwargs):
+            replies.append(text)
+            if len(replies) == 1:
+                raise ConnectionError('Bot API unreachable')
+
+    async def tap():
+        await bot.start(SimpleNamespace(
+            effective_user=update.effective_user,
+            effective_chat=update.effective_chat,
+            message=FlakyMessage()
+        ), SimpleNamespace(bot=fake_bot, args=[]))
+
+    async def scenario():
+        await bot.bot_identity.refresh(fake_bot)
+        try:
+            await tap()
+        except ConnectionError:
+            pass
+        await tap()
+        await tap()  # a real double tap of the one that worked
+
+    asyncio.run(scenario())
+    assert len(replies) == 2
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+from telegram import Update
+
+from dispatcher import ChatOrderedUpdateProcessor, UpdateQueue
+from idempotency import TTLCache
+
+
+def make_update(update_id, chat_id):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': 'hi',
+            'chat': {'id': chat_id, 'type': 'private'},
+        }
+    }, None)
+
+
+def test_burst_from_one_chat_does_not_hold_up_other_chats():
+    processor = ChatOrderedUpdateProcessor(2)
+    finished = {}
+
+    async def handle(update, seconds):
+        await asyncio.sleep(seconds)
+        finished[update.update_id] = time.perf_counter()
+
+    async def scenario():
+        updates = [(make_update(i, 1), 0.1) for i in range(1, 6)] + [(make_update(6, 2), 0.01)]
+        started = time.perf_counter()
+        await asyncio.gather(*(processor.process_update(u, handle(u, s)) for u, s in updates))
+        return started
+
+    started = asyncio.run(scenario())
+    # Chat 1's five updates take 0.5s one after another; chat 2 only
+    # waits for a free worker, which chat 1 never holds more than one of
+    assert finished[6] - started < 0.1
+    assert finished[5] - started >= 0.5
+
+
+def test_queue_hands_out_updates_only_while_a_worker_is_free():
+    processor = ChatOrderedUpdateProcessor(2)
+    queue = UpdateQueue(processor)
+    finished = {}
+
+    async def handle(update, seconds):
+        await asyncio.sleep(seconds)
+        finished[update.update_id] = time.perf_counter()
+
+    async def fetcher(count):
+        # What Application does: a task per update, as soon as it gets one
+        tasks = []
+        for _ in range(count):
+            update, seconds = await queue.get()
+            tasks.append(asyncio.create_task(processor.process_update(update, handle(update, seconds))))
+        await asyncio.gather(*tasks)
+
+    async def scenario():
+        for i in range(1, 6):
+            queue.put_nowait((make_update(i, 1), 0.1))
+        queue.put_nowait((make_update(6, 2), 0.01))
+        queue.put_nowait((make_update(7, 3), 0.2))
+        queue.put_nowait((make_update(8, 4), 0.01))
+        started = time.perf_counter()
+        fetching = asyncio.create_task(fetcher(8))
+        await asyncio.sleep(0.05)
+        # Chat 1's queued updates wait behind it without holding a worker,
+        # chat 2 has finished and chat 3 runs on the second worker, so
+        # chat 4 stays in the queue until one of them is free
+        assert 6 in finished and queue.qsize() == 1
+        await fetching
+        return started
+
+    started = asyncio.run(scenario())
+    assert finished[8] - started >= 0.1
+    assert finished[5] - started >= 0.5
+
+
+def test_workers_bound_running_updates_and_chats_stay_in_order():
+    processor = ChatOrderedUpdateProcessor(3)
+    running = 0
+    peak = 0
+    handled = {}
+
+    async def handle(update):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        handled.setdefault(update.effective_chat.id, []).append(update.update_id)
+        await asyncio.sleep(0.005)
+        running -= 1
+
+    updates = [make_update(i, i % 7) for i in range(1, 141)]
+
+    async def scenario():
+        await asyncio.gather(*(processor.process_update(u, handle(u)) for u in updates))
+
+    asyncio.run(scenario())
+    assert peak == 3
+    for chat_id, ids in handled.items():
+        assert ids == sorted(ids)
+    assert sum(map(len, handled.values())) == len(updates)
+    # Nothing left behind once every chat is idle
+    assert processor._locks == {} and processor._waiters == {}
+
+
+def test_redelivered_update_is_dropped():
+    processor = ChatOrderedUpdateProcessor(4, seen=TTLCache(100, 60))
+    handled = []
+
+    async def handle(update):
+        handled.append(update.update_id)
+
+    async def scenario():
+        update = make_update(1, 5)
+        await processor.process_update(update, handle(update))
+        await processor.process_update(update, handle(update))
+
+    asyncio.run(scenario())
+    assert handled == [1]
+    assert processor.seen.duplicates == 1
+
+
+def test_failed_update_runs_again_when_redelivered():
+    processor = ChatOrderedUpdateProcessor(4, seen=TTLCache(100, 60))
+    handled = []
+
+    async def handle(update, fail):
+        handled.append(update.update_id)
+        if fail:
+            raise RuntimeError('handler failed')
+
+    async def scenario():
+        update = make_update(1, 5)
+        try:
+            await processor.process_update(update, handle(update, fail=True))
+        except RuntimeError:
+            pass
+        await processor.process_update(update, handle(update, fail=False))
+        # Errors the application catches reach the error handler instead
+        processor.forget(update)
+        await processor.process_update(update, handle(update, fail=False))
+        await processor.process_update(update, handle(update, fail=False))
+
+    asyncio.run(scenario())
+    assert handled == [1, 1, 1]
+    assert processor.seen.duplicates == 1
@@ -0,0 +1,37 @@
+import csv
+from datetime import datetime
+
+import pytest
+
+from exporter import export_users, parse_export_args
+
+USERS = [
+    ('1', {'chat_id': '1', 'joined_at': '2024-01-04 23:59:59.999999', 'status': 'active'}),
+    ('2', {'chat_id': '2', 'joined_at': '2024-01-05 08:00:00.123456', 'status': 'active'}),
+    ('3', {'chat_id': '3', 'joined_at': '2024-01-12 08:00:00', 'status': 'active'}),
+]
+
+
+def exported_ids(**options):
+    output, count = export_users(USERS, columns=['chat_id'], **options)
+    with output:
+        rows = list(csv.reader(output.read().decode('utf-8').splitlines()))
+    assert len(rows) == count + 1
+    return [row[0] for row in rows[1:]]
+
+
+@pytest.mark.parametrize('value', ['2024-1-5', 'yesterday', '05/01/2024'])
+def test_joined_after_must_be_an_iso_date(value):
+    with pytest.raises(ValueError, match='joined_after'):
+        parse_export_args([f'joined_after={value}'])
+
+
+def test_joined_after_is_parsed_to_a_datetime():
+    assert parse_export_args(['joined_after=2024-01-05']) == {'joined_after': datetime(2024, 1, 5)}
+    assert parse_export_args(['joined_after=2024-01-05T09:30']) == {'joined_after': datetime(2024, 1, 5, 9, 30)}
+
+
+def test_joined_after_compares_as_time():
+    assert exported_ids(**parse_export_args(['joined_after=2024-01-05'])) == ['2', '3']
+    assert exported_ids(**parse_export_args(['joined_after=2024-01-05T09:00'])) == ['3']
+    assert exported_ids(joined_after='20240105') == ['2', '3']
@@ -0,0 +1,59 @@
+import os
+
+from database import JournalDatabase
+
+
+def open_journal(db_file):
+    return JournalDatabase(db_file, message_log=None, background_load=False,
+                           activity_granularity=0)
+
+
+def test_torn_last_record_is_discarded_on_replay(db_file):
+    db = open_journal(db_file)
+    db.add_user('1', 'Alice', 'alice')
+    db.add_user('2', 'Bob', None, referred_by='1')
+    db.log_message_sent('2', 'welcome')
+    db.update_profile('1', 'Alice', 'alice_new')
+    db.add_user('3', 'Carol', None, referred_by='1')
+    db.close()
+
+    journal = db.journal_file
+    with open(journal, 'rb') as f:
+        lines = f.readlines()
+    assert len(lines) == 5
+    complete = sum(len(line) for line in lines[:-1])
+    # Cut the last record (Carol's signup) off halfway through
+    with open(journal, 'r+b') as f:
+        f.truncate(complete + len(lines[-1]) // 2)
+
+    db = open_journal(db_file)
+    assert db.get_user('3') is None
+    assert db.user_count() == 2
+    assert db.get_user('1').username == 'alice_new'
+    assert db.get_user('1').referrals == 1
+    assert db.get_message_counts('2') == {'welcome': 1}
+    assert os.path.getsize(journal) == complete
+
+    # New events start on a clean line and survive the next restart
+    db.add_user('4', 'Dan', None)
+    db.close()
+    db = open_journal(db_file)
+    assert db.get_user('4') is not None
+    assert db.user_count() == 3
+    db.close()
+
+
+def test_record_without_newline_is_not_replayed(db_file):
+    db = open_journal(db_file)
+    db.add_user('1', 'Alice', None)
+    db.add_user('2', 'Bob', None)
+    db.close()
+
+    # A complete JSON object whose newline never made it to disk
+    with open(db.journal_file, 'r+b') as f:
+        f.truncate(os.path.getsize(db.journal_file) - 1)
+
+    db = open_journal(db_file)
+    assert db.get_user('1') is not None
+    assert db.get_user('2') is None
+    db.close()
@@ -0,0 +1,73 @@
+import random
+from collections import Counter
+
+from referral_graph import ReferralGraph
+
+
+def random_graph(size, seed):
+    """A graph grown the way signups grow it, plus the edges it accepted."""
+    rng = random.Random(seed)
+    graph = ReferralGraph()
+    edges = []
+    for i in range(1, size):
+        # A few heavy referrers and a long tail of ties at 1 and 2
+        referrer = str(rng.randrange(5)) if rng.random() < 0.3 else str(rng.randrange(i))
+        if graph.add(str(i), referrer):
+            edges.append((str(i), referrer))
+    return graph, edges
+
+
+def expected_ranking(edges):
+    counts = Counter(referrer for _, referrer in edges)
+    board = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    ranks = {chat_id: 1 + sum(1 for n in counts.values() if n > count) for chat_id, count in counts.items()}
+    return board, ranks
+
+
+def test_leaderboard_and_ranks_match_a_full_count():
+    graph, edges = random_graph(3000, seed=1)
+    board, ranks = expected_ranking(edges)
+    for limit in (1, 3, 10, 100, len(board), len(board) + 5):
+        assert graph.leaderboard(limit) == board[:limit]
+    for chat_id in map(str, range(3000)):
+        assert graph.rank_of(chat_id) == ranks.get(chat_id)
+
+
+def test_ranks_stay_right_as_referrers_overtake_each_other():
+    graph = ReferralGraph()
+    for i, referrer in enumerate('abacbcccaaaa'):
+        graph.add(f'u{i}', referrer)
+        _, ranks = expected_ranking([(chat_id, graph.referrer_of(chat_id)) for chat_id in graph.parent])
+        assert {c: graph.rank_of(c) for c in 'abc'} == {c: ranks.get(c) for c in 'abc'}
+    assert graph.leaderboard(2) == [('a', 6), ('c', 4)]
+
+
+def test_self_referral_and_loops_are_refused():
+    graph = ReferralGraph()
+    assert not graph.add('a', 'a')
+    assert graph.add('b', 'a')
+    assert graph.add('c', 'b')
+    # a -> b -> c: a can't be referred from inside its own downline
+    assert not graph.add('a', 'c')
+    assert not graph.add('a', 'b')
+    # Nor can anyone be referred twice
+    assert not graph.add('c', 'a')
+    assert graph.referrer_of('a') is None
+    assert graph.downline_size('a') == 2
+    assert graph.leaderboard() == [('a', 1), ('b', 1)]
+
+
+def test_build_only_credits_referrers_who_joined_first():
+    graph = ReferralGraph.build([
+        ('a', None, '2026-01-01'),
+        ('b', 'a', '2026-01-02'),
+        ('c', 'd', '2026-01-03'),  # d joined later
+        ('d', 'c', '2026-01-04'),
+        ('e', 'e', '2026-01-05'),
+        ('f', 'missing', '2026-01-06'),
+    ])
+    assert graph.referrer_of('b') == 'a'
+    assert graph.referrer_of('c') is None
+    assert graph.referrer_of('d') == 'c'
+    assert graph.referrer_of('e') is None
+    assert graph.referrer_of('f') is None
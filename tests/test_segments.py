@@ -0,0 +1,52 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from database import Database
+from sqlite_database import SQLiteDatabase
+
+
+def local(value):
+    """An ISO time with an offset as the naive local time the store keeps."""
+    return str(datetime.fromisoformat(value).astimezone().replace(tzinfo=None))
+
+
+@pytest.fixture
+def stores(db_file, tmp_path):
+    # Joined an hour apart around midnight UTC on New Year's Day, in local time
+    users = {}
+    for i, at in enumerate(['2025-12-31T21:30:00+00:00', '2025-12-31T22:30:00+00:00',
+                            '2025-12-31T23:30:00+00:00', '2026-01-01T00:30:00+00:00',
+                            '2026-01-01T01:30:00+00:00'], start=1):
+        users[str(i)] = {
+            'chat_id': str(i), 'first_name': f'User{i}', 'username': None,
+            'joined_at': local(at), 'referred_by': None, 'referrals': 0,
+            'last_active': local(at), 'status': 'active',
+        }
+    db_file.write_text(json.dumps({'users': users, 'total_users': len(users), 'settings': {}}))
+    db = Database(db_file, write_behind=False, message_log=None, background_load=False)
+    sqlite_db = SQLiteDatabase(tmp_path / 'users.db')
+    sqlite_db.import_json(db_file)
+    yield db, sqlite_db
+    db.close()
+    sqlite_db.close()
+
+
+@pytest.mark.parametrize('expression, count', [
+    ('joined>=2026-01-01T00:00Z', 2),
+    ('joined<2026-01-01T00:00:00+00:00', 3),
+    ('joined>=2026-01-01T00:00+02:00', 4),
+    ('active<2026-01-01T02:00+02:00 and joined>2025-12-31T22:00Z', 2),
+])
+def test_dates_with_a_time_zone_compare_as_local_time(stores, expression, count):
+    db, sqlite_db = stores
+    assert db.count_segment(expression) == count
+    assert sum(1 for _ in db.iter_segment(expression)) == count
+    assert sqlite_db.count_segment(expression) == count
+
+
+def test_malformed_dates_are_rejected(stores):
+    for store in stores:
+        with pytest.raises(ValueError):
+            store.count_segment('joined>=2026-13-01')
@@ -0,0 +1,101 @@
+import json
+from datetime import datetime
+
+from database import Database
+from sqlite_database import SQLiteDatabase
+
+
+def recent(sqlite_db, chat_id, limit):
+    """The last `limit` messages in SQLite as JSON-style (type, epoch) pairs."""
+    return [
+        (m['type'], int(datetime.fromisoformat(m['timestamp']).timestamp()))
+        for m in sqlite_db.get_messages(chat_id)
+    ][-limit:]
+
+
+def test_json_history_round_trips_into_sqlite(db_file, tmp_path):
+    db = Database(db_file, write_behind=False, message_log=None,
+                  background_load=False, history_limit=3)
+    for chat_id in ('1', '2', '3'):
+        db.add_user(chat_id, f'User{chat_id}', None)
+    db.log_message_sent('1', 'welcome')
+    for _ in range(5):
+        db.log_messages_sent(['1', '2'], 'campaign')
+    db.log_message_sent('2', 'welcome')
+    db.close()
+
+    sqlite_db = SQLiteDatabase(tmp_path / 'users.db')
+    assert sqlite_db.import_json(db_file) == 3
+    for chat_id in ('1', '2', '3'):
+        user = db.get_user(chat_id)
+        assert sqlite_db.get_message_counts(chat_id) == db.get_message_counts(chat_id)
+        assert recent(sqlite_db, chat_id, 3) == [tuple(m) for m in user.get('recent_messages', [])]
+    assert sqlite_db.get_message_counts('1') == {'welcome': 1, 'campaign': 5}
+    # User 1's campaigns are all in the recent three; only their welcome rotated out
+    for expression in ('campaign=never', 'campaign!=never', 'campaign<1d'):
+        assert sqlite_db.count_segment(expression) == db.count_segment(expression), expression
+    sqlite_db.close()
+
+
+def test_campaign_that_rotated_out_keeps_its_time(db_file, tmp_path):
+    db = Database(db_file, write_behind=False, message_log=None,
+                  background_load=False, history_limit=2)
+    db.add_user('1', 'Alice', None)
+    db.log_message_sent('1', 'campaign')
+    db.log_message_sent('1', 'welcome')
+    db.log_message_sent('1', 'welcome')
+    assert db.count_segment('campaign<1d') == 1
+    db.close()
+
+    sqlite_db = SQLiteDatabase(tmp_path / 'users.db')
+    sqlite_db.import_json(db_file)
+    assert sqlite_db.get_message_counts('1') == {'campaign': 1, 'welcome': 2}
+    assert sqlite_db.count_segment('campaign=never') == 0
+    assert sqlite_db.count_segment('campaign<1d') == 1
+    assert sqlite_db.count_segment('campaign<2020-01-01') == 0
+    sqlite_db.close()
+    # And the JSON store itself still has it after a restart
+    db = Database(db_file, write_behind=False, message_log=None, background_load=False, history_limit=2)
+    assert db.count_segment('campaign<1d') == 1
+    db.close()
+
+
+def test_campaign_rotated_out_before_its_time_was_kept(db_file, tmp_path):
+    # Saved before records had last_campaign: only the count is left
+    db_file.write_text(json.dumps({'users': {'1': {
+        'chat_id': '1', 'first_name': 'Alice', 'username': None,
+        'joined_at': '2026-01-01 10:00:00', 'referred_by': None, 'referrals': 0,
+        'last_active': '2026-01-02 10:00:00', 'status': 'active',
+        'message_counts': {'campaign': 1, 'welcome': 1},
+        'recent_messages': [['welcome', 1767348000]],
+    }}, 'total_users': 1, 'settings': {}}))
+
+    sqlite_db = SQLiteDatabase(tmp_path / 'users.db')
+    sqlite_db.import_json(db_file)
+    assert sqlite_db.count_segment('campaign<2020-01-01') == 1
+    sqlite_db.close()
+    db = Database(db_file, write_behind=False, message_log=None, background_load=False)
+    assert db.get_user('1')['last_campaign'] == 1
+    assert db.count_segment('campaign<2020-01-01') == 1
+    db.close()
+
+
+def test_legacy_messages_sent_lists_are_imported(db_file, tmp_path):
+    db_file.write_text(json.dumps({'users': {'1': {
+        'chat_id': '1', 'first_name': 'Alice', 'username': None,
+        'joined_at': '2026-01-01 10:00:00', 'referred_by': None, 'referrals': 0,
+        'last_active': '2026-01-02 10:00:00', 'status': 'active',
+        'messages_sent': [
+            {'type': 'welcome', 'timestamp': '2026-01-01 10:00:00'},
+            {'type': 'campaign', 'timestamp': '2026-01-02 09:00:00'},
+        ],
+    }}, 'total_users': 1, 'settings': {}}))
+
+    sqlite_db = SQLiteDatabase(tmp_path / 'users.db')
+    assert sqlite_db.import_json(db_file) == 1
+    assert sqlite_db.get_messages('1') == [
+        {'type': 'welcome', 'timestamp': '2026-01-01 10:00:00'},
+        {'type': 'campaign', 'timestamp': '2026-01-02 09:00:00'},
+    ]
+    assert sqlite_db.get_message_counts('1') == {'welcome': 1, 'campaign': 1}
+    sqlite_db.close()
@@ -0,0 +1,130 @@
+import asyncio
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+import remote_database
+from async_database import AsyncDatabase
+from database import Database
+from remote_database import STREAM_CHUNK, RemoteDatabase
+from sqlite_database import SQLiteDatabase
+from storage_server import METHODS, StorageServer
+
+
+class SlowDatabase(Database):
+    """A Database whose background load waits until the test releases it."""
+
+    release = None
+
+    def load(self):
+        self.release.wait()
+        super().load()
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def served(request, db_file, tmp_path):
+    """A Database (or SQLiteDatabase) behind a StorageServer on its own event loop thread, and a client."""
+    if request.param == 'sqlite':
+        db = SQLiteDatabase(tmp_path / 'users.db')
+    else:
+        db = Database(db_file, message_log=None, background_load=False,
+                      flush_interval=3600, flush_every=float('inf'))
+    with serving(db, tmp_path / 'storage.sock') as server:
+        client = RemoteDatabase(server.path)
+        yield db, client
+        client.close()
+    db.close()
+
+
+@contextmanager
+def serving(db, path):
+    """Run a StorageServer for `db` on an event loop thread."""
+    server = StorageServer(db, path)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+
+
+def test_every_method_the_client_calls_is_served():
+    source = Path(remote_database.__file__).read_text()
+    called = set(re.findall(r"_(?:call|stream)\('(\w+)'", source))
+    assert called and called <= METHODS
+
+
+def test_users_stream_in_chunks_while_the_store_takes_writes(served):
+    db, client = served
+    count = STREAM_CHUNK * 2 + 17
+    for i in range(count):
+        db.add_user(str(i), f'User{i}', None, referred_by='0' if i else None)
+
+    users = client.iter_users()
+    first = [next(users) for _ in range(10)]
+    # Between chunks nothing on the server is held, so other calls go through
+    assert client.register_user('late', 'Late', None)[1]
+    rest = list(users)
+    assert [chat_id for chat_id, _ in first + rest] == [str(i) for i in range(count)]
+    assert rest[-1][1]['referred_by'] == '0'
+    assert sum(1 for _ in client.iter_segment('referrals>=1')) == 1
+    assert client.get_downline('0')['total'] == count - 1
+
+
+def test_methods_outside_the_allow_list_are_refused(served):
+    db, client = served
+    with pytest.raises(AttributeError):
+        client._call('close')
+    with pytest.raises(AttributeError):
+        client._call('_commit', {'op': 'referral', 'chat_id': '1'})
+    # Public backend methods the client doesn't use aren't exposed either
+    with pytest.raises(AttributeError):
+        client._call('get_all_users')
+    assert client.user_count() == 0
+
+
+def test_clients_see_a_loaded_store(served):
+    db, client = served
+    assert client.wait_until_loaded(0) is True
+    store = AsyncDatabase(client)
+    try:
+        assert store.loaded
+    finally:
+        store.close()
+
+
+def test_calls_waiting_for_the_load_leave_the_server_free(db_file, tmp_path):
+    seed = Database(db_file, write_behind=False, message_log=None, background_load=False)
+    seed.add_user('1', 'One', None)
+    seed.add_user('2', 'Two', None, referred_by='1')
+    seed.close()
+
+    SlowDatabase.release = threading.Event()
+    db = SlowDatabase(db_file, write_behind=False, message_log=None, background_load=True)
+    try:
+        with serving(db, tmp_path / 'storage.sock') as server:
+            waiting, other = RemoteDatabase(server.path), RemoteDatabase(server.path)
+            counted = []
+            counting = threading.Thread(target=lambda: counted.append(waiting.user_count()))
+            counting.start()
+            time.sleep(0.05)
+            # user_count waits for the load; other connections still get answers
+            assert other.wait_until_loaded(0) is False
+            assert counted == []
+            SlowDatabase.release.set()
+            counting.join(5)
+            assert counted == [2]
+            assert [chat_id for chat_id, _ in other.iter_users()] == ['1', '2']
+            waiting.close()
+            other.close()
+    finally:
+        SlowDatabase.release.set()
+        db.close()
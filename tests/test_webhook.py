@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+from telegram import Bot, Update, User
+from telegram.ext import Application, ExtBot, TypeHandler
+
+from dispatcher import ChatOrderedUpdateProcessor, UpdateQueue
+from webhook import WebhookServer
+
+SECRET = 'test-secret'
+HEADERS = {'x-telegram-bot-api-secret-token': SECRET}
+
+
+def update_body(update_id, chat_id=5):
+    return json.dumps({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': '/start',
+    }}).encode()
+
+
+def dispatch(body, headers=HEADERS):
+    queue = asyncio.Queue()
+    server = WebhookServer(queue, Bot('123456:TEST'), path='/telegram', secret_token=SECRET)
+    status = asyncio.run(server._dispatch('POST', '/telegram', headers, body))
+    return status, queue.qsize()
+
+
+@pytest.mark.parametrize('body', [b'null', b'[]', b'1', b'"update"', b'{bad json', b'{"message": 1}'])
+def test_bodies_that_are_not_updates_get_400(body):
+    assert dispatch(body) == (400, 0)
+
+
+def test_update_is_queued():
+    body = update_body(1)
+    assert dispatch(body) == (200, 1)
+    assert dispatch(body, headers={})[0] == 403
+
+
+@pytest.mark.parametrize('workers', [1, 2, 8])
+def test_busy_workers_fill_the_queue_and_the_webhook_answers_503(monkeypatch, workers):
+    async def initialize(self):
+        self._bot_user = User(123456, 'Test', is_bot=True, username='test_bot')
+
+    monkeypatch.setattr(ExtBot, 'initialize', initialize)  # no getMe round trip
+    processor = ChatOrderedUpdateProcessor(workers)
+    application = (
+        Application.builder().token('123456:TEST').updater(None)
+        .update_queue(UpdateQueue(processor, maxsize=5))
+        .concurrent_updates(processor)
+        .build()
+    )
+    server = WebhookServer(application.update_queue, application.bot, path='/telegram',
+                           secret_token=SECRET, enqueue_timeout=0.05)
+    handled = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_handler(update, context):
+            await release.wait()
+            handled.append(update.update_id)
+
+        application.add_handler(TypeHandler(Update, slow_handler))
+        async with application:
+            await application.start()
+            statuses = [await server._dispatch('POST', '/telegram', HEADERS, update_body(i, chat_id=i))
+                        for i in range(1, workers + 9)]
+            release.set()
+            await application.update_queue.join()
+            await application.stop()
+        return statuses
+
+    statuses = asyncio.run(scenario())
+    # One update per worker runs and five wait in the queue; the rest are
+    # turned away until there is room again
+    assert statuses == [200] * (workers + 5) + [503] * 3
+    assert server.rejected == 3
+    assert sorted(handled) == list(range(1, workers + 6))
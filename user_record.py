@@ -0,0 +1,236 @@
+import sys
+from datetime import datetime, timedelta
+
+# Timestamps are stored as microseconds since a naive 1970-01-01, which
+# maps to and from the `str(datetime.now())` strings in the JSON file
+# exactly (no time zone or float rounding involved).
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Always present on a record, in the order they are written out
+FIELDS = (
+    'chat_id', 'first_name', 'username', 'joined_at',
+    'referred_by', 'referrals', 'last_active', 'status'
+)
+# Present only once set (older records predate message history);
+# `last_campaign` is the epoch of the latest 'campaign' message, kept
+# apart from the bounded recent history so it is never rotated out
+OPTIONAL_FIELDS = ('message_counts', 'recent_messages', 'last_campaign')
+
+_missing = object()
+
+
+def to_micros(timestamp):
+    """Stored timestamp string -> int; anything unparseable is kept as is."""
+    try:
+        return (datetime.fromisoformat(timestamp) - _EPOCH) // _MICROSECOND
+    except (TypeError, ValueError):
+        return timestamp
+
+
+def parse_micros(timestamp):
+    """Like to_micros, but raises ValueError for anything it would keep as is."""
+    value = to_micros(timestamp)
+    if type(value) is not int:
+        raise ValueError(f"Not a local ISO timestamp: {timestamp!r}")
+    return value
+
+
+def from_micros(value):
+    if isinstance(value, int):
+        return str(_EPOCH + value * _MICROSECOND)
+    return value
+
+
+def to_chat_id(chat_id):
+    """'123' -> 123; ids that don't round-trip through int stay strings."""
+    if isinstance(chat_id, str):
+        try:
+            number = int(chat_id)
+        except ValueError:
+            return chat_id
+        if str(number) == chat_id:
+            return number
+    return chat_id
+
+
+def from_chat_id(chat_id):
+    return chat_id if chat_id is None else str(chat_id)
+
+
+class UserRecord:
+    """A user, stored compactly but read and written like the old dict.
+
+    Chat ids are ints, timestamps are ints (see to_micros), the status is
+    interned and recent messages are tuples, which takes a fraction of the
+    memory of a dict of strings. `record['last_active']`, `.get()`, `in`,
+    `.items()` and friends all see the same keys and string values as the
+    dict did, so callers don't need to know. Keys outside the known fields
+    (e.g. a legacy `messages_sent`) are kept in a side dict.
+    """
+
+    __slots__ = (
+        'id', 'first_name', 'username', 'joined', 'referrer', 'referrals',
+        'active', 'status', 'message_counts', 'recent_messages', 'last_campaign', 'extra'
+    )
+
+    def __init__(self, chat_id, first_name=None, username=None, joined_at=None,
+                 referred_by=None, referrals=0, last_active=None, status='active'):
+        self.id = to_chat_id(chat_id)
+        self.first_name = first_name
+        self.username = username
+        self.joined = to_micros(joined_at)
+        self.referrer = to_chat_id(referred_by)
+        self.referrals = referrals
+        self.active = to_micros(last_active)
+        self.status = sys.intern(status) if isinstance(status, str) else status
+        self.message_counts = None
+        self.recent_messages = None
+        self.last_campaign = None
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, user):
+        record = cls(
+            user.get('chat_id'), user.get('first_name'), user.get('username'),
+            user.get('joined_at'), user.get('referred_by'), user.get('referrals', 0),
+            user.get('last_active'), user.get('status', 'active')
+        )
+        for key, value in user.items():
+            if key not in _KEYS:
+                record[key] = value
+        return record
+
+    def to_dict(self):
+        user = {
+            'chat_id': from_chat_id(self.id),
+            'first_name': self.first_name,
+            'username': self.username,
+            'joined_at': from_micros(self.joined),
+            'referred_by': from_chat_id(self.referrer),
+            'referrals': self.referrals,
+            'last_active': from_micros(self.active),
+            'status': self.status,
+        }
+        if self.message_counts is not None:
+            user['message_counts'] = self.message_counts
+        if self.recent_messages is not None:
+            user['recent_messages'] = self.recent_messages
+        if self.last_campaign is not None:
+            user['last_campaign'] = self.last_campaign
+        if self.extra:
+            user.update(self.extra)
+        return user
+
+    # --- dict interface ---------------------------------------------------
+
+    def __getitem__(self, key):
+        getter = _GETTERS.get(key)
+        if getter is not None:
+            return getter(self)
+        if key in OPTIONAL_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setter = _SETTERS.get(key)
+        if setter is not None:
+            setter(self, value)
+        elif key == 'message_counts':
+            self.message_counts = {sys.intern(k): n for k, n in value.items()}
+        elif key == 'recent_messages':
+            self.recent_messages = [(sys.intern(t), at) for t, at in value]
+        elif key == 'last_campaign':
+            self.last_campaign = value
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __iter__(self):
+        yield from FIELDS
+        for key in OPTIONAL_FIELDS:
+            if getattr(self, key) is not None:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, (UserRecord, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"UserRecord({self.to_dict()!r})"
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, _missing)
+        if value is _missing:
+            self[key] = default
+            value = self[key]
+        return value
+
+    def pop(self, key, default=_missing):
+        if key in OPTIONAL_FIELDS and getattr(self, key) is not None:
+            value = getattr(self, key)
+            setattr(self, key, None)
+            return value
+        if self.extra and key in self.extra:
+            return self.extra.pop(key)
+        if key in _GETTERS:
+            raise KeyError(f"{key} can't be removed from a user record")
+        if default is _missing:
+            raise KeyError(key)
+        return default
+
+
+def _set_status(record, value):
+    record.status = sys.intern(value) if isinstance(value, str) else value
+
+
+_GETTERS = {
+    'chat_id': lambda r: from_chat_id(r.id),
+    'first_name': lambda r: r.first_name,
+    'username': lambda r: r.username,
+    'joined_at': lambda r: from_micros(r.joined),
+    'referred_by': lambda r: from_chat_id(r.referrer),
+    'referrals': lambda r: r.referrals,
+    'last_active': lambda r: from_micros(r.active),
+    'status': lambda r: r.status,
+}
+_SETTERS = {
+    'chat_id': lambda r, v: setattr(r, 'id', to_chat_id(v)),
+    'first_name': lambda r, v: setattr(r, 'first_name', v),
+    'username': lambda r, v: setattr(r, 'username', v),
+    'joined_at': lambda r, v: setattr(r, 'joined', to_micros(v)),
+    'referred_by': lambda r, v: setattr(r, 'referrer', to_chat_id(v)),
+    'referrals': lambda r, v: setattr(r, 'referrals', v),
+    'last_active': lambda r, v: setattr(r, 'active', to_micros(v)),
+    'status': _set_status,
+}
+_KEYS = set(FIELDS)
@@ -0,0 +1,149 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+from telegram import Update
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_ENQUEUE_TIMEOUT, WEBHOOK_MAX_CONNECTIONS, ALLOWED_UPDATES
+)
+
+logger = logging.getLogger(__name__)
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+            405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class WebhookServer:
+    """Minimal asyncio HTTP/1.1 server that feeds Telegram updates into a queue.
+
+    Requests must hit `path` with the configured secret in the
+    X-Telegram-Bot-Api-Secret-Token header. The update queue is bounded:
+    when it is full a request waits up to `enqueue_timeout` seconds for
+    room and then gets a 503, which makes Telegram back off and redeliver.
+    """
+
+    def __init__(self, update_queue, bot, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT,
+                 path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                 enqueue_timeout=WEBHOOK_ENQUEUE_TIMEOUT):
+        self.update_queue = update_queue
+        self.bot = bot
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.enqueue_timeout = enqueue_timeout
+        self.received = 0
+        self.rejected = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        logger.info(f"🌐 Webhook listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    status, body = 413, None
+                else:
+                    body = await reader.readexactly(length)
+                    status = await self._dispatch(method, target, headers, body)
+
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    f"Content-Length: 0\r\n\r\n".encode('latin-1')
+                )
+                await writer.drain()
+                if status == 413 or headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, headers, body):
+        if target.split('?', 1)[0] != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+        if self.secret_token and not hmac.compare_digest(
+                headers.get('x-telegram-bot-api-secret-token', ''), self.secret_token):
+            self.rejected += 1
+            return 403
+        try:
+            payload = json.loads(body)
+            # An update is a JSON object; null, lists and scalars never are
+            if not isinstance(payload, dict):
+                return 400
+            update = Update.de_json(payload, self.bot)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return 400
+
+        try:
+            await asyncio.wait_for(self.update_queue.put(update), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Update queue full, asking Telegram to retry")
+            return 503
+        self.received += 1
+        return 200
+
+
+async def run_webhook(application):
+    """Run the application behind WebhookServer until SIGINT/SIGTERM."""
+    if not WEBHOOK_SECRET:
+        raise ValueError("❌ WEBHOOK_SECRET not set in .env file!")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    server = WebhookServer(application.update_queue, application.bot)
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=ALLOWED_UPDATES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+        await application.start()
+        await server.start()
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)